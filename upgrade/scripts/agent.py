@@ -0,0 +1,449 @@
+"""Resident upgrade agent with warm caches, serving jobs over a Unix socket.
+
+Every `upgrade`, `managevenv` and `find-compatible-version` run started by cron
+pays for interpreter startup, imports, logging setup and new HTTP connections.
+`upgrade agent` keeps one process running instead, so the shared HTTP session,
+the package index cache and the installed-distribution indexes stay warm
+between runs.
+
+While an agent is listening on its socket, the CLIs only parse their arguments
+and send them to the agent as a job, print the job's output and exit with its
+exit code. They run the job themselves if no agent is running, the agent cannot
+be reached, or UPGRADE_AGENT_DISABLED is set. `upgrade` jobs are only accepted
+from the interpreter the agent runs under, since `upgrade` upgrades the
+environment it runs in.
+
+Jobs run concurrently, but jobs on the same venv (or on an envs home and a
+venv inside it) are serialized. Jobs run with the environment variables of the
+agent, so the agent only accepts jobs from clients whose settings
+(`SLACK_WEBHOOK_URL`, `XDG_CACHE_HOME` and every `UPGRADE_*`, `PIP_*` and
+`UV_*` variable) are the same as its own. Other clients run their jobs
+themselves.
+
+Settings:
+- UPGRADE_AGENT_SOCKET: socket path (default
+  `~/.cache/upgrade-python-package/agent.sock`)
+- UPGRADE_AGENT_DISABLED: set to any value to never delegate to the agent
+"""
+
+import argparse
+import contextvars
+import importlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from upgrade.scripts.logging_config import (
+    configure_script_logging,
+    install_job_log_router,
+    job_logging,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_JOBS = 4
+SOCKET_NAME = "agent.sock"
+CONNECT_TIMEOUT_SECONDS = 1.0
+
+# environment variables that change what a job does
+JOB_ENVIRONMENT_PREFIXES = ("UPGRADE_", "PIP_", "UV_")
+JOB_ENVIRONMENT_NAMES = ("SLACK_WEBHOOK_URL", "XDG_CACHE_HOME")
+AGENT_ENVIRONMENT_PREFIX = "UPGRADE_AGENT_"
+
+_job_output = contextvars.ContextVar("upgrade_agent_job_output", default=None)
+
+
+def get_socket_path() -> Path:
+    socket_path = os.environ.get("UPGRADE_AGENT_SOCKET")
+    if socket_path:
+        return Path(socket_path)
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "upgrade-python-package" / SOCKET_NAME
+
+
+def is_agent_disabled() -> bool:
+    return bool(os.environ.get("UPGRADE_AGENT_DISABLED")) or not hasattr(socket, "AF_UNIX")
+
+
+def get_job_environment() -> Dict[str, str]:
+    """Return the environment variables of this process that jobs depend on."""
+    return {
+        name: value
+        for name, value in os.environ.items()
+        if name in JOB_ENVIRONMENT_NAMES
+        or (
+            name.startswith(JOB_ENVIRONMENT_PREFIXES)
+            and not name.startswith(AGENT_ENVIRONMENT_PREFIX)
+        )
+    }
+
+
+def _get_environment_differences(environment: Dict[str, str]) -> List[str]:
+    """Return the names of the variables whose values differ from this process."""
+    own_environment = get_job_environment()
+    return sorted(
+        name
+        for name in set(environment) | set(own_environment)
+        if environment.get(name) != own_environment.get(name)
+    )
+
+
+def _venv_paths_of_upgrade(args: dict) -> List[str]:
+    return [sys.prefix]
+
+
+def _venv_paths_of_check(args: dict) -> List[str]:
+    from upgrade.scripts.find_compatible_versions import read_batch_file
+
+    venv_paths = [args["venv_path"], args["envs_home"]]
+    if args["batch_file"]:
+        venv_paths.extend(entry["venv_path"] for entry in read_batch_file(args["batch_file"]))
+    return [venv_path for venv_path in venv_paths if venv_path]
+
+
+def _venv_paths_of_manage_venv(args: dict) -> List[str]:
+    from upgrade.scripts.manage_venv import _get_venv_path, read_requirements_batch_file
+    from upgrade.scripts.requirements import parse_requirements_txt
+
+    envs_home = args["envs_home"]
+    if args["all_venvs"]:
+        return [envs_home]
+    if args["batch_file"]:
+        requirements_list = read_requirements_batch_file(args["batch_file"])
+    else:
+        requirements_list = [
+            args["requirements"] or parse_requirements_txt(args["requirements_file"])
+        ]
+    return [str(_get_venv_path(envs_home, requirements)) for requirements in requirements_list]
+
+
+@dataclass(frozen=True)
+class Job:
+    """A CLI that can run in the agent.
+
+    `module` provides `run_parsed_args(parsed_args)`, `path_args` are the
+    arguments made absolute by the client and `get_venv_paths` returns the venvs
+    a job works on.
+    """
+
+    module: str
+    path_args: Tuple[str, ...]
+    get_venv_paths: Callable[[dict], List[str]]
+
+
+JOBS = {
+    "upgrade": Job(
+        "upgrade.scripts.upgrade_python_package",
+        ("wheels_path", "log_location", "constraints_path"),
+        _venv_paths_of_upgrade,
+    ),
+    "check": Job(
+        "upgrade.scripts.find_compatible_versions",
+        ("requirements_file", "venv_path", "envs_home", "batch_file", "log_location"),
+        _venv_paths_of_check,
+    ),
+    "manage_venv": Job(
+        "upgrade.scripts.manage_venv",
+        (
+            "requirements_file",
+            "envs_home",
+            "log_location",
+            "wheels_path",
+            "local_installation_path",
+            "batch_file",
+        ),
+        _venv_paths_of_manage_venv,
+    ),
+}
+
+
+def _send(sock: socket.socket, message: dict) -> None:
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def _receive(sock_file) -> Optional[dict]:
+    line = sock_file.readline()
+    return json.loads(line) if line else None
+
+
+def run_in_agent(job_name: str, parsed_args: argparse.Namespace) -> Optional[int]:
+    """Run a CLI job in the agent and return its exit code after printing its output.
+
+    Returns None if the job should run in this process instead.
+    """
+    socket_path = get_socket_path()
+    if is_agent_disabled() or not socket_path.exists():
+        return None
+    args = vars(parsed_args).copy()
+    for name in JOBS[job_name].path_args:
+        if args.get(name):
+            args[name] = os.path.abspath(args[name])
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT_SECONDS)
+            sock.connect(str(socket_path))
+            sock.settimeout(None)
+            _send(
+                sock,
+                {
+                    "job": job_name,
+                    "args": args,
+                    "executable": sys.executable,
+                    "environment": get_job_environment(),
+                },
+            )
+            with sock.makefile("rb") as sock_file:
+                response = _receive(sock_file)
+    except (OSError, ValueError) as e:
+        logger.debug("Upgrade agent at %s is not available: %s", socket_path, e)
+        return None
+    if response is None or response.get("status") != "done":
+        logger.debug("Upgrade agent did not run the job: %s", response)
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["exitCode"]
+
+
+class VenvLocks:
+    """Serializes jobs on the same venvs; a directory also conflicts with every
+    path below it, so a job on an envs home waits for jobs on its venvs."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._held: List[Tuple[Path, ...]] = []
+
+    def _conflicts(self, paths: Tuple[Path, ...]) -> bool:
+        return any(
+            path == held_path or held_path in path.parents or path in held_path.parents
+            for held_paths in self._held
+            for held_path in held_paths
+            for path in paths
+        )
+
+    @contextmanager
+    def hold(self, venv_paths: Iterable[str]) -> Iterator[None]:
+        paths = tuple(Path(os.path.abspath(venv_path)) for venv_path in venv_paths)
+        with self._condition:
+            while self._conflicts(paths):
+                self._condition.wait()
+            self._held.append(paths)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._held.remove(paths)
+                self._condition.notify_all()
+
+
+class _JobOutput:
+    """Replaces sys.stdout/sys.stderr in the agent, so output printed while
+    running a job is captured for that job only."""
+
+    def __init__(self, stream, name: str):
+        self._stream = stream
+        self._name = name
+
+    def _target(self):
+        buffers = _job_output.get()
+        return buffers[self._name] if buffers is not None else self._stream
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run_job(job_name: str, args: dict) -> Tuple[int, str, str]:
+    """Run a job in this process and return its exit code, stdout and stderr."""
+    module = importlib.import_module(JOBS[job_name].module)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    token = _job_output.set({"stdout": stdout, "stderr": stderr})
+    exit_code = 0
+    try:
+        with job_logging():
+            module.run_parsed_args(argparse.Namespace(**args))
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc(file=stderr)
+        exit_code = 1
+    finally:
+        _job_output.reset(token)
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    server: "AgentServer"
+
+    def handle(self):
+        try:
+            request = _receive(self.rfile)
+        except ValueError as e:
+            logger.warning("Ignoring invalid upgrade agent request: %s", e)
+            return
+        if request is None:
+            return
+        self.wfile.write(json.dumps(self.server.handle_request(request)).encode("utf-8") + b"\n")
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Runs the jobs sent by the CLIs, each in its own thread."""
+
+    # closing the server waits for running jobs
+    daemon_threads = False
+
+    def __init__(self, socket_path: str, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.venv_locks = VenvLocks()
+        self.job_slots = threading.BoundedSemaphore(max(1, max_jobs))
+        self.upgrade_python_package_version = _get_own_version()
+        super().__init__(socket_path, _JobHandler)
+
+    def handle_request(self, request: dict) -> dict:
+        job_name = request.get("job")
+        if job_name not in JOBS:
+            return {"status": "rejected", "reason": f"unknown job {job_name}"}
+        if job_name == "upgrade" and request.get("executable") != sys.executable:
+            return {"status": "rejected", "reason": "upgrade jobs must use the agent's python"}
+        environment = request.get("environment")
+        if not isinstance(environment, dict):
+            return {"status": "rejected", "reason": "no environment sent with the job"}
+        differences = _get_environment_differences(environment)
+        if differences:
+            # values are not echoed back, they may hold credentials
+            return {
+                "status": "rejected",
+                "reason": f"environment differs from the agent's: {', '.join(differences)}",
+            }
+        args = request.get("args") or {}
+        try:
+            venv_paths = JOBS[job_name].get_venv_paths(args)
+        except Exception as e:
+            # let the CLI run the job itself and report the error
+            return {"status": "rejected", "reason": str(e)}
+        # jobs waiting for their venvs do not take up a job slot
+        with self.venv_locks.hold(venv_paths), self.job_slots:
+            logger.info("Running %s job on %s", job_name, ", ".join(venv_paths))
+            exit_code, stdout, stderr = run_job(job_name, args)
+            logger.info("Finished %s job exit_code=%s", job_name, exit_code)
+        if job_name == "upgrade" and _get_own_version() != self.upgrade_python_package_version:
+            logger.warning("upgrade-python-package was upgraded, stopping the agent")
+            threading.Thread(target=self.shutdown).start()
+        return {"status": "done", "exitCode": exit_code, "stdout": stdout, "stderr": stderr}
+
+
+def _get_own_version() -> Optional[str]:
+    from upgrade.scripts.utils import is_package_already_installed
+
+    try:
+        return is_package_already_installed("upgrade-python-package")
+    except Exception:
+        return None
+
+
+def _warm_up() -> None:
+    """Import the job modules and create the shared HTTP session and index cache."""
+    from upgrade.scripts.http_client import get_session
+    from upgrade.scripts.index_cache import get_index_cache
+
+    for job in JOBS.values():
+        importlib.import_module(job.module)
+    get_session()
+    get_index_cache()
+
+
+def _is_listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT_SECONDS)
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def create_agent_server(
+    socket_path: Optional[str] = None, max_jobs: int = DEFAULT_MAX_JOBS
+) -> AgentServer:
+    """Bind the agent to its socket, which only the current user can connect to."""
+    socket_path = Path(socket_path) if socket_path else get_socket_path()
+    socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if socket_path.exists():
+        if _is_listening(socket_path):
+            raise RuntimeError(f"An upgrade agent is already listening on {socket_path}")
+        socket_path.unlink()
+    old_umask = os.umask(0o177)
+    try:
+        return AgentServer(str(socket_path), max_jobs)
+    finally:
+        os.umask(old_umask)
+
+
+def serve(server: AgentServer) -> None:
+    """Serve jobs until SIGTERM/SIGINT, then wait for running jobs and remove the socket."""
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(server.server_address)
+        except OSError:
+            pass
+
+
+parser = argparse.ArgumentParser(prog="upgrade agent")
+parser.add_argument("--socket", help="Socket path (default: UPGRADE_AGENT_SOCKET)")
+parser.add_argument(
+    "--max-jobs",
+    type=int,
+    default=DEFAULT_MAX_JOBS,
+    help="Maximum number of jobs run at the same time",
+)
+parser.add_argument("--log-location", help="Specifies where to store the log file")
+parser.add_argument(
+    "--test", action="store_true", help="Log to stderr instead of the log file"
+)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import multiprocessing
+
+    parsed_args = parser.parse_args(argv)
+    configure_script_logging(
+        log_location=parsed_args.log_location,
+        default_log_location="/var/log/upgrade_agent.log",
+        test=parsed_args.test,
+    )
+    # job handlers decide what they log; the root logger lets everything through
+    logging.getLogger().setLevel(logging.DEBUG)
+    install_job_log_router()
+    sys.stdout = _JobOutput(sys.stdout, "stdout")
+    sys.stderr = _JobOutput(sys.stderr, "stderr")
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        # `managevenv` worker pools must not be forked from a threaded process
+        multiprocessing.set_start_method("forkserver", force=True)
+    _warm_up()
+    server = create_agent_server(parsed_args.socket, parsed_args.max_jobs)
+    logger.info("Upgrade agent listening on %s", server.server_address)
+    serve(server)
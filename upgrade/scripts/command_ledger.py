@@ -0,0 +1,220 @@
+"""Ledger of the subprocesses started by a run, with Chrome trace-event export.
+
+A script run collects every command started through `utils.run` with
+`record_commands()`, similar to how `spans` collects phase timings:
+
+    with record_commands("manage_venv") as commands:
+        ...
+    log_run_summary(..., extra_fields=commands.summary_fields())
+
+Each command is recorded with its executable, argument count, start time,
+duration, exit code and output size; arguments themselves are not recorded, as
+they may contain index credentials.
+
+If UPGRADE_TRACE_FILE is set, the ledger is written to that file in the Chrome
+trace-event format when the run ends, and can be opened as a timeline in
+`chrome://tracing` or https://ui.perfetto.dev. Commands started by a run get
+their own UPGRADE_TRACE_FILE in a temporary directory, so nested runs of the
+upgrade scripts (and `managevenv` worker processes, see `child_trace_file`)
+write their ledgers there and the parent merges them into its own trace.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE_ENV = "UPGRADE_TRACE_FILE"
+
+_ledger = ContextVar("upgrade_command_ledger", default=None)
+
+
+def get_trace_file() -> Optional[str]:
+    return os.environ.get(TRACE_FILE_ENV) or None
+
+
+@dataclass
+class CommandRecord:
+    executable: str
+    arg_count: int
+    name: str
+    start: float
+    duration_seconds: float
+    exit_code: Optional[int]
+    output_bytes: int
+    thread_id: int
+
+
+def describe_command(command: List[str]) -> str:
+    """Return a short name of `command` that contains no option values.
+
+    The executable's basename, followed by the module of `-m` and the first
+    positional argument if it is a plain word, e.g. `python3 -m pip install`.
+    """
+    words = [os.path.basename(command[0])]
+    args = list(command[1:])
+    if len(args) >= 2 and args[0] == "-m":
+        words.extend(args[:2])
+        args = args[2:]
+    if args and args[0].isalpha() and args[0].islower():
+        words.append(args[0])
+    return " ".join(words)
+
+
+class CommandLedger:
+    """Commands started by one run, in order of completion."""
+
+    def __init__(self, name: str, trace_file: Optional[str] = None):
+        self.name = name
+        self.trace_file = trace_file
+        self.commands: List[CommandRecord] = []
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.thread_id = threading.get_ident()
+        self._child_events: List[dict] = []
+        self._children_dir: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def add(self, record: CommandRecord) -> None:
+        with self._lock:
+            self.commands.append(record)
+
+    @property
+    def duration_seconds(self) -> float:
+        return sum(record.duration_seconds for record in self.commands)
+
+    def summary_fields(self) -> Dict[str, object]:
+        """Return the `subprocesses` and `subprocess_s` fields of the run summary."""
+        return {
+            "subprocesses": len(self.commands),
+            "subprocess_s": round(self.duration_seconds, 2),
+        }
+
+    def child_trace_file(self) -> Optional[str]:
+        """Return a new trace file for a child process to write its own ledger to,
+        or None if this run is not traced. Merge it with `merge_child_trace`."""
+        if self.trace_file is None:
+            return None
+        with self._lock:
+            if self._children_dir is None:
+                self._children_dir = tempfile.mkdtemp(prefix="upgrade-trace-")
+            fd, path = tempfile.mkstemp(dir=self._children_dir, suffix=".json")
+        os.close(fd)
+        os.unlink(path)
+        return path
+
+    def merge_child_trace(self, path: Optional[str]) -> None:
+        """Add the events of a child's trace file, if the child wrote one."""
+        if path is None:
+            return
+        try:
+            events = json.loads(Path(path).read_text())["traceEvents"]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("Ignoring invalid child trace %s: %s", path, e)
+            return
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._child_events.extend(events)
+
+    def to_trace_events(self) -> List[dict]:
+        """Return the run, its commands and the merged child runs as Chrome
+        trace events (complete events, timestamps in microseconds)."""
+        pid = os.getpid()
+        end = self.end if self.end is not None else time.time()
+        events = [
+            {"ph": "M", "name": "process_name", "pid": pid, "args": {"name": self.name}},
+            {
+                "ph": "X",
+                "cat": "run",
+                "name": self.name,
+                "pid": pid,
+                "tid": self.thread_id,
+                "ts": round(self.start * 1e6),
+                "dur": round((end - self.start) * 1e6),
+            },
+        ]
+        for record in self.commands:
+            events.append(
+                {
+                    "ph": "X",
+                    "cat": "subprocess",
+                    "name": record.name,
+                    "pid": pid,
+                    "tid": record.thread_id,
+                    "ts": round(record.start * 1e6),
+                    "dur": round(record.duration_seconds * 1e6),
+                    "args": {
+                        "executable": record.executable,
+                        "argCount": record.arg_count,
+                        "exitCode": record.exit_code,
+                        "outputBytes": record.output_bytes,
+                    },
+                }
+            )
+        return events + self._child_events
+
+    def write_trace(self, path: str) -> None:
+        """Write the trace atomically, so a parent never merges a partial file."""
+        trace_path = Path(path)
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=str(trace_path.parent), prefix=f".{trace_path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump(
+                    {"traceEvents": self.to_trace_events(), "displayTimeUnit": "ms"},
+                    tmp_file,
+                )
+            os.replace(tmp_path, str(trace_path))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def close(self) -> None:
+        self.end = time.time()
+        try:
+            if self.trace_file is not None:
+                self.write_trace(self.trace_file)
+        except Exception as e:
+            logger.warning("Failed to write trace to %s: %s", self.trace_file, e)
+        finally:
+            if self._children_dir is not None:
+                shutil.rmtree(self._children_dir, ignore_errors=True)
+
+
+def get_command_ledger() -> Optional[CommandLedger]:
+    """Return the ledger of the current run, if any."""
+    return _ledger.get()
+
+
+@contextmanager
+def record_commands(name: str, trace_file: Optional[str] = None) -> Iterator[CommandLedger]:
+    """Record the commands of the enclosed code in a new `CommandLedger`.
+
+    The trace is written to `trace_file`, or to UPGRADE_TRACE_FILE if not given,
+    when the block exits. Failures to write it are logged and never raised.
+    """
+    ledger = CommandLedger(name, trace_file or get_trace_file())
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+        ledger.close()
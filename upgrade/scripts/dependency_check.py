@@ -0,0 +1,184 @@
+"""In-process replacement of `pip check`.
+
+`check_dependencies` reads `Requires-Dist` of every distribution installed in
+the environment of a python executable straight from its site-packages, the
+same way `distributions` reads versions, instead of starting pip. Markers are
+evaluated for the target interpreter, whose version is taken from the
+`pyvenv.cfg` of the venv, and requirements are checked like pip does: a
+requirement whose marker does not apply is ignored, pre-releases satisfy any
+specifier, and only the first distribution found for a name counts.
+
+Conflicts are reported in the format of `pip check`:
+
+    oll-dependency1 2.0.1 requires oll-dependency2, which is not installed.
+    oll-dependency1 2.0.1 has requirement oll-dependency2>=2.0, but you have oll-dependency2 1.0.
+
+`pip check` is still used if UPGRADE_USE_PIP_CHECK is set, or if the target
+environment cannot be inspected in-process (unknown site-packages or python
+version, or unreadable metadata).
+"""
+
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from upgrade.scripts.distributions import (
+    _executable_key,
+    _read_pyvenv_cfg,
+    get_site_packages_dirs,
+)
+from upgrade.scripts.exceptions import BrokenRequirementsFound
+from upgrade.scripts.utils import pip
+
+logger = logging.getLogger(__name__)
+
+NO_BROKEN_REQUIREMENTS = "No broken requirements found."
+_RELEASE_LEVELS = {"alpha": "a", "beta": "b", "candidate": "rc"}
+
+
+def is_pip_check_enabled() -> bool:
+    return bool(os.environ.get("UPGRADE_USE_PIP_CHECK"))
+
+
+@dataclass
+class DependencyConflict:
+    """A requirement of an installed distribution that is missing or not satisfied."""
+
+    project: str
+    version: str
+    requirement: str
+    dependency: str
+    installed_version: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.installed_version is None:
+            return (
+                f"{self.project} {self.version} requires {self.dependency}, "
+                "which is not installed."
+            )
+        return (
+            f"{self.project} {self.version} has requirement {self.requirement}, "
+            f"but you have {self.dependency} {self.installed_version}."
+        )
+
+
+def _format_full_version(version_info: str) -> Optional[str]:
+    """Convert `3.11.7` or `3.13.0.candidate.1` to the format of `python_full_version`."""
+    parts = version_info.split(".")
+    if len(parts) < 3 or not all(part.isdigit() for part in parts[:3]):
+        return None
+    version = ".".join(parts[:3])
+    if len(parts) == 5 and parts[3] in _RELEASE_LEVELS:
+        version += _RELEASE_LEVELS[parts[3]] + parts[4]
+    return version
+
+
+def get_marker_environment(py_executable: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """Return the environment markers are evaluated in for `py_executable`.
+
+    Platform markers are those of the running interpreter, as venvs run on the
+    same machine; the python version of a venv comes from its `pyvenv.cfg`.
+    Returns None if it cannot be determined without running the interpreter.
+    """
+    import platform
+
+    from packaging.markers import default_environment
+
+    environment = default_environment()
+    executable_key = _executable_key(py_executable)
+    if executable_key == _executable_key(sys.executable):
+        return environment
+    pyvenv_cfg_path = Path(executable_key).parent.parent / "pyvenv.cfg"
+    try:
+        config = _read_pyvenv_cfg(pyvenv_cfg_path)
+    except OSError:
+        return None
+    implementation = config.get("implementation")
+    if implementation and implementation != platform.python_implementation():
+        return None
+    full_version = _format_full_version(config.get("version_info") or config.get("version", ""))
+    if full_version is None:
+        return None
+    environment["python_full_version"] = full_version
+    environment["python_version"] = ".".join(full_version.split(".")[:2])
+    if environment["implementation_name"] == "cpython":
+        environment["implementation_version"] = full_version
+    return environment
+
+
+def find_dependency_conflicts(
+    py_executable: Optional[str] = None,
+) -> Optional[List[DependencyConflict]]:
+    """Return the broken requirements of the distributions installed in the
+    environment of `py_executable`, sorted by project.
+
+    Returns None if the environment cannot be checked in-process.
+    """
+    from importlib import metadata
+
+    from packaging.requirements import Requirement
+    from packaging.utils import canonicalize_name
+
+    site_packages_dirs = get_site_packages_dirs(py_executable)
+    environment = get_marker_environment(py_executable)
+    if site_packages_dirs is None or environment is None:
+        return None
+
+    installed = {}
+    for distribution in metadata.distributions(path=[str(path) for path in site_packages_dirs]):
+        name = distribution.metadata.get("Name")
+        if name and distribution.version is not None:
+            installed.setdefault(canonicalize_name(name), distribution)
+
+    conflicts = []
+    for project, distribution in sorted(installed.items()):
+        try:
+            requirements = [Requirement(line) for line in distribution.requires or []]
+        except Exception as e:
+            logger.warning("Error parsing dependencies of %s: %s", project, e)
+            return None
+        for requirement in requirements:
+            if requirement.marker is not None and not requirement.marker.evaluate(
+                {**environment, "extra": ""}
+            ):
+                continue
+            dependency = canonicalize_name(requirement.name)
+            installed_dependency = installed.get(dependency)
+            if installed_dependency is None:
+                conflicts.append(
+                    DependencyConflict(project, distribution.version, str(requirement), dependency)
+                )
+            elif not requirement.specifier.contains(
+                installed_dependency.version, prereleases=True
+            ):
+                conflicts.append(
+                    DependencyConflict(
+                        project,
+                        distribution.version,
+                        str(requirement),
+                        dependency,
+                        installed_dependency.version,
+                    )
+                )
+    return conflicts
+
+
+def check_dependencies(py_executable: Optional[str] = None) -> str:
+    """Check that the requirements of all installed distributions are satisfied,
+    like `pip check`, and return its output.
+
+    Raises `BrokenRequirementsFound` listing the conflicts otherwise. Failures
+    of `pip check` raise `subprocess.CalledProcessError`, as with `pip()`.
+    """
+    conflicts = None if is_pip_check_enabled() else find_dependency_conflicts(py_executable)
+    if conflicts is None:
+        logger.debug("Checking dependencies with pip check")
+        return pip("check", py_executable=py_executable)
+    if conflicts:
+        output = "\n".join(str(conflict) for conflict in conflicts)
+        logger.warning("Broken requirements found:\n%s", output)
+        raise BrokenRequirementsFound(output, conflicts)
+    return NO_BROKEN_REQUIREMENTS
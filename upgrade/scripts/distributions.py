@@ -0,0 +1,245 @@
+"""In-process index of the distributions installed in a python environment.
+
+Reading `*.dist-info` metadata straight from site-packages is a lot cheaper than
+starting a `pip list --format json` interpreter for every version lookup.
+Indexes are cached per python executable for the duration of the run and are
+dropped whenever `installer()`/`pip()` mutate the environment.
+"""
+
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_installed_distributions_cache = {}
+
+
+def _executable_key(py_executable: Optional[str]) -> str:
+    # venv executables are symlinks to the base interpreter, so the path is not resolved
+    return os.path.abspath(str(py_executable or sys.executable))
+
+
+def _read_pyvenv_cfg(pyvenv_cfg_path: Path) -> Dict[str, str]:
+    config = {}
+    for line in pyvenv_cfg_path.read_text().splitlines():
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        config[key.strip().lower()] = value.strip()
+    return config
+
+
+def get_site_packages_dirs(py_executable: Optional[str] = None) -> Optional[List[Path]]:
+    """Return the site-packages directories of the environment of `py_executable`.
+
+    Virtualenvs are resolved from their directory layout without starting the
+    interpreter. For the running interpreter `sys.path` is used. None is returned
+    when the directories cannot be determined reliably (e.g. a foreign system
+    interpreter or a venv with system site-packages), in which case callers are
+    expected to fall back to pip.
+    """
+    executable_path = Path(_executable_key(py_executable))
+    venv_root = executable_path.parent.parent
+    pyvenv_cfg_path = venv_root / "pyvenv.cfg"
+    if pyvenv_cfg_path.is_file():
+        try:
+            config = _read_pyvenv_cfg(pyvenv_cfg_path)
+        except OSError as e:
+            logger.debug("Failed to read %s: %s", pyvenv_cfg_path, e)
+            return None
+        if config.get("include-system-site-packages", "false").lower() == "true":
+            return None
+        candidates = list(venv_root.glob("lib/python*/site-packages")) + [
+            venv_root / "Lib" / "site-packages"
+        ]
+    elif str(executable_path) == _executable_key(sys.executable) and sys.prefix == getattr(
+        sys, "base_prefix", sys.prefix
+    ):
+        candidates = [Path(entry) for entry in sys.path if entry]
+    else:
+        return None
+
+    site_packages_dirs = []
+    seen = set()
+    for candidate in candidates:
+        if not candidate.is_dir():
+            continue
+        resolved = candidate.resolve()
+        if resolved in seen:
+            continue
+        seen.add(resolved)
+        site_packages_dirs.append(candidate)
+    return site_packages_dirs or None
+
+
+def _stat_dirs(dirs: List[Path]) -> Tuple[int, ...]:
+    return tuple(path.stat().st_mtime_ns for path in dirs)
+
+
+class InstalledDistributions:
+    """Name/version index of the distributions found in a list of site-packages dirs.
+
+    Like `pip list`, only the first distribution found for a given name is used.
+    """
+
+    def __init__(self, site_packages_dirs: List[Path]):
+        from importlib import metadata
+
+        from packaging.utils import canonicalize_name
+
+        self.site_packages_dirs = site_packages_dirs
+        self.dirs_mtimes = _stat_dirs(site_packages_dirs)
+        self._versions = {}
+        for distribution in metadata.distributions(
+            path=[str(path) for path in site_packages_dirs]
+        ):
+            name = distribution.metadata.get("Name")
+            if not name or distribution.version is None:
+                continue
+            self._versions.setdefault(
+                canonicalize_name(name), (name, distribution.version)
+            )
+
+    def is_stale(self) -> bool:
+        """Installing or removing a distribution adds or removes its dist-info
+        directory, which changes the mtime of the site-packages directory."""
+        try:
+            return _stat_dirs(self.site_packages_dirs) != self.dirs_mtimes
+        except OSError:
+            return True
+
+    def get_version(self, package_name: str) -> Optional[str]:
+        from packaging.utils import canonicalize_name
+
+        found = self._versions.get(canonicalize_name(package_name))
+        return found[1] if found is not None else None
+
+    def as_dict(self) -> Dict[str, str]:
+        """Return a `{name: version}` mapping, same as parsed `pip list` output."""
+        return {name: version for name, version in self._versions.values()}
+
+
+def get_installed_distributions(
+    py_executable: Optional[str] = None,
+) -> Optional[InstalledDistributions]:
+    """Return the cached installed-distribution index for `py_executable`.
+
+    Returns None if the site-packages directories of the environment cannot be
+    determined without running pip.
+    """
+    key = _executable_key(py_executable)
+    installed = _installed_distributions_cache.get(key)
+    if installed is not None and not installed.is_stale():
+        return installed
+
+    site_packages_dirs = get_site_packages_dirs(key)
+    if site_packages_dirs is None:
+        return None
+    installed = InstalledDistributions(site_packages_dirs)
+    _installed_distributions_cache[key] = installed
+    logger.debug(
+        "Indexed installed distributions executable=%s count=%s",
+        key,
+        len(installed.as_dict()),
+    )
+    return installed
+
+
+def invalidate_installed_distributions(py_executable: Optional[str] = None) -> None:
+    """Drop the cached index of `py_executable`, or of all environments if None."""
+    if py_executable is None:
+        _installed_distributions_cache.clear()
+    else:
+        _installed_distributions_cache.pop(_executable_key(py_executable), None)
+
+
+def _parse_metadata_dir_name(dir_name: str) -> Optional[Tuple[str, str]]:
+    """Split `name-version.dist-info` (or `name-version-pyX.Y.egg-info`)."""
+    from packaging.utils import canonicalize_name
+
+    stem, _, suffix = dir_name.rpartition(".")
+    if suffix == "dist-info":
+        name, _, version = stem.rpartition("-")
+    elif suffix == "egg-info":
+        name, _, version = stem.partition("-")
+        version = version.split("-", 1)[0]
+    else:
+        return None
+    if not name or not version:
+        return None
+    return canonicalize_name(name), version
+
+
+def snapshot_site_packages(
+    py_executable: Optional[str] = None,
+) -> Optional[Dict[str, Tuple[str, Tuple[int, int, int]]]]:
+    """Fingerprint the distributions installed in the environment of `py_executable`.
+
+    Only directory entries and `RECORD` stats are read, so comparing a snapshot
+    taken before and after an install is a cheap directory scan. Returns a
+    `{canonical name: (version, (mtime_ns, inode, size))}` mapping, or None when
+    the site-packages directories cannot be located.
+    """
+    site_packages_dirs = get_site_packages_dirs(py_executable)
+    if site_packages_dirs is None:
+        return None
+
+    snapshot = {}
+    for site_packages_dir in site_packages_dirs:
+        with os.scandir(site_packages_dir) as entries:
+            for entry in entries:
+                parsed = _parse_metadata_dir_name(entry.name)
+                if parsed is None or parsed[0] in snapshot:
+                    continue
+                record_path = os.path.join(entry.path, "RECORD")
+                try:
+                    stat_result = os.stat(record_path)
+                except OSError:
+                    stat_result = entry.stat()
+                name, version = parsed
+                snapshot[name] = (
+                    version,
+                    (stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_size),
+                )
+    return snapshot
+
+
+def diff_snapshots(
+    before_snapshot: Dict[str, Tuple[str, Optional[tuple]]],
+    after_snapshot: Dict[str, Tuple[str, Optional[tuple]]],
+) -> List[Dict[str, Optional[str]]]:
+    """Return the distributions that were added, removed or changed between snapshots.
+
+    A distribution reinstalled at the same version is reported as changed when
+    both snapshots carry a fingerprint and the fingerprints differ.
+    """
+    updated_packages = []
+    for package_name in sorted(set(before_snapshot) | set(after_snapshot)):
+        before_version, before_fingerprint = before_snapshot.get(package_name, (None, None))
+        after_version, after_fingerprint = after_snapshot.get(package_name, (None, None))
+        if before_version is None:
+            change = "added"
+        elif after_version is None:
+            change = "removed"
+        elif before_version != after_version:
+            change = "changed"
+        elif (
+            before_fingerprint is not None
+            and after_fingerprint is not None
+            and before_fingerprint != after_fingerprint
+        ):
+            change = "changed"
+        else:
+            continue
+        updated_packages.append(
+            {
+                "package": package_name,
+                "from": before_version,
+                "to": after_version,
+                "change": change,
+            }
+        )
+    return updated_packages
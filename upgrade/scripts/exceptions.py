@@ -10,4 +10,10 @@ class SlackError(Exception):
     pass
 
 class UpgradeError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class BrokenRequirementsFound(Exception):
+    def __init__(self, message, conflicts=None):
+        super().__init__(message)
+        self.conflicts = conflicts or []
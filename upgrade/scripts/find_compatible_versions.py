@@ -1,25 +1,37 @@
 import argparse
 import json
 import logging
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Any, List, Optional
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Optional
 from urllib.parse import urljoin
 
-import lxml.etree as et
-import requests as requests
-from packaging.utils import parse_wheel_filename
-from packaging.version import Version
-
-from upgrade.scripts.logging_config import configure_script_logging, log_run_summary
+from upgrade.scripts.agent import run_in_agent
+from upgrade.scripts.command_ledger import record_commands
+from upgrade.scripts.index_cache import IndexPage, get_index_cache_stats, get_index_page
+from upgrade.scripts.logging_config import (
+    bind_job_logging,
+    configure_script_logging,
+    log_run_summary,
+)
 from upgrade.scripts.requirements import (
     filter_versions,
     parse_requirements_txt,
     to_requirements_obj,
 )
-from upgrade.scripts.utils import get_venv_executable, is_package_already_installed
+from upgrade.scripts.spans import record_spans, span
+from upgrade.scripts.utils import (
+    get_venv_executable,
+    is_package_already_installed,
+    list_managed_venvs,
+)
 from upgrade.scripts.validations import is_cloudsmith_url_valid
 
+if TYPE_CHECKING:
+    from packaging.version import Version
+
 
 class CompatibleUpgradeStatus(Enum):
     AVAILABLE = "AVAILABLE"
@@ -27,39 +39,156 @@ class CompatibleUpgradeStatus(Enum):
     ERROR = "ERROR"
 
 
-def _get_package_index_html(cloudsmith_url: str, package_name: str) -> str:
+DEFAULT_BATCH_MAX_WORKERS = 8
+SIMPLE_JSON_CONTENT_TYPE = "application/vnd.pypi.simple.v1+json"
+# PEP 691 content negotiation: prefer JSON, fall back to the HTML simple API
+SIMPLE_ACCEPT = ", ".join(
+    [
+        SIMPLE_JSON_CONTENT_TYPE,
+        "application/vnd.pypi.simple.v1+html;q=0.2",
+        "text/html;q=0.01",
+    ]
+)
+
+
+def _get_package_index_page(cloudsmith_url: str, package_name: str) -> IndexPage:
     package_index_url = urljoin(cloudsmith_url, package_name)
     package_full_index_url = (
         package_index_url
         if package_index_url.endswith("/")
         else package_index_url + "/"
     )
-    return requests.get(package_full_index_url).text
+    return get_index_page(package_full_index_url, accept=SIMPLE_ACCEPT)
+
+
+def _parse_json_index_versions(package_index_json: str) -> List["Version"]:
+    """Extract versions from the wheel files of a PEP 691 JSON project page.
+
+    Like the HTML index, only wheels count: yanked files and files that are
+    not wheels with a parsable name are skipped. The PEP 700 `versions` key is
+    not used as it also lists yanked and sdist-only releases.
+    """
+    from packaging.utils import parse_wheel_filename
+
+    versions = []
+    for file in json.loads(package_index_json).get("files", []):
+        filename = file.get("filename", "")
+        if not filename.endswith(".whl") or file.get("yanked"):
+            continue
+        try:
+            versions.append(parse_wheel_filename(filename)[1])
+        except ValueError:
+            logging.debug(f"Skipping unparsable wheel filename {filename}")
+    return versions
+
+
+def _read_anchor_versions(parser: Any) -> Iterator["Version"]:
+    from packaging.utils import parse_wheel_filename
+
+    for _, anchor_el in parser.read_events():
+        filename = anchor_el.text
+        # drop parsed anchors so memory does not grow with the page size
+        anchor_el.clear()
+        while anchor_el.getprevious() is not None:
+            del anchor_el.getparent()[0]
+        if filename:
+            yield parse_wheel_filename(filename)[1]
+
+
+def _iter_html_index_versions(chunks: Iterable[bytes]) -> Iterator["Version"]:
+    """Incrementally parse an HTML project page and yield versions of its anchors."""
+    import lxml.etree as et
+
+    parser = et.HTMLPullParser(events=("end",), tag="a")
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from _read_anchor_versions(parser)
+    parser.close()
+    yield from _read_anchor_versions(parser)
+
+
+def _iter_candidate_versions(
+    specifier_set: Any, parsed_packages_versions: Iterable["Version"]
+) -> Iterator["Version"]:
+    """Yield each distinct version matched by `specifier_set`, pre-releases included.
+
+    Pre-release handling is left to `filter_versions`, which gives the same result
+    for the candidates as for the full list of versions.
+    """
+    seen_versions = set()
+    for version in parsed_packages_versions:
+        if version in seen_versions or not specifier_set.contains(
+            version, prereleases=True
+        ):
+            continue
+        seen_versions.add(version)
+        yield version
+
 
+def _iter_index_page_versions(package_index_page: IndexPage) -> Iterable["Version"]:
+    content_type = (package_index_page.content_type or "").split(";")[0].strip()
+    if content_type == SIMPLE_JSON_CONTENT_TYPE:
+        return _parse_json_index_versions(package_index_page.text)
+    return _iter_html_index_versions(package_index_page.chunks)
 
+
+def filter_compatible_versions(
+    specifier_set: Any, versions: Iterable["Version"]
+) -> List[str]:
+    """Return the distinct `versions` compatible with `specifier_set`, newest first.
+
+    Pre-releases are filtered like in `filter_versions`.
+    """
+    from packaging.version import Version
+
+    candidate_versions = list(_iter_candidate_versions(specifier_set, versions))
+    logging.debug(f"Parsed candidate versions: {candidate_versions}")
+    compatible_versions = filter_versions(specifier_set, candidate_versions)
+    logging.debug(f"Found compatible versions: {compatible_versions}")
+
+    return sorted(compatible_versions, reverse=True, key=Version)
+
+
+@span("index_fetch")
 def get_compatible_upgrade_versions(
     requirements_obj: Any, cloudsmith_url: str
 ) -> Optional[List[str]]:
-    """Parse the package index HTML list of available packages
-    and return a list of package versions that are compatible with the requirements specifier
+    """Parse the package index list of available packages
+    and return a list of package versions that are compatible with the requirements specifier.
+
+    HTML pages are parsed as they are downloaded and only matching versions are kept.
     """
-    package_index_html = _get_package_index_html(cloudsmith_url, requirements_obj.name)
+    package_index_page = _get_package_index_page(cloudsmith_url, requirements_obj.name)
+    return filter_compatible_versions(
+        requirements_obj.specifier, _iter_index_page_versions(package_index_page)
+    )
 
-    tree = et.HTML(package_index_html)
-    anchor_tags_el = tree.xpath("//a")
-    parsed_packages_versions = [
-        parse_wheel_filename(tag_el.text)[1] for tag_el in anchor_tags_el
-    ]
-    logging.debug(f"Parsed packages versions: {parsed_packages_versions}")
 
-    compatible_versions = filter_versions(
-        requirements_obj.specifier, parsed_packages_versions
+@span("index_fetch")
+def get_available_versions(package_name: str, cloudsmith_url: str) -> List["Version"]:
+    """Return every distinct version of a package published in the package index."""
+    from packaging.specifiers import SpecifierSet
+
+    package_index_page = _get_package_index_page(cloudsmith_url, package_name)
+    return list(
+        _iter_candidate_versions(
+            SpecifierSet(), _iter_index_page_versions(package_index_page)
+        )
     )
-    logging.debug(f"Found compatible versions: {compatible_versions}")
 
-    return sorted(compatible_versions, reverse=True, key=Version)
+
+def find_upgrade_version(
+    upgrade_versions: List[str], installed_version: str
+) -> Optional[str]:
+    from packaging.version import Version
+
+    for upgrade_version in upgrade_versions:
+        if Version(upgrade_version) > Version(installed_version):
+            return upgrade_version
+    return None
 
 
+@span("installed_version")
 def get_installed_version(requirements_obj: Any, venv_executable: str) -> Optional[str]:
     """Return the version of the package that is installed in the virtualenv."""
     try:
@@ -85,11 +214,7 @@ def get_compatible_version(
     logging.debug("Found installed version: %s", installed_version)
 
     upgrade_versions = get_compatible_upgrade_versions(requirements_obj, cloudsmith_url)
-    for upgrade_version in upgrade_versions:
-        if Version(upgrade_version) > Version(installed_version):
-            return upgrade_version
-
-    return None
+    return find_upgrade_version(upgrade_versions, installed_version)
 
 
 def find_compatible_versions(
@@ -130,35 +255,119 @@ def find_compatible_versions(
         test=bool(test),
     )
 
-    try:
-        if requirements is None and requirements_file is None:
-            raise Exception("Either requirements or requirements_file is required.")
-        if cloudsmith_url:
-            is_cloudsmith_url_valid(cloudsmith_url)
+    with record_spans() as spans, record_commands("find_compatible_versions") as commands:
+        try:
+            if requirements is None and requirements_file is None:
+                raise Exception("Either requirements or requirements_file is required.")
+            if cloudsmith_url:
+                is_cloudsmith_url_valid(cloudsmith_url)
+
+            requirements = requirements or parse_requirements_txt(requirements_file)
+            requirements_obj = to_requirements_obj(requirements)
+            package_name = requirements_obj.name
+            venv_executable = get_venv_executable(venv_path)
+            current_version = is_package_already_installed(package_name, venv_executable)
+
+            upgrade_version = get_compatible_version(
+                requirements_obj, venv_path, cloudsmith_url
+            )
+            if upgrade_version:
+                response_status["responseStatus"] = CompatibleUpgradeStatus.AVAILABLE.value
+                target = upgrade_version
+                result = "upgrade_available"
+            else:
+                response_status["responseStatus"] = (
+                    CompatibleUpgradeStatus.AT_LATEST_VERSION.value
+                )
+                result = "unchanged"
+        except Exception:
+            response_status["responseStatus"] = CompatibleUpgradeStatus.ERROR.value
+            result = "errored"
+            logging.exception("find_compatible_versions run failed")
+            raise
+        finally:
+            log_run_summary(
+                script="find_compatible_versions",
+                package=package_name,
+                current=current_version,
+                target=target,
+                final=current_version,
+                result=result,
+                duration_seconds=time.monotonic() - start_time,
+                extra_fields={**get_index_cache_stats(), **commands.summary_fields()},
+                phase_durations=spans.durations,
+            )
+
+            response_status["phaseDurations"] = spans.to_dict()
+            response = json.dumps(response_status)
+            print(response)
+
+
+def discover_venvs(envs_home: str) -> List[dict]:
+    """Return a batch entry for every virtualenv managed under `envs_home`.
+
+    Following `manage_venv`, the name of each venv directory is its requirements string.
+    Temporary `_green`/`_temp` upgrade venvs are skipped.
+    """
+    return [
+        {"venv_path": str(venv_path), "requirements": venv_path.name}
+        for venv_path in list_managed_venvs(envs_home)
+    ]
+
+
+def read_batch_file(batch_file: str) -> List[dict]:
+    """Read batch entries from an NDJSON file. Each line is an object with a
+    `venv_path` and either `requirements` or `requirements_file`."""
+    with open(batch_file, "r") as batch_lines:
+        return [json.loads(line) for line in batch_lines if line.strip()]
+
+
+def _get_batch_requirements_obj(batch_entry: dict) -> Any:
+    requirements = batch_entry.get("requirements") or parse_requirements_txt(
+        batch_entry.get("requirements_file")
+    )
+    return to_requirements_obj(requirements)
 
-        requirements = requirements or parse_requirements_txt(requirements_file)
-        requirements_obj = to_requirements_obj(requirements)
-        package_name = requirements_obj.name
-        venv_executable = get_venv_executable(venv_path)
-        current_version = is_package_already_installed(package_name, venv_executable)
 
-        upgrade_version = get_compatible_version(
-            requirements_obj, venv_path, cloudsmith_url
+def _check_batch_entry(batch_entry: dict, available_versions: dict) -> dict:
+    venv_path = batch_entry.get("venv_path")
+    response_status = {"venvPath": venv_path}
+    start_time = time.monotonic()
+    package_name = None
+    current_version = None
+    target = None
+    result = "errored"
+    try:
+        requirements_obj = _get_batch_requirements_obj(batch_entry)
+        package_name = requirements_obj.name
+        response_status["package"] = package_name
+        current_version = get_installed_version(
+            requirements_obj, get_venv_executable(venv_path)
         )
-        if upgrade_version:
+        if not current_version:
+            raise Exception(f"Package {package_name} is not installed")
+        response_status["currentVersion"] = current_version
+
+        versions = available_versions[package_name]
+        if isinstance(versions, Exception):
+            raise versions
+        target = find_upgrade_version(
+            filter_compatible_versions(requirements_obj.specifier, versions),
+            current_version,
+        )
+        if target:
             response_status["responseStatus"] = CompatibleUpgradeStatus.AVAILABLE.value
-            target = upgrade_version
+            response_status["compatibleVersion"] = target
             result = "upgrade_available"
         else:
             response_status["responseStatus"] = (
                 CompatibleUpgradeStatus.AT_LATEST_VERSION.value
             )
             result = "unchanged"
-    except Exception:
+    except Exception as e:
+        logging.exception("find_compatible_versions failed for venv %s", venv_path)
         response_status["responseStatus"] = CompatibleUpgradeStatus.ERROR.value
-        result = "errored"
-        logging.exception("find_compatible_versions run failed")
-        raise
+        response_status["error"] = str(e)
     finally:
         log_run_summary(
             script="find_compatible_versions",
@@ -168,10 +377,81 @@ def find_compatible_versions(
             final=current_version,
             result=result,
             duration_seconds=time.monotonic() - start_time,
+            extra_fields={"venv": venv_path},
         )
+    return response_status
+
+
+def _get_batch_package_name(batch_entry: dict) -> Optional[str]:
+    try:
+        return _get_batch_requirements_obj(batch_entry).name
+    except Exception:
+        # reported when the entry itself is checked
+        return None
 
-        response = json.dumps(response_status)
-        print(response)
+
+def find_compatible_versions_batch(
+    batch_entries: List[dict],
+    cloudsmith_url: Optional[str] = None,
+    max_workers: int = DEFAULT_BATCH_MAX_WORKERS,
+    log_location: Optional[str] = None,
+    test: Optional[bool] = None,
+) -> List[dict]:
+    """Check many virtualenvs for compatible upgrades in a single run.
+
+    The package index of each distinct package is fetched only once, concurrently
+    with at most `max_workers` threads. A failure in one venv does not affect the
+    others. One JSON line is printed per venv, in the order of `batch_entries`,
+    and the list of those responses is returned.
+    """
+    start_time = time.monotonic()
+    configure_script_logging(
+        log_location=log_location,
+        default_log_location="/var/log/find_compatible_versions.log",
+        test=bool(test),
+    )
+    if cloudsmith_url:
+        is_cloudsmith_url_valid(cloudsmith_url)
+
+    package_names = sorted(
+        {
+            package_name
+            for package_name in map(_get_batch_package_name, batch_entries)
+            if package_name is not None
+        }
+    )
+
+    def _fetch_versions(package_name):
+        try:
+            return get_available_versions(package_name, cloudsmith_url)
+        except Exception as e:
+            logging.exception("Failed to fetch package index of %s", package_name)
+            return e
+
+    fetch_start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        fetch_versions = bind_job_logging(_fetch_versions)
+        available_versions = dict(
+            zip(package_names, executor.map(fetch_versions, package_names))
+        )
+    fetch_duration = time.monotonic() - fetch_start_time
+
+    responses = []
+    for batch_entry in batch_entries:
+        response_status = _check_batch_entry(batch_entry, available_versions)
+        responses.append(response_status)
+        print(json.dumps(response_status))
+
+    logging.info(
+        "batch summary script=find_compatible_versions venvs=%s packages=%s duration_s=%.2f "
+        "index_fetch_s=%.2f%s",
+        len(batch_entries),
+        len(package_names),
+        time.monotonic() - start_time,
+        fetch_duration,
+        "".join(f" {key}={value}" for key, value in get_index_cache_stats().items()),
+    )
+    return responses
 
 
 parser = argparse.ArgumentParser()
@@ -194,8 +474,31 @@ parser.add_argument(
     "--venv-path",
     action="store",
     type=str,
-    required=True,
-    help="Path to the virtualenv directory.",
+    default=None,
+    help="Path to the virtualenv directory. Required unless --envs-home or --batch-file is used.",
+)
+parser.add_argument(
+    "--envs-home",
+    action="store",
+    type=str,
+    default=None,
+    help="Check every virtualenv under this directory (batch mode). "
+    + "The name of each venv directory is used as its requirements.",
+)
+parser.add_argument(
+    "--batch-file",
+    action="store",
+    type=str,
+    default=None,
+    help="NDJSON file with one {\"venv_path\", \"requirements\" or \"requirements_file\"} "
+    + "object per line (batch mode).",
+)
+parser.add_argument(
+    "--max-workers",
+    action="store",
+    type=int,
+    default=DEFAULT_BATCH_MAX_WORKERS,
+    help="Maximum number of concurrent package index fetches in batch mode.",
 )
 parser.add_argument(
     "--cloudsmith-url",
@@ -212,8 +515,7 @@ parser.add_argument(
 )
 
 
-def main():
-    parsed_args = parser.parse_args()
+def run_parsed_args(parsed_args):
     requirements = parsed_args.requirements
     requirements_file = parsed_args.requirements_file
     venv_path = parsed_args.venv_path
@@ -221,6 +523,21 @@ def main():
     log_location = parsed_args.log_location
     test = parsed_args.test
 
+    if parsed_args.envs_home or parsed_args.batch_file:
+        batch_entries = []
+        if parsed_args.envs_home:
+            batch_entries.extend(discover_venvs(parsed_args.envs_home))
+        if parsed_args.batch_file:
+            batch_entries.extend(read_batch_file(parsed_args.batch_file))
+        find_compatible_versions_batch(
+            batch_entries,
+            cloudsmith_url=cloudsmith_url,
+            max_workers=parsed_args.max_workers,
+            log_location=log_location,
+            test=test,
+        )
+        return
+
     find_compatible_versions(
         venv_path=venv_path,
         requirements=requirements,
@@ -231,5 +548,20 @@ def main():
     )
 
 
+def main():
+    if sys.argv[1:2] == ["poll"]:
+        from upgrade.scripts.index_poller import main as poll_main
+
+        poll_main(sys.argv[2:])
+        return
+    parsed_args = parser.parse_args()
+    if parsed_args.venv_path is None and not (parsed_args.envs_home or parsed_args.batch_file):
+        parser.error("--venv-path is required unless --envs-home or --batch-file is used")
+    exit_code = run_in_agent("check", parsed_args)
+    if exit_code is not None:
+        sys.exit(exit_code)
+    run_parsed_args(parsed_args)
+
+
 if __name__ == "__main__":
     main()
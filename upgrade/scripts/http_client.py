@@ -0,0 +1,124 @@
+"""Shared HTTP client used for package index, URL validation and Slack requests.
+
+A single lazily created `requests.Session` keeps connections alive between
+requests to the same host, so validating the Cloudsmith URL and then fetching the
+package index reuses one TCP/TLS connection. Every request gets a timeout, and
+idempotent requests are retried with exponential backoff.
+
+`requests` is only imported when the session is created, so runs that never
+send a request do not pay for importing it.
+
+Defaults can be overridden with environment variables or `configure_http_client()`:
+- UPGRADE_HTTP_CONNECT_TIMEOUT (seconds)
+- UPGRADE_HTTP_READ_TIMEOUT (seconds)
+- UPGRADE_HTTP_RETRIES
+- UPGRADE_HTTP_BACKOFF_FACTOR
+"""
+
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_MAXSIZE = 10
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_settings = {}
+
+
+def _setting(name: str, env_var: str, default: float) -> float:
+    if _settings.get(name) is not None:
+        return _settings[name]
+    value = os.environ.get(env_var)
+    if value:
+        try:
+            return type(default)(value)
+        except ValueError:
+            logger.warning("Ignoring invalid %s=%s", env_var, value)
+    return default
+
+
+def get_timeout():
+    """Return the `(connect, read)` timeout tuple passed to every request."""
+    return (
+        _setting("connect_timeout", "UPGRADE_HTTP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+        _setting("read_timeout", "UPGRADE_HTTP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+    )
+
+
+def _create_session() -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = Retry(
+        total=_setting("retries", "UPGRADE_HTTP_RETRIES", DEFAULT_RETRIES),
+        backoff_factor=_setting(
+            "backoff_factor", "UPGRADE_HTTP_BACKOFF_FACTOR", DEFAULT_BACKOFF_FACTOR
+        ),
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["HEAD", "GET", "OPTIONS"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=DEFAULT_POOL_MAXSIZE, max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> "requests.Session":
+    """Return the shared session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def close_session() -> None:
+    """Close pooled connections. The next request creates a new session."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def configure_http_client(
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+) -> None:
+    """Override timeouts and retry policy. Settings left as None keep their defaults."""
+    _settings.update(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        retries=retries,
+        backoff_factor=backoff_factor,
+    )
+    close_session()
+
+
+def request(method: str, url: str, **kwargs) -> "requests.Response":
+    """Send a request through the shared session.
+
+    Mirrors `requests.request`, except that a timeout is always set.
+    Redirects are not followed for HEAD requests, same as `requests.head`.
+    """
+    kwargs.setdefault("timeout", get_timeout())
+    kwargs.setdefault("allow_redirects", method.upper() != "HEAD")
+    return get_session().request(method, url, **kwargs)
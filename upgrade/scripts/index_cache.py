@@ -0,0 +1,302 @@
+"""Persistent on-disk cache for package index pages.
+
+`find-compatible-version` runs from cron every few minutes for every hosted venv,
+so the same simple-index page is requested over and over. Cached pages are served
+without a request while younger than the TTL; older pages are revalidated with
+If-None-Match/If-Modified-Since and only downloaded again if they changed.
+The cache is size-bounded and evicts least recently used pages.
+
+Page bodies are streamed in chunks, both from disk and from the network (while
+being written to the cache), so callers can parse very large pages incrementally.
+
+Entries are keyed by a hash of the page URL and the requested media types, so
+Cloudsmith API keys embedded in index URLs are never written to disk.
+Defaults can be overridden with:
+- UPGRADE_INDEX_CACHE_DIR
+- UPGRADE_INDEX_CACHE_TTL (seconds, 0 always revalidates)
+- UPGRADE_INDEX_CACHE_MAX_BYTES
+- UPGRADE_INDEX_CACHE_DISABLED
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from upgrade.scripts.http_client import request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_index_cache = None
+_index_cache_lock = threading.Lock()
+
+
+class IndexPage:
+    """Index page body as an iterable of byte chunks, plus its content type.
+
+    The chunks can only be consumed once.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], content_type: Optional[str]):
+        self.chunks = chunks
+        self.content_type = content_type
+
+    @property
+    def text(self) -> str:
+        return b"".join(self.chunks).decode("utf-8")
+
+
+def _iter_file(body_file) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = body_file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        body_file.close()
+
+
+def _default_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "upgrade-python-package" / "index"
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Write to a temporary file first so concurrent readers never see partial pages."""
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class IndexCache:
+    """Conditional-request cache of index pages stored as `<key>.json` metadata
+    and `<key>.body` page files."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else _default_cache_dir()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    def _count_hit(self) -> None:
+        with self._counters_lock:
+            self.hits += 1
+
+    def _paths(self, url: str, accept: Optional[str] = None):
+        key = hashlib.sha256(f"{url} {accept or ''}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def _read_entry(self, url: str, accept: Optional[str]):
+        """Return the entry metadata and an open body file, or `(None, None)`."""
+        meta_path, body_path = self._paths(url, accept)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body_file = open(str(body_path), "rb")
+        except (OSError, ValueError):
+            return None, None
+        return meta, body_file
+
+    def _write_meta(self, url: str, accept: Optional[str], meta: dict) -> None:
+        meta_path, _ = self._paths(url, accept)
+        try:
+            _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            logger.debug("Failed to write index cache entry: %s", e)
+
+    def _touch(self, url: str, accept: Optional[str]) -> None:
+        meta_path, _ = self._paths(url, accept)
+        try:
+            os.utime(str(meta_path))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """Remove least recently used pages until the cache fits in `max_bytes`."""
+        entries = {}
+        try:
+            paths = list(self.cache_dir.iterdir())
+        except OSError:
+            return
+        for path in paths:
+            if path.suffix not in (".json", ".body"):
+                continue
+            try:
+                stat_result = path.stat()
+            except OSError:
+                continue
+            size, last_used = entries.get(path.stem, (0, 0))
+            if path.suffix == ".json":
+                last_used = stat_result.st_mtime
+            entries[path.stem] = (size + stat_result.st_size, last_used)
+
+        total_size = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total_size <= self.max_bytes:
+                break
+            for suffix in (".json", ".body"):
+                try:
+                    (self.cache_dir / f"{key}{suffix}").unlink()
+                except OSError:
+                    pass
+            total_size -= size
+            logger.debug("Evicted index cache entry %s", key)
+
+    def _stream_to_cache(
+        self, url: str, accept: Optional[str], meta: dict, response
+    ) -> Iterator[bytes]:
+        """Yield the response body while writing it to the cache.
+
+        The entry is only stored once the whole body was read, so consumers that
+        stop early never leave truncated pages behind.
+        """
+        _, body_path = self._paths(url, accept)
+        tmp_file = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=str(self.cache_dir), prefix=f".{body_path.name}."
+            )
+            tmp_file = os.fdopen(fd, "wb")
+        except OSError as e:
+            logger.debug("Failed to create index cache entry: %s", e)
+        completed = False
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if tmp_file is not None:
+                    tmp_file.write(chunk)
+                yield chunk
+            completed = True
+        finally:
+            response.close()
+            if tmp_file is not None:
+                tmp_file.close()
+                try:
+                    if completed:
+                        os.replace(tmp_path, str(body_path))
+                        self._write_meta(url, accept, meta)
+                        self.evict()
+                    else:
+                        os.unlink(tmp_path)
+                except OSError as e:
+                    logger.debug("Failed to write index cache entry: %s", e)
+
+    def fetch(self, url: str, accept: Optional[str] = None) -> IndexPage:
+        """Return the page at `url`, from the cache when it is fresh or unchanged."""
+        meta, body_file = self._read_entry(url, accept)
+        now = time.time()
+        if meta is not None and now - meta.get("fetched_at", 0) < self.ttl:
+            self._count_hit()
+            self._touch(url, accept)
+            logger.debug("Index cache hit (fresh)")
+            return IndexPage(_iter_file(body_file), meta.get("content_type"))
+
+        headers = {"Accept": accept} if accept else {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = request("GET", url, headers=headers, stream=True)
+        except BaseException:
+            if body_file is not None:
+                body_file.close()
+            raise
+
+        if response.status_code == 304 and meta is not None:
+            response.close()
+            self._count_hit()
+            meta["fetched_at"] = now
+            self._write_meta(url, accept, meta)
+            logger.debug("Index cache hit (not modified)")
+            return IndexPage(_iter_file(body_file), meta.get("content_type"))
+
+        if body_file is not None:
+            body_file.close()
+        with self._counters_lock:
+            self.misses += 1
+        logger.debug("Index cache miss status=%s", response.status_code)
+        content_type = response.headers.get("Content-Type")
+        if response.status_code != 200:
+            return IndexPage(response.iter_content(CHUNK_SIZE), content_type)
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": content_type,
+            "fetched_at": now,
+        }
+        return IndexPage(self._stream_to_cache(url, accept, meta, response), content_type)
+
+
+def _create_index_cache() -> IndexCache:
+    try:
+        ttl = float(os.environ.get("UPGRADE_INDEX_CACHE_TTL", DEFAULT_TTL_SECONDS))
+        max_bytes = int(
+            os.environ.get("UPGRADE_INDEX_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+        )
+    except ValueError as e:
+        logger.warning("Invalid index cache setting, using defaults: %s", e)
+        ttl, max_bytes = DEFAULT_TTL_SECONDS, DEFAULT_MAX_BYTES
+    return IndexCache(
+        os.environ.get("UPGRADE_INDEX_CACHE_DIR"), ttl=ttl, max_bytes=max_bytes
+    )
+
+
+def get_index_cache() -> Optional[IndexCache]:
+    """Return the process-wide index cache or None if caching is disabled."""
+    global _index_cache
+    if os.environ.get("UPGRADE_INDEX_CACHE_DISABLED"):
+        return None
+    with _index_cache_lock:
+        if _index_cache is None:
+            _index_cache = _create_index_cache()
+    return _index_cache
+
+
+def get_index_page(url: str, accept: Optional[str] = None) -> IndexPage:
+    """Fetch a package index page, through the on-disk cache when enabled.
+
+    `accept` is sent as the Accept header so callers can negotiate the page format.
+    """
+    index_cache = get_index_cache()
+    if index_cache is None:
+        response = request(
+            "GET", url, headers={"Accept": accept} if accept else {}, stream=True
+        )
+        return IndexPage(
+            response.iter_content(CHUNK_SIZE), response.headers.get("Content-Type")
+        )
+    return index_cache.fetch(url, accept)
+
+
+def get_index_cache_stats() -> dict:
+    """Return hit/miss counters of the current run for the run summary."""
+    index_cache = _index_cache
+    if index_cache is None:
+        return {}
+    return {"index_cache_hits": index_cache.hits, "index_cache_misses": index_cache.misses}
@@ -0,0 +1,301 @@
+"""Asyncio poller checking many packages for compatible versions at once.
+
+`poll_packages` fetches the package index page of every distinct package of the
+given requirements concurrently, with at most `host_concurrency` requests per
+index host at a time and at most `rate_limit` requests per second overall, and
+filters the versions with the same specifier rules as `find_compatible_versions`.
+
+Index pages are still fetched with the shared HTTP session, the on-disk index
+cache and its retries (see `http_client` and `index_cache`); the blocking
+fetches run in a thread pool sized to the concurrency limits, while scheduling
+and limits are handled by the event loop.
+
+    results = asyncio.run(poll_packages(["oll-test-top-level~=2.0.0"], [index_url]))
+
+From the command line:
+
+    find-compatible-version poll --cloudsmith-url <index url> "pkg~=1.0" "other>=2"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Union
+from urllib.parse import urlsplit
+
+from upgrade.scripts.find_compatible_versions import (
+    CompatibleUpgradeStatus,
+    filter_compatible_versions,
+    find_upgrade_version,
+    get_available_versions,
+    get_installed_version,
+)
+from upgrade.scripts.index_cache import get_index_cache_stats
+from upgrade.scripts.logging_config import bind_job_logging, configure_script_logging
+from upgrade.scripts.requirements import to_requirements_obj
+from upgrade.scripts.utils import get_venv_executable, list_managed_venvs
+
+if TYPE_CHECKING:
+    from packaging.version import Version
+
+DEFAULT_HOST_CONCURRENCY = 8
+DEFAULT_RATE_LIMIT = 20.0
+
+
+class RateLimiter:
+    """Spaces requests out to at most `rate` per second; `rate` <= 0 disables it."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_time = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot_time = max(now, self._next_time)
+        self._next_time = slot_time + self.interval
+        if slot_time > now:
+            await asyncio.sleep(slot_time - now)
+
+
+class AsyncIndexClient:
+    """Fetches the versions of packages from one or more package indexes.
+
+    Versions found on every index are merged, like pip does for extra index URLs.
+    """
+
+    def __init__(
+        self,
+        index_urls: Sequence[str],
+        host_concurrency: int = DEFAULT_HOST_CONCURRENCY,
+        rate_limit: float = DEFAULT_RATE_LIMIT,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.index_urls = list(index_urls)
+        self.host_concurrency = max(1, host_concurrency)
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.executor = executor
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def _fetch_versions(self, index_url: str, package_name: str) -> List["Version"]:
+        host = urlsplit(index_url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        async with semaphore:
+            await self.rate_limiter.acquire()
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                bind_job_logging(get_available_versions),
+                package_name,
+                index_url,
+            )
+
+    async def get_available_versions(self, package_name: str) -> List["Version"]:
+        """Return every distinct version of a package published in the indexes."""
+        versions_per_index = await asyncio.gather(
+            *(self._fetch_versions(index_url, package_name) for index_url in self.index_urls)
+        )
+        return list(
+            dict.fromkeys(version for versions in versions_per_index for version in versions)
+        )
+
+
+@dataclass
+class PollRequest:
+    """A requirement to check and, optionally, the version currently installed."""
+
+    requirements: str
+    current_version: Optional[str] = None
+
+
+@dataclass
+class PollResult:
+    requirements: str
+    package: Optional[str] = None
+    current_version: Optional[str] = None
+    latest_version: Optional[str] = None
+    compatible_version: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_response(self) -> dict:
+        """Return the result in the JSON format of the batch mode of
+        `find_compatible_versions`. `latestVersion` is the newest published
+        version, compatible or not; `compatibleVersion` is the newest compatible
+        version above the current one, or the newest one if none is installed."""
+        response = {"requirements": self.requirements, "package": self.package}
+        if self.current_version is not None:
+            response["currentVersion"] = self.current_version
+        if self.error is not None:
+            response["responseStatus"] = CompatibleUpgradeStatus.ERROR.value
+            response["error"] = self.error
+            return response
+        response["latestVersion"] = self.latest_version
+        if self.compatible_version:
+            response["responseStatus"] = CompatibleUpgradeStatus.AVAILABLE.value
+            response["compatibleVersion"] = self.compatible_version
+        else:
+            response["responseStatus"] = CompatibleUpgradeStatus.AT_LATEST_VERSION.value
+        return response
+
+
+def _check(poll_request: PollRequest, available_versions: Dict[str, object]) -> PollResult:
+    result = PollResult(poll_request.requirements, current_version=poll_request.current_version)
+    try:
+        requirements_obj = to_requirements_obj(poll_request.requirements)
+        result.package = requirements_obj.name
+        versions = available_versions[requirements_obj.name]
+        if isinstance(versions, BaseException):
+            raise versions
+        if not versions:
+            raise Exception(f"No versions of {requirements_obj.name} found in the package index")
+        compatible_versions = filter_compatible_versions(requirements_obj.specifier, versions)
+        result.latest_version = str(max(versions))
+        if poll_request.current_version:
+            result.compatible_version = find_upgrade_version(
+                compatible_versions, poll_request.current_version
+            )
+        elif compatible_versions:
+            result.compatible_version = compatible_versions[0]
+    except Exception as e:
+        logging.debug("Polling %s failed: %s", poll_request.requirements, e)
+        result.error = str(e) or type(e).__name__
+    return result
+
+
+def _get_package_name(requirements: str) -> Optional[str]:
+    try:
+        return to_requirements_obj(requirements).name
+    except Exception:
+        # reported when the request itself is checked
+        return None
+
+
+async def poll_packages(
+    poll_requests: Iterable[Union[PollRequest, str]],
+    index_urls: Sequence[str],
+    host_concurrency: int = DEFAULT_HOST_CONCURRENCY,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+) -> List[PollResult]:
+    """Check requirements for compatible versions, fetching every package once.
+
+    Returns one result per request, in order; a failure of one package is
+    reported in its results and does not affect the others.
+    """
+    poll_requests = [
+        PollRequest(poll_request) if isinstance(poll_request, str) else poll_request
+        for poll_request in poll_requests
+    ]
+    package_names = list(
+        dict.fromkeys(
+            package_name
+            for package_name in (
+                _get_package_name(poll_request.requirements) for poll_request in poll_requests
+            )
+            if package_name is not None
+        )
+    )
+    hosts = {urlsplit(index_url).netloc for index_url in index_urls}
+    max_workers = max(1, min(len(package_names) * len(index_urls), host_concurrency * len(hosts)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        client = AsyncIndexClient(index_urls, host_concurrency, rate_limit, executor)
+        versions = await asyncio.gather(
+            *(client.get_available_versions(package_name) for package_name in package_names),
+            return_exceptions=True,
+        )
+    available_versions = dict(zip(package_names, versions))
+    return [_check(poll_request, available_versions) for poll_request in poll_requests]
+
+
+def _discover_poll_requests(envs_home: str) -> List[PollRequest]:
+    """Return a request for every venv managed under `envs_home`, with its
+    installed version. Following `manage_venv`, venvs are named after their
+    requirements."""
+    poll_requests = []
+    for venv_path in list_managed_venvs(envs_home):
+        current_version = None
+        try:
+            current_version = get_installed_version(
+                to_requirements_obj(venv_path.name), get_venv_executable(str(venv_path))
+            )
+        except Exception as e:
+            logging.debug("Unable to read the installed version in %s: %s", venv_path, e)
+        poll_requests.append(PollRequest(venv_path.name, current_version))
+    return poll_requests
+
+
+parser = argparse.ArgumentParser(prog="find-compatible-version poll")
+parser.add_argument(
+    "requirements",
+    nargs="*",
+    help="Requirements to check, in the format: <dependency_name><specifier><version>.",
+)
+parser.add_argument(
+    "--envs-home",
+    help="Also check every virtualenv under this directory against its installed version.",
+)
+parser.add_argument(
+    "--cloudsmith-url",
+    action="append",
+    required=True,
+    help="Package index URL. May be repeated; versions of all indexes are merged.",
+)
+parser.add_argument(
+    "--host-concurrency",
+    type=int,
+    default=DEFAULT_HOST_CONCURRENCY,
+    help="Maximum number of concurrent requests to one index host.",
+)
+parser.add_argument(
+    "--rate-limit",
+    type=float,
+    default=DEFAULT_RATE_LIMIT,
+    help="Maximum number of index requests per second; 0 disables the limit.",
+)
+parser.add_argument("--log-location", help="Specifies where to store the log file")
+parser.add_argument(
+    "--test",
+    action="store_true",
+    help="Log to stderr at debug level instead of writing to the log file.",
+)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parsed_args = parser.parse_args(argv)
+    if not parsed_args.requirements and not parsed_args.envs_home:
+        parser.error("requirements or --envs-home are required")
+    start_time = time.monotonic()
+    configure_script_logging(
+        log_location=parsed_args.log_location,
+        default_log_location="/var/log/find_compatible_versions.log",
+        test=parsed_args.test,
+    )
+    poll_requests = [PollRequest(requirements) for requirements in parsed_args.requirements]
+    if parsed_args.envs_home:
+        poll_requests.extend(_discover_poll_requests(parsed_args.envs_home))
+
+    results = asyncio.run(
+        poll_packages(
+            poll_requests,
+            parsed_args.cloudsmith_url,
+            host_concurrency=parsed_args.host_concurrency,
+            rate_limit=parsed_args.rate_limit,
+        )
+    )
+    for result in results:
+        print(json.dumps(result.to_response()))
+
+    logging.info(
+        "batch summary script=find_compatible_versions mode=poll requirements=%s packages=%s "
+        "failed=%s duration_s=%.2f%s",
+        len(results),
+        len({result.package for result in results if result.package}),
+        sum(result.error is not None for result in results),
+        time.monotonic() - start_time,
+        "".join(f" {key}={value}" for key, value in get_index_cache_stats().items()),
+    )
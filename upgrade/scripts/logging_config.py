@@ -7,18 +7,33 @@ The logging model is intentionally simple for operations:
 
 Handlers created by this module are tagged and cleaned up selectively so importing
 applications keep their own logging handlers and root-level behavior.
+
+Inside `job_logging()` (used by the upgrade agent, which runs many jobs at once)
+the handlers of a script are not added to the root logger but to the current
+job, and only receive the records logged while running that job. Worker threads
+do not inherit the job, so functions run in thread pools are wrapped with
+`bind_job_logging`.
 """
 
 import logging
 import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
 from logging.handlers import WatchedFileHandler
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from upgrade.scripts.metrics import write_run_metrics
 
 DEFAULT_LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
 DEFAULT_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
 UPGRADE_HANDLER_ATTR = "_upgrade_handler"
 
+_job_handlers = ContextVar("upgrade_job_log_handlers", default=None)
+
+T = TypeVar("T")
+
 
 class _MaxLevelFilter(logging.Filter):
     def __init__(self, max_level: int):
@@ -48,6 +63,74 @@ def _remove_upgrade_handlers(root: logging.Logger) -> None:
             handler.close()
 
 
+class _JobLogRouter(logging.Handler):
+    """Root handler passing records on to the handlers of the job logging them."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        for handler in _job_handlers.get() or []:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def install_job_log_router() -> None:
+    """Route records logged inside `job_logging()` to the handlers of their job.
+
+    Records are routed from the root logger, so its level must let them through.
+    """
+    root = logging.getLogger()
+    if not any(isinstance(handler, _JobLogRouter) for handler in root.handlers):
+        root.addHandler(_JobLogRouter())
+
+
+@contextmanager
+def job_logging() -> Iterator[None]:
+    """Keep the handlers configured by the enclosed code to the current job."""
+    handlers: List[logging.Handler] = []
+    token = _job_handlers.set(handlers)
+    try:
+        yield
+    finally:
+        _job_handlers.reset(token)
+        for handler in handlers:
+            handler.close()
+
+
+def bind_job_logging(function: Callable[..., T]) -> Callable[..., T]:
+    """Return `function` logging to the handlers of the current job, also when it
+    is called from another thread, e.g. in a `ThreadPoolExecutor`."""
+    handlers = _job_handlers.get()
+    if handlers is None:
+        return function
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _job_handlers.set(handlers)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _job_handlers.reset(token)
+
+    return wrapper
+
+
+def _set_handlers(root: logging.Logger, handlers: List[logging.Handler], level: int) -> None:
+    job_handlers = _job_handlers.get()
+    if job_handlers is not None:
+        for handler in job_handlers:
+            handler.close()
+        job_handlers[:] = handlers
+        return
+    _remove_upgrade_handlers(root)
+    has_foreign_handlers = any(
+        not _is_upgrade_handler(handler) for handler in root.handlers
+    )
+    for handler in handlers:
+        _mark_upgrade_handler(handler)
+        root.addHandler(handler)
+    if not has_foreign_handlers:
+        root.setLevel(level)
+
+
 def get_error_log_path(log_location: str) -> str:
     """Build the companion error-log path from a regular log path."""
     log_path = Path(log_location)
@@ -72,21 +155,13 @@ def configure_logging(
     Test/fallback mode writes to stderr.
     """
     root = logging.getLogger()
-    _remove_upgrade_handlers(root)
-    has_foreign_handlers = any(
-        not _is_upgrade_handler(handler) for handler in root.handlers
-    )
-
     formatter = logging.Formatter(DEFAULT_LOG_FORMAT, datefmt=DEFAULT_DATE_FORMAT)
 
     if test:
         stream_handler = logging.StreamHandler(sys.stderr)
         stream_handler.setLevel(level)
         stream_handler.setFormatter(formatter)
-        _mark_upgrade_handler(stream_handler)
-        root.addHandler(stream_handler)
-        if not has_foreign_handlers:
-            root.setLevel(level)
+        _set_handlers(root, [stream_handler], level)
         return None, None
 
     regular_log_path = log_location or default_log_location
@@ -96,17 +171,12 @@ def configure_logging(
     regular_handler.setLevel(level)
     regular_handler.addFilter(_MaxLevelFilter(logging.ERROR))
     regular_handler.setFormatter(formatter)
-    _mark_upgrade_handler(regular_handler)
 
     error_handler = WatchedFileHandler(error_log_path)
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    _mark_upgrade_handler(error_handler)
 
-    root.addHandler(regular_handler)
-    root.addHandler(error_handler)
-    if not has_foreign_handlers:
-        root.setLevel(level)
+    _set_handlers(root, [regular_handler, error_handler], level)
     return regular_log_path, error_log_path
 
 
@@ -162,14 +232,26 @@ def log_run_summary(
     final: Optional[object],
     result: str,
     duration_seconds: float,
+    extra_fields: Optional[Dict[str, object]] = None,
+    phase_durations: Optional[Dict[str, float]] = None,
 ) -> None:
     """Emit a single high-signal run summary line at INFO level.
 
     The output is key-value formatted so operators can grep quickly and also parse
     it mechanically in log pipelines without JSON formatting requirements.
+    `extra_fields` are appended as additional `key=value` pairs and
+    `phase_durations` (see `spans`) as `<phase>_s=<seconds>` pairs.
+    If UPGRADE_METRICS_DIR is set, the summary is also exported for the
+    Prometheus textfile collector (see `metrics`).
     """
+    extra = "".join(
+        f" {key}={_summary_value(value)}" for key, value in (extra_fields or {}).items()
+    )
+    extra += "".join(
+        f" {name}_s={seconds:.2f}" for name, seconds in (phase_durations or {}).items()
+    )
     logging.info(
-        "summary script=%s package=%s current=%s target=%s final=%s result=%s duration_s=%.2f",
+        "summary script=%s package=%s current=%s target=%s final=%s result=%s duration_s=%.2f%s",
         script,
         _summary_value(package),
         _summary_value(current),
@@ -177,4 +259,16 @@ def log_run_summary(
         _summary_value(final),
         result,
         duration_seconds,
+        extra,
+    )
+    write_run_metrics(
+        script=script,
+        package=package,
+        current=current,
+        target=target,
+        final=final,
+        result=result,
+        duration_seconds=duration_seconds,
+        extra_fields=extra_fields,
+        phase_durations=phase_durations,
     )
@@ -1,6 +1,6 @@
 import argparse
 import logging
-import re
+import os
 import shutil
 import subprocess
 import sys
@@ -9,22 +9,50 @@ import time
 from contextlib import contextmanager
 from enum import Enum
 from pathlib import Path
-from typing import Any, List, Optional
-
+from typing import TYPE_CHECKING, Any, List, Optional
+
+from upgrade.scripts.agent import run_in_agent
+from upgrade.scripts.command_ledger import record_commands
+from upgrade.scripts.dependency_check import check_dependencies
+from upgrade.scripts.distributions import (
+    diff_snapshots,
+    invalidate_installed_distributions,
+    snapshot_site_packages,
+)
 from upgrade.scripts.logging_config import configure_script_logging, log_run_summary
-from upgrade.scripts.requirements import parse_requirements_txt, to_requirements_obj
+from upgrade.scripts.find_compatible_versions import get_available_versions
+from upgrade.scripts.requirements import (
+    filter_versions,
+    parse_requirements_txt,
+    to_requirements_obj,
+)
 from upgrade.scripts.utils import (
     is_development_cloudsmith,
+    is_package_already_installed,
+    is_uv_available,
     run,
-    pip,
     installer,
     create_directory,
     get_venv_executable,
+    list_managed_venvs,
     on_rm_error,
 )
 from upgrade.scripts.validations import is_cloudsmith_url_valid
+from upgrade.scripts.spans import record_spans, span
+from upgrade.scripts.upgrade_driver import UpgradeResult, upgrade_package
+from upgrade.scripts.venv_clone import clone_venv
+from upgrade.scripts.venv_template import (
+    create_venv_from_template,
+    get_template_key,
+    get_venv_template,
+    is_venv_template_enabled,
+)
+from upgrade.scripts.wheelhouse import get_find_links_args
 from upgrade.scripts.exceptions import UpgradeError
 
+if TYPE_CHECKING:
+    from packaging.version import Version
+
 
 class VenvUpgradeStatus(Enum):
     UPGRADED = "UPGRADED"
@@ -32,8 +60,7 @@ class VenvUpgradeStatus(Enum):
 
 
 SYSTEM_DEPENDENCIES = ["pip", "setuptools"]
-upgrade_success_re = re.compile(r'{"success": (true|false)')
-response_output_re = re.compile(r'"responseOutput": "(.*?)"')
+DEFAULT_MAX_WORKERS = 4
 
 
 def ensure_pip(venv_executable, *args, **kwargs):
@@ -52,20 +79,38 @@ def venv(*args, **kwargs):
         raise e
 
 
+def uv_venv(*args, **kwargs):
+    try:
+        return run(*(("uv", "venv", "--python", sys.executable) + args), **kwargs)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error occurred while creating venv with uv {str(e)}")
+        raise e
+
+
+def _use_uv_bootstrap() -> bool:
+    """`UPGRADE_VENV_BOOTSTRAP` forces `uv` or `stdlib`; by default uv is used if found."""
+    method = os.environ.get("UPGRADE_VENV_BOOTSTRAP", "auto").lower()
+    if method == "stdlib":
+        return False
+    uv_available = is_uv_available()
+    if method == "uv" and not uv_available:
+        logging.warning("UPGRADE_VENV_BOOTSTRAP=uv but uv was not found")
+    return uv_available
+
+
 def install_system_dependencies(venv_executable: str) -> None:
-    for dependency in SYSTEM_DEPENDENCIES:
-        try:
-            installer(
-                "install",
-                "--upgrade",
-                f"{dependency}",
-                py_executable=venv_executable,
-            )
-        except subprocess.CalledProcessError as e:
-            logging.error(
-                f"Error occurred while upgrading running pip upgrade {dependency} {str(e)}"
-            )
-            raise e
+    try:
+        installer(
+            "install",
+            "--upgrade",
+            *SYSTEM_DEPENDENCIES,
+            py_executable=venv_executable,
+        )
+    except subprocess.CalledProcessError as e:
+        logging.error(
+            f"Error occurred while upgrading {', '.join(SYSTEM_DEPENDENCIES)} {str(e)}"
+        )
+        raise e
 
 
 def install_upgrade_python_package(
@@ -106,72 +151,145 @@ def upgrade_venv(
     wheels_path: Optional[str],
     update_from_local_wheels: Optional[bool],
     additional_dependencies: Optional[List[str]],
-    log_location: Optional[str] = None,
-) -> str:
+) -> List[UpgradeResult]:
+    """Upgrade the requirement and each additional dependency in turn, driving the
+    installer of `venv_executable` from this process."""
+    if is_development_cloudsmith(cloudsmith_url):
+        version = None
+    else:
+        version = str(requirements_obj.specifier) or None
     try:
-        result = ""
+        results = []
         for dependency in [requirements_obj.name] + additional_dependencies:
-            upgrade_args = [
+            upgrade_result = upgrade_package(
                 venv_executable,
-                "-m",
-                "upgrade.scripts.upgrade_python_package",
                 dependency,
-            ]
-            if is_development_cloudsmith(cloudsmith_url):
-                upgrade_args.append("'--pre'")
-            else:
-                specifier = str(requirements_obj.specifier)
-                if len(specifier) > 0:
-                    upgrade_args.append(f"--version={specifier}")
+                version=version,
+                cloudsmith_url=cloudsmith_url,
+                wheels_path=wheels_path,
+                update_from_local_wheels=update_from_local_wheels,
+                update_all=True,
+            )
+            logging.debug(
+                "Upgraded dependency %s result=%s", dependency, upgrade_result.result
+            )
+            results.append(upgrade_result)
+        return results
+    except Exception as e:
+        logging.error(
+            f"Error occurred while upgrading {requirements_obj.name}{requirements_obj.specifier} {str(e)}"
+        )
+        raise e
 
-            if cloudsmith_url:
-                upgrade_args.append(f"--cloudsmith-url={cloudsmith_url}")
 
-            if log_location:
-                upgrade_args.append(f"--log-location={log_location}")
+def _get_single_resolution_install_args(
+    requirements_obj: Any,
+    cloudsmith_url: Optional[str],
+    wheels_path: Optional[str],
+    update_from_local_wheels: Optional[bool],
+    additional_dependencies: List[str],
+) -> List[str]:
+    install_args = ["install", "--upgrade"]
+    if is_development_cloudsmith(cloudsmith_url):
+        install_args.extend(["--pre", requirements_obj.name])
+    else:
+        install_args.append(f"{requirements_obj.name}{requirements_obj.specifier}")
+    install_args.extend(additional_dependencies)
+    if update_from_local_wheels and wheels_path:
+        install_args.extend(["--find-links", wheels_path])
+        if not cloudsmith_url:
+            install_args.append("--no-index")
+    else:
+        install_args.extend(get_find_links_args())
+    if cloudsmith_url:
+        install_args.extend(["--index-url", cloudsmith_url])
+    return install_args
 
-            upgrade_args.extend(
-                [
-                    "--skip-post-install",
-                    "--format-output",
-                    "--update-all",
-                ]
-            )
-            if wheels_path:
-                upgrade_args.append(f"--wheels-path={wheels_path}")
-            if update_from_local_wheels:
-                upgrade_args.append("--update-from-local-wheels")
-
-            upgrade_output = run(*(upgrade_args), check=False)
-            if upgrade_output is None:
-                raise UpgradeError(
-                    f"Upgrade command failed for dependency {dependency}"
-                )
-            result += upgrade_output
 
-        return result
+def upgrade_venv_single_resolution(
+    venv_executable: str,
+    requirements_obj: Any,
+    cloudsmith_url: Optional[str],
+    wheels_path: Optional[str],
+    update_from_local_wheels: Optional[bool],
+    additional_dependencies: Optional[List[str]],
+) -> UpgradeResult:
+    """Resolve and install the requirement and all additional dependencies in one
+    installer invocation, so later dependencies cannot undo earlier ones.
+
+    Unlike `upgrade_venv`, no dependency check is run here; callers are expected to check
+    the venv once afterwards.
+    """
+    additional_dependencies = additional_dependencies or []
+    package_names = [requirements_obj.name] + [
+        to_requirements_obj(dependency).name for dependency in additional_dependencies
+    ]
+    try:
+        before_versions = {
+            name: is_package_already_installed(name, venv_executable)
+            for name in package_names
+        }
+        before_snapshot = snapshot_site_packages(venv_executable)
+        with span("install"):
+            install_output = installer(
+                *_get_single_resolution_install_args(
+                    requirements_obj,
+                    cloudsmith_url,
+                    wheels_path,
+                    update_from_local_wheels,
+                    additional_dependencies,
+                ),
+                py_executable=venv_executable,
+            )
+        after_snapshot = snapshot_site_packages(venv_executable)
+        packages = [
+            {
+                "package": name,
+                "from": before_versions[name],
+                "to": is_package_already_installed(name, venv_executable),
+            }
+            for name in package_names
+        ]
     except Exception as e:
         logging.error(
-            f"Error occurred while upgrading {requirements_obj.name}{requirements_obj.specifier} {str(e)}"
+            f"Error occurred while upgrading {requirements_obj.name}"
+            f"{requirements_obj.specifier} {str(e)}"
         )
         raise e
 
+    updated_packages = (
+        diff_snapshots(before_snapshot, after_snapshot)
+        if before_snapshot is not None and after_snapshot is not None
+        else []
+    )
+    return UpgradeResult(
+        result="upgraded"
+        if any(package["from"] != package["to"] for package in packages)
+        or updated_packages
+        else "unchanged",
+        output=install_output or "",
+        packages=packages,
+        updated_packages=updated_packages,
+    )
+
 
 def _check_venv_consistent(
-    requirements_obj: Any, venv_executable: str, venv_response: Optional[str] = None
+    requirements_obj: Any, venv_executable: str, response_output: Optional[str] = None
 ) -> None:
     try:
-        pip("check", py_executable=venv_executable)
+        with span("dependency_check"):
+            check_dependencies(venv_executable)
     except:
         msg = f"Error occurred while checking venv at path: {venv_executable}"
-        if venv_response is not None:
-            msg += response_output_re.search(venv_response).group(1)
+        if response_output is not None:
+            msg += response_output
         logging.error(msg)
         raise UpgradeError(msg)
 
     logging.debug(f"{str(requirements_obj)} venv is consistent.")
 
 
+@span("switch_venvs")
 def _switch_venvs(venv_path: str) -> None:
     """
     Switch the virtualenv environments after a successful upgrade,
@@ -182,6 +300,7 @@ def _switch_venvs(venv_path: str) -> None:
     shutil.move(venv_path, temp_venv_path)
     shutil.move(backup_venv_path, venv_path)
     shutil.rmtree(temp_venv_path, onerror=on_rm_error)
+    invalidate_installed_distributions(get_venv_executable(venv_path))
 
 
 def _get_venv_path(envs_home: str, requirements: str) -> Path:
@@ -196,22 +315,78 @@ def _get_venv_path(envs_home: str, requirements: str) -> Path:
     return Path(envs_home) / requirements
 
 
+@span("create_venv")
 def create_venv(
     envs_home: str,
     requirements: str,
     upgrade_python_package_version: Optional[str],
     local_installation_path: Optional[str] = None,
 ) -> str:
-    """Create a virtualenv and install upgrade-python-package in it."""
+    """Create a virtualenv and install upgrade-python-package in it.
+
+    The virtualenv is cloned from a prebuilt template venv (see `venv_template`)
+    when possible and bootstrapped from scratch otherwise.
+    """
     env_path = _get_venv_path(envs_home, requirements)
-    create_directory(env_path)
-    venv(*[str(env_path)])
+    if is_venv_template_enabled():
+        try:
+            template_path = get_venv_template(
+                get_template_key(upgrade_python_package_version, local_installation_path),
+                lambda build_path: _bootstrap_venv(
+                    Path(build_path),
+                    upgrade_python_package_version,
+                    local_installation_path,
+                ),
+            )
+            return create_venv_from_template(str(env_path), template_path)
+        except Exception as e:
+            logging.warning(
+                f"Failed to create venv from template, bootstrapping it instead: {str(e)}"
+            )
+            if env_path.exists():
+                shutil.rmtree(env_path, onerror=on_rm_error)
+    return _bootstrap_venv(
+        env_path, upgrade_python_package_version, local_installation_path
+    )
+
+
+def _bootstrap_venv(
+    env_path: Path,
+    upgrade_python_package_version: Optional[str],
+    local_installation_path: Optional[str] = None,
+) -> str:
+    """Create a virtualenv with pip, setuptools and upgrade-python-package.
+
+    With uv, the venv is created by `uv venv` and pip is installed by `uv pip`
+    together with setuptools, so ensurepip is skipped. Phase timings of either
+    method are logged to compare them.
+    """
+    use_uv = _use_uv_bootstrap()
+    start_time = time.monotonic()
+    if use_uv:
+        env_path.parent.mkdir(parents=True, exist_ok=True)
+        uv_venv(str(env_path))
+    else:
+        create_directory(env_path)
+        venv(*[str(env_path)])
     py_executable = get_venv_executable(str(env_path))
-    ensure_pip(py_executable)
+    venv_time = time.monotonic()
+    if not use_uv:
+        ensure_pip(py_executable)
+    ensurepip_time = time.monotonic()
     install_system_dependencies(py_executable)
     install_upgrade_python_package(
         py_executable, upgrade_python_package_version, local_installation_path
     )
+    end_time = time.monotonic()
+    logging.info(
+        "venv bootstrap method=%s venv_s=%.2f ensurepip_s=%.2f install_s=%.2f duration_s=%.2f",
+        "uv" if use_uv else "stdlib",
+        venv_time - start_time,
+        ensurepip_time - venv_time,
+        end_time - ensurepip_time,
+        end_time - start_time,
+    )
 
     return py_executable
 
@@ -227,13 +402,17 @@ def temporary_upgrade_venv(venv_path: str, blue_green_deployment: bool) -> str:
 
     If blue_green_deployment is True, the original virtualenv is not replaced with the temporary virtualenv.
     In such a case, the temporary virtualenv is expected to be manually handled by the caller.
+
+    The temporary virtualenv is cloned with reflinks or hardlinks when the filesystem
+    supports them (see `venv_clone`), falling back to a full copy.
     """
     try:
         backup_venv_path = Path(str(venv_path) + "_green")
         if backup_venv_path.exists():
             shutil.rmtree(backup_venv_path, onerror=on_rm_error)
 
-        shutil.copytree(venv_path, str(backup_venv_path), symlinks=True)
+        with span("clone_venv"):
+            clone_venv(venv_path, str(backup_venv_path))
         yield get_venv_executable(backup_venv_path)
     except Exception as e:
         logging.error(f"Error occurred while creating temporary venv: {str(e)}")
@@ -243,6 +422,86 @@ def temporary_upgrade_venv(venv_path: str, blue_green_deployment: bool) -> str:
             shutil.rmtree(backup_venv_path, onerror=on_rm_error)
 
 
+def _get_available_versions(
+    package_name: str,
+    cloudsmith_url: Optional[str],
+    wheels_path: Optional[str],
+    update_from_local_wheels: Optional[bool],
+    py_executable: Optional[str] = None,
+) -> Optional[List["Version"]]:
+    """Return the versions an upgrade of `py_executable` could install, or None if
+    they cannot be determined without running the installer (e.g. pip-configured
+    index)."""
+    if update_from_local_wheels:
+        if not wheels_path:
+            return None
+        from upgrade.scripts.wheel_index import get_wheel_index
+
+        return get_wheel_index(wheels_path, py_executable).get_versions(package_name)
+    if cloudsmith_url:
+        return get_available_versions(package_name, cloudsmith_url)
+    return None
+
+
+@span("upgrade_check")
+def _is_upgrade_available(
+    py_executable: str,
+    requirements_obj: Any,
+    cloudsmith_url: Optional[str],
+    wheels_path: Optional[str],
+    update_from_local_wheels: Optional[bool],
+    additional_dependencies: List[str],
+) -> bool:
+    """Compare installed versions of the requirement and additional dependencies with
+    the latest compatible versions in the package index (or local wheels directory).
+
+    Returns True if anything can be upgraded or if it cannot be determined cheaply.
+    Only these packages are compared: a venv whose top-level packages are at their
+    latest versions is not upgraded even if newer versions of their transitive
+    dependencies are available, which `upgrade_venv` would otherwise install as it
+    upgrades with `update_all`.
+    """
+    from packaging.version import Version
+
+    prereleases = (
+        True
+        if not update_from_local_wheels and is_development_cloudsmith(cloudsmith_url)
+        else None
+    )
+    dependencies_objs = [requirements_obj] + [
+        to_requirements_obj(dependency) for dependency in additional_dependencies
+    ]
+    try:
+        for dependency_obj in dependencies_objs:
+            available_versions = _get_available_versions(
+                dependency_obj.name,
+                cloudsmith_url,
+                wheels_path,
+                update_from_local_wheels,
+                py_executable,
+            )
+            if available_versions is None:
+                return True
+            installed_version = is_package_already_installed(
+                dependency_obj.name, py_executable
+            )
+            if installed_version is None:
+                return True
+            compatible_versions = filter_versions(
+                dependency_obj.specifier, available_versions, prereleases
+            )
+            if any(
+                Version(version) > Version(installed_version)
+                for version in compatible_versions
+            ):
+                logging.debug("Upgrade available for %s", dependency_obj.name)
+                return True
+    except Exception as e:
+        logging.debug("Could not check for available upgrades: %s", e)
+        return True
+    return False
+
+
 def build_and_upgrade_venv(
     requirements: str,
     envs_home: str,
@@ -255,8 +514,13 @@ def build_and_upgrade_venv(
     upgrade_python_package_version: Optional[str] = None,
     log_location: Optional[str] = None,
     local_installation_path: Optional[str] = None,
+    single_resolution: Optional[bool] = False,
 ) -> str:
-    """Build and upgrade a virtualenv."""
+    """Build and upgrade a virtualenv.
+
+    With `single_resolution`, the requirement and additional dependencies are
+    installed in one installer run instead of one upgrade run per dependency.
+    """
     venv_path = str(_get_venv_path(envs_home, requirements))
     error_message = None
     requirements_obj = to_requirements_obj(requirements)
@@ -279,29 +543,58 @@ def build_and_upgrade_venv(
             logging.debug(msg)
             return py_executable
         _check_venv_consistent(requirements_obj, py_executable)
+        # blue-green callers expect the upgraded `_green` venv to be created
+        if not blue_green_deployment and not _is_upgrade_available(
+            py_executable,
+            requirements_obj,
+            cloudsmith_url,
+            wheels_path,
+            update_from_local_wheels,
+            additional_dependencies or [],
+        ):
+            msg = "No compatible upgrades available. Venv unchanged."
+            print(msg)
+            logging.debug(msg)
+            return py_executable, error_message
 
     if auto_upgrade:
         with temporary_upgrade_venv(
             venv_path, blue_green_deployment
         ) as temp_venv_executable:
             try:
-                response = upgrade_venv(
-                    temp_venv_executable,
-                    requirements_obj,
-                    cloudsmith_url,
-                    wheels_path,
-                    update_from_local_wheels,
-                    additional_dependencies or [],
-                    log_location,
-                )
-                logging.debug(response)
+                if single_resolution:
+                    upgrade_results = [
+                        upgrade_venv_single_resolution(
+                            temp_venv_executable,
+                            requirements_obj,
+                            cloudsmith_url,
+                            wheels_path,
+                            update_from_local_wheels,
+                            additional_dependencies or [],
+                        )
+                    ]
+                else:
+                    upgrade_results = upgrade_venv(
+                        temp_venv_executable,
+                        requirements_obj,
+                        cloudsmith_url,
+                        wheels_path,
+                        update_from_local_wheels,
+                        additional_dependencies or [],
+                    )
+                for upgrade_result in upgrade_results:
+                    logging.debug(json.dumps(upgrade_result.to_response()))
             except Exception as e:
                 logging.error(
                     f"Unexpected error occurred while upgrading {requirements_obj.name}{requirements_obj.specifier} {str(e)}"
                 )
                 raise UpgradeError(e)
 
-            _check_venv_consistent(requirements_obj, temp_venv_executable, response)
+            _check_venv_consistent(
+                requirements_obj,
+                temp_venv_executable,
+                "".join(upgrade_result.output for upgrade_result in upgrade_results),
+            )
             if not blue_green_deployment:
                 _switch_venvs(venv_path)
 
@@ -322,6 +615,7 @@ def manage_venv(
     blue_green_deployment: Optional[bool] = False,
     upgrade_python_package_version: Optional[str] = None,
     local_installation_path: Optional[str] = None,
+    single_resolution: Optional[bool] = False,
 ):
     response_status = {}
     start_time = time.monotonic()
@@ -334,51 +628,211 @@ def manage_venv(
         test=bool(test),
     )
 
-    try:
-        if requirements is None and requirements_file is None:
-            raise Exception("Either requirements or requirements_file is required.")
+    with record_spans() as spans, record_commands("manage_venv") as commands:
+        try:
+            if requirements is None and requirements_file is None:
+                raise Exception("Either requirements or requirements_file is required.")
 
-        if cloudsmith_url:
-            is_cloudsmith_url_valid(cloudsmith_url)
+            if cloudsmith_url:
+                is_cloudsmith_url_valid(cloudsmith_url)
+
+            requirements = requirements or parse_requirements_txt(requirements_file)
+            requirements_obj = to_requirements_obj(requirements)
+            package_name = requirements_obj.name
+            target = str(requirements_obj.specifier) or None
+
+            build_and_upgrade_venv(
+                requirements,
+                envs_home,
+                auto_upgrade,
+                cloudsmith_url,
+                wheels_path,
+                update_from_local_wheels,
+                additional_dependencies,
+                blue_green_deployment,
+                upgrade_python_package_version,
+                log_location,
+                local_installation_path,
+                single_resolution=single_resolution,
+            )
+            response_status["responseStatus"] = VenvUpgradeStatus.UPGRADED.value
+        except Exception:
+            logging.exception("manage_venv run failed")
+            response_status["responseStatus"] = VenvUpgradeStatus.ERROR.value
+            raise
+        finally:
+            status = response_status.get("responseStatus")
+            result = "upgraded" if status == VenvUpgradeStatus.UPGRADED.value else "errored"
+            log_run_summary(
+                script="manage_venv",
+                package=package_name,
+                current=None,
+                target=target,
+                final=None,
+                result=result,
+                duration_seconds=time.monotonic() - start_time,
+                extra_fields=commands.summary_fields(),
+                phase_durations=spans.durations,
+            )
 
-        requirements = requirements or parse_requirements_txt(requirements_file)
-        requirements_obj = to_requirements_obj(requirements)
-        package_name = requirements_obj.name
-        target = str(requirements_obj.specifier) or None
+            response_status["phaseDurations"] = spans.to_dict()
+            response = json.dumps(response_status)
+            print(response)
 
-        build_and_upgrade_venv(
-            requirements,
-            envs_home,
-            auto_upgrade,
-            cloudsmith_url,
-            wheels_path,
-            update_from_local_wheels,
-            additional_dependencies,
-            blue_green_deployment,
-            upgrade_python_package_version,
-            log_location,
-            local_installation_path,
-        )
-        response_status["responseStatus"] = VenvUpgradeStatus.UPGRADED.value
-    except Exception:
-        logging.exception("manage_venv run failed")
-        response_status["responseStatus"] = VenvUpgradeStatus.ERROR.value
-        raise
-    finally:
-        status = response_status.get("responseStatus")
-        result = "upgraded" if status == VenvUpgradeStatus.UPGRADED.value else "errored"
-        log_run_summary(
-            script="manage_venv",
-            package=package_name,
-            current=None,
-            target=target,
-            final=None,
-            result=result,
-            duration_seconds=time.monotonic() - start_time,
-        )
 
-        response = json.dumps(response_status)
-        print(response)
+def _init_worker_logging(log_location: Optional[str], test: bool) -> None:
+    configure_script_logging(
+        log_location=log_location,
+        default_log_location="/var/log/manage_venv.log",
+        test=test,
+    )
+
+
+def _manage_venv_worker(
+    requirements: str, build_kwargs: dict, trace_file: Optional[str] = None
+) -> dict:
+    """Build and upgrade one venv of a `manage_venvs` run, in a worker process.
+
+    Errors are reported in the returned status instead of being raised, so one
+    failing venv does not affect the others. The worker's commands are traced to
+    `trace_file` (see `command_ledger`), if given.
+    """
+    venv_status = {"requirements": requirements}
+    start_time = time.monotonic()
+    package_name = None
+    target = None
+    with record_spans() as spans, record_commands(
+        "manage_venv", trace_file=trace_file
+    ) as commands:
+        try:
+            requirements_obj = to_requirements_obj(requirements)
+            package_name = requirements_obj.name
+            target = str(requirements_obj.specifier) or None
+            build_and_upgrade_venv(requirements, **build_kwargs)
+            venv_status["responseStatus"] = VenvUpgradeStatus.UPGRADED.value
+        except Exception as e:
+            logging.exception("manage_venv run failed for %s", requirements)
+            venv_status["responseStatus"] = VenvUpgradeStatus.ERROR.value
+            venv_status["error"] = str(e)
+        finally:
+            status = venv_status.get("responseStatus")
+            log_run_summary(
+                script="manage_venv",
+                package=package_name,
+                current=None,
+                target=target,
+                final=None,
+                result="upgraded" if status == VenvUpgradeStatus.UPGRADED.value else "errored",
+                duration_seconds=time.monotonic() - start_time,
+                extra_fields={"requirements": requirements, **commands.summary_fields()},
+                phase_durations=spans.durations,
+            )
+            venv_status["phaseDurations"] = spans.to_dict()
+    return venv_status
+
+
+def read_requirements_batch_file(batch_file: str) -> List[str]:
+    """Read one requirement per line. Blank lines and `#` comments are ignored."""
+    with open(batch_file, "r") as batch_lines:
+        requirements_list = [line.split("#", 1)[0].strip() for line in batch_lines]
+    return [requirements for requirements in requirements_list if requirements]
+
+
+def manage_venvs(
+    envs_home: str,
+    requirements_list: List[str],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    auto_upgrade: bool = False,
+    cloudsmith_url: Optional[str] = None,
+    log_location: Optional[str] = None,
+    test: Optional[bool] = False,
+    update_from_local_wheels: Optional[bool] = False,
+    wheels_path: Optional[str] = None,
+    additional_dependencies: Optional[List[str]] = None,
+    blue_green_deployment: Optional[bool] = False,
+    upgrade_python_package_version: Optional[str] = None,
+    local_installation_path: Optional[str] = None,
+    single_resolution: Optional[bool] = False,
+) -> dict:
+    """Manage many venvs under `envs_home` in one invocation.
+
+    Every requirement is built/upgraded in its own worker process, at most
+    `max_workers` at a time, so total wall time approaches that of the slowest
+    venv. A combined status report is printed as JSON and returned; its
+    `responseStatus` is ERROR if any venv failed.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    start_time = time.monotonic()
+    response_status = {}
+
+    configure_script_logging(
+        log_location=log_location,
+        default_log_location="/var/log/manage_venv.log",
+        test=bool(test),
+    )
+
+    with record_commands("manage_venv") as commands:
+        try:
+            if cloudsmith_url:
+                is_cloudsmith_url_valid(cloudsmith_url)
+
+            build_kwargs = dict(
+                envs_home=envs_home,
+                auto_upgrade=auto_upgrade,
+                cloudsmith_url=cloudsmith_url,
+                wheels_path=wheels_path,
+                update_from_local_wheels=update_from_local_wheels,
+                additional_dependencies=additional_dependencies,
+                blue_green_deployment=blue_green_deployment,
+                upgrade_python_package_version=upgrade_python_package_version,
+                log_location=log_location,
+                local_installation_path=local_installation_path,
+                single_resolution=single_resolution,
+            )
+            # the same requirements map to the same venv directory
+            requirements_list = list(dict.fromkeys(requirements_list))
+            # workers trace their commands to files merged into this run's trace
+            trace_files = [commands.child_trace_file() for _ in requirements_list]
+            with ProcessPoolExecutor(
+                max_workers=max(1, min(max_workers, len(requirements_list) or 1)),
+                initializer=_init_worker_logging,
+                initargs=(log_location, bool(test)),
+            ) as executor:
+                venvs_status = list(
+                    executor.map(
+                        _manage_venv_worker,
+                        requirements_list,
+                        [build_kwargs] * len(requirements_list),
+                        trace_files,
+                    )
+                )
+            for trace_file in trace_files:
+                commands.merge_child_trace(trace_file)
+            failed = any(
+                venv_status["responseStatus"] == VenvUpgradeStatus.ERROR.value
+                for venv_status in venvs_status
+            )
+            response_status["responseStatus"] = (
+                VenvUpgradeStatus.ERROR.value if failed else VenvUpgradeStatus.UPGRADED.value
+            )
+            response_status["venvs"] = venvs_status
+        except Exception:
+            logging.exception("manage_venv batch run failed")
+            response_status["responseStatus"] = VenvUpgradeStatus.ERROR.value
+            raise
+        finally:
+            logging.info(
+                "batch summary script=manage_venv venvs=%s failed=%s duration_s=%.2f",
+                len(response_status.get("venvs", [])),
+                sum(
+                    venv_status["responseStatus"] == VenvUpgradeStatus.ERROR.value
+                    for venv_status in response_status.get("venvs", [])
+                ),
+                time.monotonic() - start_time,
+            )
+            print(json.dumps(response_status))
+    return response_status
 
 
 parser = argparse.ArgumentParser()
@@ -462,10 +916,36 @@ parser.add_argument(
     default=None,
     help="Path to the local unreleased upgrade-python-package directory to install in editable mode.",
 )
+parser.add_argument(
+    "--batch-file",
+    action="store",
+    type=str,
+    default=None,
+    help="File with one requirement per line. Every venv is managed concurrently "
+    + "and a combined JSON status report is printed.",
+)
+parser.add_argument(
+    "--all-venvs",
+    action="store_true",
+    help="Manage every existing venv under --envs-home, using venv directory names "
+    + "as requirements.",
+)
+parser.add_argument(
+    "--max-workers",
+    action="store",
+    type=int,
+    default=DEFAULT_MAX_WORKERS,
+    help="Maximum number of venvs managed concurrently with --batch-file or --all-venvs.",
+)
+parser.add_argument(
+    "--single-resolution",
+    action="store_true",
+    help="Resolve and install the requirements and additional dependencies in one "
+    + "installer run, followed by a single dependency check.",
+)
 
 
-def main():
-    parsed_args = parser.parse_args()
+def run_parsed_args(parsed_args):
     requirements = parsed_args.requirements
     requirements_file = parsed_args.requirements_file
     envs_home = parsed_args.envs_home
@@ -479,6 +959,31 @@ def main():
     blue_green_deployment = parsed_args.blue_green_deployment
     upgrade_python_package_version = parsed_args.upgrade_python_package_version
     local_installation_path = parsed_args.local_installation_path
+    if parsed_args.batch_file or parsed_args.all_venvs:
+        requirements_list = []
+        if parsed_args.all_venvs:
+            requirements_list.extend(
+                venv_path.name for venv_path in list_managed_venvs(envs_home)
+            )
+        if parsed_args.batch_file:
+            requirements_list.extend(read_requirements_batch_file(parsed_args.batch_file))
+        manage_venvs(
+            envs_home=envs_home,
+            requirements_list=requirements_list,
+            max_workers=parsed_args.max_workers,
+            auto_upgrade=auto_upgrade,
+            cloudsmith_url=cloudsmith_url,
+            log_location=log_location,
+            test=test,
+            update_from_local_wheels=update_from_local_wheels,
+            wheels_path=wheels_path,
+            additional_dependencies=additional_dependencies,
+            blue_green_deployment=blue_green_deployment,
+            upgrade_python_package_version=upgrade_python_package_version,
+            local_installation_path=local_installation_path,
+            single_resolution=parsed_args.single_resolution,
+        )
+        return
     manage_venv(
         envs_home=envs_home,
         requirements=requirements,
@@ -493,8 +998,17 @@ def main():
         blue_green_deployment=blue_green_deployment,
         upgrade_python_package_version=upgrade_python_package_version,
         local_installation_path=local_installation_path,
+        single_resolution=parsed_args.single_resolution,
     )
 
 
+def main():
+    parsed_args = parser.parse_args()
+    exit_code = run_in_agent("manage_venv", parsed_args)
+    if exit_code is not None:
+        sys.exit(exit_code)
+    run_parsed_args(parsed_args)
+
+
 if __name__ == "__main__":
     main()
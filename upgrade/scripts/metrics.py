@@ -0,0 +1,189 @@
+"""Prometheus textfile-collector export of run summaries.
+
+When UPGRADE_METRICS_DIR is set (usually the `--collector.textfile.directory`
+of node_exporter), every run summary also replaces a `.prom` file in that
+directory with metrics of the last run:
+
+    upgrade_python_package_last_run_timestamp_seconds
+    upgrade_python_package_last_run_duration_seconds
+    upgrade_python_package_last_run_success
+    upgrade_python_package_last_run_result{result="..."}
+    upgrade_python_package_last_run_phase_duration_seconds{phase="..."}
+    upgrade_python_package_last_run_<field>          (numeric summary fields)
+    upgrade_python_package_index_cache_hit_ratio
+    upgrade_python_package_version_info{current="...",target="...",final="..."}
+
+All metrics are labeled with `script`, `package` and `venv`. `venv` is the
+`requirements` or `venv` summary field of runs that handle one of many venvs
+(and empty otherwise); each venv gets a separate file. The label names are the
+same in every file, as node_exporter rejects metric families whose label names
+differ. Files are written to a temporary file and renamed into place,
+so the collector never reads a partial file.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "upgrade_python_package"
+FAILED_RESULTS = ("errored", "upgrade_failed")
+
+
+def get_metrics_dir() -> Optional[Path]:
+    metrics_dir = os.environ.get("UPGRADE_METRICS_DIR")
+    return Path(metrics_dir) if metrics_dir else None
+
+
+def _escape_label_value(value: object) -> str:
+    return (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    return ",".join(
+        f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()
+    )
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _is_number(value: object) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _get_labels(
+    script: str, package: Optional[str], extra_fields: Dict[str, object]
+) -> Dict[str, object]:
+    venv = extra_fields.get("requirements") or extra_fields.get("venv") or ""
+    return {"script": script, "package": package or "unknown", "venv": venv}
+
+
+def _get_metrics_path(metrics_dir: Path, labels: Dict[str, object]) -> Path:
+    name = _metric_name(f"{labels['script']}_{labels['package']}")
+    if labels["venv"]:
+        key = hashlib.sha256(str(labels["venv"]).encode("utf-8")).hexdigest()
+        name += f"_{key[:8]}"
+    return metrics_dir / f"{name}.prom"
+
+
+def format_run_metrics(
+    *,
+    script: str,
+    package: Optional[str],
+    current: Optional[object],
+    target: Optional[object],
+    final: Optional[object],
+    result: str,
+    duration_seconds: float,
+    extra_fields: Optional[Dict[str, object]] = None,
+    phase_durations: Optional[Dict[str, float]] = None,
+    timestamp: Optional[float] = None,
+) -> str:
+    """Return the metrics of one run in the Prometheus text format."""
+    extra_fields = extra_fields or {}
+    labels = _get_labels(script, package, extra_fields)
+
+    lines: List[str] = []
+
+    def add(name, help_text, samples):
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for sample_labels, value in samples:
+            lines.append(f"{metric}{{{_format_labels({**labels, **sample_labels})}}} {value}")
+
+    add(
+        "last_run_timestamp_seconds",
+        "Unix time the last run finished.",
+        [({}, f"{timestamp if timestamp is not None else time.time():.3f}")],
+    )
+    add(
+        "last_run_duration_seconds",
+        "Duration of the last run.",
+        [({}, f"{duration_seconds:.3f}")],
+    )
+    add(
+        "last_run_success",
+        "1 if the last run did not fail.",
+        [({}, 0 if result in FAILED_RESULTS else 1)],
+    )
+    add("last_run_result", "Result of the last run.", [({"result": result}, 1)])
+    if phase_durations:
+        add(
+            "last_run_phase_duration_seconds",
+            "Duration of each phase of the last run.",
+            [
+                ({"phase": phase}, f"{seconds:.3f}")
+                for phase, seconds in phase_durations.items()
+            ],
+        )
+    for key, value in extra_fields.items():
+        if _is_number(value):
+            add(f"last_run_{_metric_name(key)}", f"{key} of the last run.", [({}, value)])
+    hits = extra_fields.get("index_cache_hits")
+    misses = extra_fields.get("index_cache_misses")
+    if _is_number(hits) and _is_number(misses) and hits + misses:
+        add(
+            "index_cache_hit_ratio",
+            "Package index cache hit ratio of the last run.",
+            [({}, f"{hits / (hits + misses):.3f}")],
+        )
+    add(
+        "version_info",
+        "Package versions before, requested by and after the last run.",
+        [
+            (
+                {
+                    "current": current or "",
+                    "target": target or "",
+                    "final": final or "",
+                },
+                1,
+            )
+        ],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_run_metrics(**summary) -> Optional[Path]:
+    """Write the metrics of one run to UPGRADE_METRICS_DIR, if it is set.
+
+    Accepts the keyword arguments of `log_run_summary`. Failures are logged and
+    never raised, so metrics cannot fail a run. Returns the written file.
+    """
+    metrics_dir = get_metrics_dir()
+    if metrics_dir is None:
+        return None
+    try:
+        content = format_run_metrics(**summary)
+        labels = _get_labels(
+            summary["script"], summary.get("package"), summary.get("extra_fields") or {}
+        )
+        metrics_path = _get_metrics_path(metrics_dir, labels)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        # the collector only reads `*.prom` files, so the temporary file is skipped
+        fd, tmp_path = tempfile.mkstemp(
+            dir=str(metrics_dir), prefix=f".{metrics_path.stem}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as tmp_file:
+                tmp_file.write(content)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, str(metrics_path))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return metrics_path
+    except Exception as e:
+        logger.warning("Failed to write run metrics to %s: %s", metrics_dir, e)
+        return None
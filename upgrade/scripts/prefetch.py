@@ -0,0 +1,319 @@
+"""Concurrent prefetch of the wheels an install is going to use.
+
+Installs from the package index download every wheel serially inside the
+installer. Before such an install, the installer arguments are resolved with
+`pip install --dry-run --report`, which lists every distribution the install
+would change together with its download URL and hash. Those wheels are
+downloaded concurrently into a staging directory of the target environment,
+after which the install runs offline (`--no-index --find-links <staging>`).
+
+Every run stages into a directory of its own under the staging directory of
+the environment, so concurrent runs for the same environment do not remove each
+other's downloads. Downloads are written to `<wheel>.part` files and resumed
+with HTTP range requests when a transfer is interrupted. Every wheel is checked
+against the sha256 hash from the report before it is staged. If the install
+cannot be resolved up front (e.g. pip is older than 22.2 or a distribution is
+only available as an sdist) or a download fails, the install falls back to
+downloading from the index as before. Once the install is done, the staged
+wheels are moved to the host wheelhouse.
+
+The dry run only needs package metadata; indexes that serve it separately
+(PEP 658) are not asked for the wheels themselves until the prefetch. If the
+report lists nothing to install, the install itself is skipped instead of
+resolving the same requirements a second time.
+
+Prefetching is skipped when uv is available, since `uv pip` already downloads
+concurrently.
+
+Defaults can be overridden with:
+- UPGRADE_PREFETCH_DIR
+- UPGRADE_PREFETCH_MAX_WORKERS
+- UPGRADE_PREFETCH_DISABLED
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+from upgrade.scripts import http_client
+from upgrade.scripts.logging_config import bind_job_logging
+from upgrade.scripts.spans import span
+from upgrade.scripts.utils import is_uv_available
+from upgrade.scripts.wheelhouse import CHUNK_SIZE, file_sha256, get_wheelhouse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+DOWNLOAD_ATTEMPTS = 3
+PART_SUFFIX = ".part"
+# staging directories of runs that were killed before removing them
+STALE_STAGING_SECONDS = 24 * 60 * 60
+
+
+def _default_prefetch_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "upgrade-python-package" / "prefetch"
+
+
+def _get_max_workers() -> int:
+    try:
+        return max(1, int(os.environ.get("UPGRADE_PREFETCH_MAX_WORKERS", DEFAULT_MAX_WORKERS)))
+    except ValueError as e:
+        logger.warning("Invalid prefetch max workers, using default: %s", e)
+        return DEFAULT_MAX_WORKERS
+
+
+def get_staging_dir(py_executable: Optional[str] = None) -> Path:
+    """Return the staging directory of the environment of `py_executable`.
+
+    Runs stage their wheels in directories of their own created inside it.
+    """
+    executable = os.path.abspath(py_executable or sys.executable)
+    key = hashlib.sha256(executable.encode("utf-8")).hexdigest()
+    prefetch_dir = os.environ.get("UPGRADE_PREFETCH_DIR") or _default_prefetch_dir()
+    return Path(prefetch_dir) / key[:16]
+
+
+@dataclass
+class WheelDownload:
+    """A wheel the install is going to use, as listed in the installation report."""
+
+    name: str
+    version: str
+    url: str
+    sha256: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        return unquote(urlsplit(self.url).path.rsplit("/", 1)[-1])
+
+
+@dataclass
+class StagedWheels:
+    """Wheels staged for an offline install.
+
+    No wheels means the installation report lists nothing to install.
+    """
+
+    path: Optional[Path] = None
+    wheels: List[WheelDownload] = field(default_factory=list)
+
+    def find_links_args(self) -> List[str]:
+        return ["--no-index", "--find-links", str(self.path)]
+
+    def release(self) -> None:
+        """Move the staged wheels to the wheelhouse and remove the staging directory."""
+        if self.path is None:
+            return
+        wheelhouse = get_wheelhouse()
+        if wheelhouse is not None:
+            for wheel in self.wheels:
+                try:
+                    wheelhouse.add(str(self.path / wheel.filename), wheel.sha256)
+                except OSError as e:
+                    logger.debug("Failed to add %s to wheelhouse: %s", wheel.filename, e)
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _get_sha256(download_info: dict) -> Optional[str]:
+    archive_info = download_info.get("archive_info") or {}
+    sha256 = (archive_info.get("hashes") or {}).get("sha256")
+    if sha256 is None and str(archive_info.get("hash", "")).startswith("sha256="):
+        sha256 = archive_info["hash"][len("sha256="):]
+    return sha256
+
+
+def _with_index_credentials(url: str, index_url: Optional[str]) -> str:
+    """pip redacts credentials in the report; add those of the index back if the
+    wheel is hosted on the same host."""
+    if not index_url:
+        return url
+    index_parts = urlsplit(index_url)
+    url_parts = urlsplit(url)
+    if (
+        index_parts.username is None
+        or url_parts.username is not None
+        or url_parts.hostname != index_parts.hostname
+    ):
+        return url
+    userinfo = index_parts.netloc.rsplit("@", 1)[0]
+    return urlunsplit(url_parts._replace(netloc=f"{userinfo}@{url_parts.netloc}"))
+
+
+def resolve_wheel_downloads(
+    install_args: List[str],
+    py_executable: Optional[str] = None,
+    index_url: Optional[str] = None,
+) -> Optional[List[WheelDownload]]:
+    """Return the wheels `installer(*install_args)` would install, or None if
+    they cannot all be prefetched. An empty list means nothing would change."""
+    from upgrade.scripts.utils import pip
+
+    report_dir = tempfile.mkdtemp(prefix="upgrade-prefetch-")
+    report_path = os.path.join(report_dir, "report.json")
+    try:
+        pip(
+            "install",
+            "--dry-run",
+            "--quiet",
+            "--report",
+            report_path,
+            *install_args[1:],
+            py_executable=py_executable,
+        )
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+    except Exception as e:
+        logger.debug("Failed to resolve wheels to prefetch: %s", e)
+        return None
+    finally:
+        shutil.rmtree(report_dir, ignore_errors=True)
+
+    downloads = []
+    for item in report.get("install", []):
+        download_info = item.get("download_info") or {}
+        metadata = item.get("metadata") or {}
+        url = download_info.get("url", "")
+        wheel = WheelDownload(
+            name=metadata.get("name", ""),
+            version=metadata.get("version", ""),
+            url=_with_index_credentials(url, index_url),
+            sha256=_get_sha256(download_info),
+        )
+        if "archive_info" not in download_info or not wheel.filename.endswith(".whl"):
+            logger.debug("Not prefetching %s: not a wheel", url)
+            return None
+        if not url.startswith("file:") and wheel.sha256 is None:
+            logger.debug("Not prefetching %s: no sha256 hash", url)
+            return None
+        downloads.append(wheel)
+    return downloads
+
+
+def _download(wheel: WheelDownload, staging_dir: Path) -> int:
+    """Download `wheel` into `staging_dir`, resuming a partial download.
+
+    Return the number of bytes transferred.
+    """
+    wheel_path = staging_dir / wheel.filename
+    if wheel_path.exists() and (wheel.sha256 is None or file_sha256(wheel_path) == wheel.sha256):
+        return 0
+
+    part_path = wheel_path.with_name(wheel_path.name + PART_SUFFIX)
+    if wheel.url.startswith("file:"):
+        from urllib.request import url2pathname
+
+        shutil.copyfile(url2pathname(urlsplit(wheel.url).path), str(part_path))
+        transferred = part_path.stat().st_size
+    else:
+        transferred = 0
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                with http_client.request(
+                    "GET", wheel.url, headers=headers, stream=True
+                ) as response:
+                    if response.status_code == 416:
+                        # the partial download is complete (or larger than the wheel)
+                        break
+                    response.raise_for_status()
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    with open(str(part_path), mode) as part_file:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            part_file.write(chunk)
+                            transferred += len(chunk)
+                break
+            except Exception as e:
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    raise
+                logger.debug("Resuming download of %s after error: %s", wheel.filename, e)
+
+    if wheel.sha256 is not None and file_sha256(part_path) != wheel.sha256:
+        part_path.unlink()
+        raise ValueError(f"Hash of downloaded wheel {wheel.filename} does not match")
+    os.replace(str(part_path), str(wheel_path))
+    return transferred
+
+
+def download_wheels(
+    wheels: List[WheelDownload],
+    staging_dir: Path,
+    max_workers: Optional[int] = None,
+) -> int:
+    """Download `wheels` into `staging_dir` with at most `max_workers` threads.
+
+    Return the number of bytes transferred.
+    """
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers or _get_max_workers()) as executor:
+        download = bind_job_logging(_download)
+        futures = [executor.submit(download, wheel, staging_dir) for wheel in wheels]
+        # wait for every download before failing, so none writes to a removed directory
+        errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return sum(future.result() for future in futures)
+
+
+def _remove_stale_staging_dirs(staging_root: Path) -> None:
+    now = time.time()
+    for path in staging_root.iterdir():
+        try:
+            if now - path.stat().st_mtime > STALE_STAGING_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def prefetch_wheels(
+    install_args: List[str],
+    py_executable: Optional[str] = None,
+    index_url: Optional[str] = None,
+) -> Optional[StagedWheels]:
+    """Stage the wheels `installer(*install_args)` would download.
+
+    Return the staged wheels, which are empty if the install would not change
+    anything, or None if the install should download from the index itself.
+    """
+    if os.environ.get("UPGRADE_PREFETCH_DISABLED") or is_uv_available():
+        return None
+    start_time = time.monotonic()
+    with span("prefetch_resolve"):
+        wheels = resolve_wheel_downloads(install_args, py_executable, index_url)
+    if wheels is None:
+        return None
+    if not wheels:
+        return StagedWheels()
+    staging_root = get_staging_dir(py_executable)
+    staging_dir = None
+    try:
+        staging_root.mkdir(parents=True, exist_ok=True)
+        _remove_stale_staging_dirs(staging_root)
+        staging_dir = Path(tempfile.mkdtemp(dir=str(staging_root)))
+        with span("prefetch_download"):
+            transferred = download_wheels(wheels, staging_dir)
+    except Exception as e:
+        logger.warning("Failed to prefetch wheels, installing from the index: %s", e)
+        if staging_dir is not None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return None
+    logger.debug(
+        "Prefetched wheels=%s bytes=%s staging_dir=%s duration_s=%.2f",
+        len(wheels),
+        transferred,
+        staging_dir,
+        time.monotonic() - start_time,
+    )
+    return StagedWheels(staging_dir, wheels)
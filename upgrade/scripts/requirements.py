@@ -1,6 +1,6 @@
 import logging
 
-from typing import Any, List
+from typing import Any, List, Optional
 from pathlib import Path
 
 from upgrade.scripts.exceptions import RequiredArgumentMissing
@@ -9,9 +9,10 @@ logger = logging.getLogger(__name__)
 
 
 def filter_versions(
-    specifier_set: Any, parsed_packages_versions: List[Any]
+    specifier_set: Any, parsed_packages_versions: List[Any], prereleases: Optional[bool] = None
 ) -> List[str]:
     """Returns a list of versions that are compatible with the `SpecifierSet`.
+    `prereleases` overrides whether pre-release versions are allowed.
 
     See https://packaging.pypa.io/en/latest/specifiers.html#specifiers for more details.
 
@@ -22,7 +23,10 @@ def filter_versions(
         SpecifierSet("==2.5.14").filter(["2.5.14", "2.5.15", "2.6.0", "3.0.0"])
         returns ["2.5.14"]
     """
-    return [str(version) for version in specifier_set.filter(parsed_packages_versions)]
+    return [
+        str(version)
+        for version in specifier_set.filter(parsed_packages_versions, prereleases=prereleases)
+    ]
 
 
 def parse_requirements_txt(
@@ -1,8 +1,7 @@
 import os
 
-import requests
-
 from .exceptions import SlackError
+from .http_client import request
 
 
 class SlackNotifier:
@@ -11,7 +10,7 @@ class SlackNotifier:
 
     def post_message(self, header, text):
         data = f'{{"attachments": [{{"color": "danger", "pretext": "*{header}*", "text":"{text}"}}]}}'
-        return requests.post(self.url, data=data)
+        return request("POST", self.url, data=data)
 
 
 def send_slack_notification(header, text, token):
@@ -0,0 +1,60 @@
+"""Per-phase timings of a run, reported in the run summary.
+
+A script run collects timings with `record_spans()`; code anywhere below it
+marks a phase with `span(name)`, used as a context manager or decorator:
+
+    with record_spans() as spans:
+        with span("validate_url"):
+            ...
+    log_run_summary(..., phase_durations=spans.durations)
+
+Phases of the same name are summed, e.g. the installer runs of every dependency
+count towards `install`. Nested phases are recorded independently, so their
+durations can overlap. Outside of `record_spans()`, `span` only reads the clock.
+Timings are collected per context, so threads started by a run do not record
+into it.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator
+
+_recorder = ContextVar("upgrade_span_recorder", default=None)
+
+
+class SpanRecorder:
+    """Durations (in seconds) of the named phases of one run, in order of first use."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def to_dict(self) -> Dict[str, float]:
+        """Return the durations rounded to milliseconds, for JSON output."""
+        return {name: round(seconds, 3) for name, seconds in self.durations.items()}
+
+
+@contextmanager
+def record_spans() -> Iterator[SpanRecorder]:
+    """Collect the phases of the enclosed code in a new `SpanRecorder`."""
+    recorder = SpanRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the duration of the enclosed code as phase `name`."""
+    start_time = time.monotonic()
+    try:
+        yield
+    finally:
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.add(name, time.monotonic() - start_time)
@@ -0,0 +1,127 @@
+"""Drive package upgrades of any python environment from the calling process.
+
+`upgrade_package` performs the same upgrade as
+`python -m upgrade.scripts.upgrade_python_package <package> --skip-post-install
+--format-output`, but against an arbitrary `py_executable`: version lookups and
+package snapshots are read in-process and only the installer runs as a
+subprocess of the target interpreter. The outcome is returned as an
+`UpgradeResult` instead of JSON printed to stdout.
+
+Post-install modules are never run, since they have to be imported by the
+target interpreter; use the CLI for that.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from upgrade.scripts.upgrade_python_package import (
+    _get_installed_packages_snapshot,
+    _get_updated_packages,
+    attempt_to_install_version,
+    attempt_upgrade,
+    split_package_name_and_extra,
+    upgrade_from_local_wheel,
+)
+from upgrade.scripts.utils import is_package_already_installed
+
+DEFAULT_WHEELS_PATH = "/vagrant/wheels"
+
+
+@dataclass
+class UpgradeResult:
+    """Outcome of one upgrade run.
+
+    `result` is one of `upgraded`, `unchanged`, `upgrade_failed` or `errored`,
+    same as in the run summary. `packages` holds the before/after version of every
+    requested package and `updated_packages` every distribution the run changed.
+    """
+
+    result: str
+    output: str = ""
+    packages: List[Dict[str, Optional[str]]] = field(default_factory=list)
+    updated_packages: List[Dict[str, Optional[str]]] = field(default_factory=list)
+
+    @property
+    def success(self) -> bool:
+        return self.result == "upgraded"
+
+    def to_response(self) -> dict:
+        """Return the `--format-output` JSON response of the upgrade."""
+        return {
+            "success": self.success,
+            "responseOutput": self.output,
+            "packages": self.packages,
+            "updatedPackages": self.updated_packages,
+        }
+
+
+def upgrade_package(
+    py_executable: str,
+    package: str,
+    version: Optional[str] = None,
+    cloudsmith_url: Optional[str] = None,
+    wheels_path: Optional[str] = None,
+    update_from_local_wheels: Optional[bool] = False,
+    update_all: Optional[bool] = False,
+    slack_webhook_url: Optional[str] = None,
+    constraints_path: Optional[str] = None,
+) -> UpgradeResult:
+    """Upgrade `package` in the environment of `py_executable`.
+
+    Errors are reported as an `errored` result instead of being raised, same as
+    the CLI does with `--format-output`.
+    """
+    package_name, _ = split_package_name_and_extra(package)
+    before_snapshot = _get_installed_packages_snapshot(py_executable)
+    before_version = is_package_already_installed(package_name, py_executable)
+    try:
+        if update_from_local_wheels:
+            result, output = upgrade_from_local_wheel(
+                package,
+                True,
+                cloudsmith_url=cloudsmith_url,
+                wheels_path=wheels_path or DEFAULT_WHEELS_PATH,
+                update_all=update_all,
+                version=version,
+                constraints_path=constraints_path,
+                py_executable=py_executable,
+            )
+        elif version is not None:
+            was_updated, output = attempt_to_install_version(
+                package,
+                version,
+                cloudsmith_url,
+                update_all,
+                slack_webhook_url,
+                constraints_path,
+                py_executable=py_executable,
+            )
+            result = "upgraded" if was_updated else "upgrade_failed"
+        else:
+            was_updated, output = attempt_upgrade(
+                package,
+                cloudsmith_url,
+                update_all,
+                slack_webhook_url,
+                constraints_path,
+                py_executable=py_executable,
+            )
+            result = "upgraded" if was_updated else "unchanged"
+    except Exception as e:
+        logging.exception("Upgrade failed package=%s executable=%s", package, py_executable)
+        result, output = "errored", str(e)
+
+    after_snapshot = _get_installed_packages_snapshot(py_executable)
+    return UpgradeResult(
+        result=result,
+        output=output or "",
+        packages=[
+            {
+                "package": package_name,
+                "from": before_version,
+                "to": is_package_already_installed(package_name, py_executable),
+            }
+        ],
+        updated_packages=_get_updated_packages(before_snapshot, after_snapshot),
+    )
@@ -1,21 +1,27 @@
 import argparse
-import glob
 import json
 import logging
 import os
 import site
+import sys
 import time
 from importlib import util
 from pathlib import Path
 from typing import Optional
 
-from packaging.specifiers import SpecifierSet
-from packaging.utils import parse_wheel_filename
-
+from upgrade.scripts.agent import main as agent_main, run_in_agent
+from upgrade.scripts.command_ledger import record_commands
+from upgrade.scripts.dependency_check import check_dependencies
+from upgrade.scripts.distributions import (
+    diff_snapshots,
+    get_site_packages_dirs,
+    snapshot_site_packages,
+)
 from upgrade.scripts.exceptions import PipFormatDecodeFailed
 from upgrade.scripts.logging_config import configure_script_logging, log_run_summary
-from upgrade.scripts.requirements import filter_versions
+from upgrade.scripts.prefetch import prefetch_wheels
 from upgrade.scripts.slack import send_slack_notification
+from upgrade.scripts.spans import record_spans, span
 from upgrade.scripts.utils import (
     is_development_cloudsmith,
     is_package_already_installed,
@@ -25,6 +31,7 @@ from upgrade.scripts.utils import (
     run_python_module,
 )
 from upgrade.scripts.validations import is_cloudsmith_url_valid
+from upgrade.scripts.wheelhouse import get_find_links_args
 
 DIST_INFO_RE_FORMAT = r"^{package_name}-.+\.dist-info$"
 PYTHON_VERSION_RE = r"^python3.[0-9]+$"
@@ -122,6 +129,21 @@ def get_constraints_file_path(package_name, site_packages_dir=None):
     return None
 
 
+def _get_venv_constraints_file_path(package_name, py_executable=None):
+    """
+    Find the path to the constraints file in the site-packages of `py_executable`.
+    Falls back to `get_constraints_file_path` for the running interpreter.
+    """
+    if py_executable is None:
+        return get_constraints_file_path(package_name)
+    for site_packages_dir in get_site_packages_dirs(py_executable) or []:
+        for module_name in ("oll", package_name.replace("-", "_")):
+            constraints_file_path = site_packages_dir / module_name / "constraints.txt"
+            if constraints_file_path.exists():
+                return str(constraints_file_path)
+    return None
+
+
 def get_log_file_path():
     """Get the path to the log file."""
     try:
@@ -159,6 +181,7 @@ def install_with_constraints(
     local=False,
     wheels_dir=None,
     *args,
+    py_executable=None,
 ):
     """
     Install a wheel with constraints. If there is no constraints file, then install it without constraints.
@@ -185,6 +208,8 @@ def install_with_constraints(
                     wheels_dir,
                 ]
             )
+        else:
+            install_args.extend(get_find_links_args())
         if cloudsmith_url:
             install_args.extend(
                 [
@@ -195,7 +220,8 @@ def install_with_constraints(
                 ]
             )
         install_args.extend(args)
-        resp = installer(*install_args)
+        with span("install"):
+            resp = installer(*install_args, py_executable=py_executable)
         return resp
     except Exception:
         logging.exception("Failed to install wheel %s", wheel_path)
@@ -213,32 +239,29 @@ def install_wheel(
     slack_webhook_url=None,
     constraints_path=None,
     *args,
+    py_executable=None,
 ):
     """
     Try to install a wheel with no-deps and if there are no broken dependencies, pass it.
     If there are broken dependencies, try to install it with constraints.
     """
+    from packaging.specifiers import SpecifierSet
+
+    from upgrade.scripts.wheel_index import get_wheel_index
+
     resp = ""
     package_name, extra = split_package_name_and_extra(package_name)
     if local:
         try:
-            wheel_paths = sorted(
-                glob.glob(
-                    f"{wheels_path}/{package_name.replace('-', '_').replace('==', '-')}*.whl"
-                )
+            name, _, pinned_version = package_name.partition("==")
+            specifier = SpecifierSet(version_cmd or "")
+            if pinned_version:
+                specifier &= SpecifierSet(f"=={pinned_version}")
+            wheel = get_wheel_index(wheels_path, py_executable).find_wheel(
+                name, specifier
             )
-            wheel_names = [Path(path).name for path in wheel_paths]
-            parsed_wheel_versions = [
-                str(parse_wheel_filename(wheel_name)[1]) for wheel_name in wheel_names
-            ]
-            wheel_mapping = {k: v for (k, v) in zip(parsed_wheel_versions, wheel_paths)}
-            if version_cmd is not None:
-                versions = filter_versions(
-                    SpecifierSet(version_cmd), parsed_wheel_versions
-                )
-                wheel = wheel_mapping.get(versions[-1])
-            else:
-                wheel = parsed_wheel_versions[-1]
+            if wheel is None:
+                raise IndexError(f"No wheel of {package_name} matches {specifier}")
         except IndexError:
             logging.error("Wheel %s not found", package_name)
             print(f"Wheel {package_name} not found")
@@ -256,7 +279,7 @@ def install_wheel(
         )
 
     try:
-        version = is_package_already_installed(package_name)
+        version = is_package_already_installed(package_name, py_executable)
     except PipFormatDecodeFailed as e:
         msg = (
             "Something went wrong with pip.\n"
@@ -265,21 +288,45 @@ def install_wheel(
         msg += str(e)
         raise msg
 
-    install_args = ["install", to_install]
-
-    if cloudsmith_url is not None:
-        install_args.extend(["--index-url", cloudsmith_url])
-    if not update_all:
-        install_args.extend(["--no-deps"])
-    if args:
-        install_args.extend(args)
+    index_args = ["--index-url", cloudsmith_url] if cloudsmith_url is not None else []
+    # installs from the index consult the host wheelhouse
+    find_links_args = [] if local else get_find_links_args()
+    install_options = [] if update_all else ["--no-deps"]
+    install_options.extend(args)
+    install_args = ["install", to_install, *index_args, *find_links_args, *install_options]
+    # a requested version that is already installed needs no downloads, so the
+    # installer resolves it once instead of after a dry run
+    is_target_installed = (
+        not update_all
+        and "--upgrade" not in install_options
+        and _is_version_satisfied(version, version_cmd)
+    )
+    # download the wheels concurrently up front and install offline from them
+    staged_wheels = (
+        None
+        if local or is_target_installed
+        else prefetch_wheels(install_args, py_executable, cloudsmith_url)
+    )
+    if staged_wheels is not None:
+        install_args = [
+            "install",
+            to_install,
+            *staged_wheels.find_links_args(),
+            *find_links_args,
+            *install_options,
+        ]
     try:
-        resp += installer(*install_args)
-        resp += pip("check")
+        if staged_wheels is not None and not staged_wheels.wheels:
+            logging.debug("Nothing to install for %s", to_install)
+        else:
+            with span("install"):
+                resp += installer(*install_args, py_executable=py_executable)
+        with span("dependency_check"):
+            resp += check_dependencies(py_executable)
     except:
         # try to install with constraints
-        constraints_file_path = constraints_path or get_constraints_file_path(
-            package_name
+        constraints_file_path = constraints_path or _get_venv_constraints_file_path(
+            package_name, py_executable
         )
         try:
             resp += install_with_constraints(
@@ -289,6 +336,7 @@ def install_wheel(
                 local,
                 wheels_path,
                 *args,
+                py_executable=py_executable,
             )
         except:
             if slack_webhook_url is not None:
@@ -309,14 +357,30 @@ def install_wheel(
                 if local:
                     reinstall_args.extend(["--find-links", wheels_path])
                 else:
-                    if cloudsmith_url:
-                        reinstall_args.extend(["--index-url", cloudsmith_url])
-                installer(*reinstall_args)
+                    reinstall_args.extend(index_args)
+                    reinstall_args.extend(find_links_args)
+                with span("install"):
+                    installer(*reinstall_args, py_executable=py_executable)
             else:
                 raise
+    finally:
+        if staged_wheels is not None:
+            # adds the prefetched wheels to the host wheelhouse
+            staged_wheels.release()
     return resp
 
 
+def _is_version_satisfied(version, version_cmd):
+    if version is None or version_cmd is None:
+        return False
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+
+    try:
+        return SpecifierSet(version_cmd).contains(version, prereleases=True)
+    except InvalidSpecifier:
+        return False
+
+
 def _normalize_version_spec(version: Optional[str]) -> Optional[str]:
     if version is None:
         return version
@@ -337,6 +401,7 @@ def upgrade_from_local_wheel(
     update_all=False,
     version=None,
     constraints_path=None,
+    py_executable=None,
 ):
     resp = ""
     package_name, _ = split_package_name_and_extra(package_install_cmd)
@@ -349,6 +414,7 @@ def upgrade_from_local_wheel(
             update_all=update_all,
             version_cmd=version,
             constraints_path=constraints_path,
+            py_executable=py_executable,
         )
     except Exception as e:
         response_err = str(e)
@@ -356,8 +422,10 @@ def upgrade_from_local_wheel(
     if not skip_post_install:
         module_name = package_name.replace("-", "_").split("==")[0]
         try_running_module(module_name, *args)
-    installed_version = is_package_already_installed(package_name)
+    installed_version = is_package_already_installed(package_name, py_executable)
     if version:
+        from packaging.specifiers import SpecifierSet
+
         spec = SpecifierSet(_normalize_version_spec(version))
         success = installed_version is not None and spec.contains(installed_version)
     else:
@@ -373,6 +441,7 @@ def attempt_to_install_version(
     update_all=False,
     slack_webhook_url=None,
     constraints_path=None,
+    py_executable=None,
 ):
     """
     attempt to install a specific version of the given package
@@ -394,14 +463,17 @@ def attempt_to_install_version(
             slack_webhook_url,
             constraints_path,
             *args,
+            py_executable=py_executable,
         )
     except Exception as e:
         logging.warning("Could not find %s %s", package_install_cmd, version)
         print(f"Could not find {package_install_cmd} {version}")
         return False, str(e)
     package_name, _ = split_package_name_and_extra(package_install_cmd)
-    installed_version = is_package_already_installed(package_name)
+    installed_version = is_package_already_installed(package_name, py_executable)
     try:
+        from packaging.specifiers import SpecifierSet
+
         spec = SpecifierSet(normalized_version)
         success = installed_version is not None and spec.contains(installed_version)
     except Exception:
@@ -409,9 +481,22 @@ def attempt_to_install_version(
     return success, resp
 
 
-def _get_installed_packages_snapshot():
+@span("snapshot")
+def _get_installed_packages_snapshot(py_executable=None):
+    """Return a `{name: (version, fingerprint)}` snapshot of installed packages.
+
+    Fingerprints come from a scan of the dist-info directories in site-packages;
+    `pip list` (without fingerprints) is only used when site-packages cannot be located.
+    """
+    try:
+        snapshot = snapshot_site_packages(py_executable)
+    except OSError as e:
+        logging.warning("Failed to scan site-packages for package snapshot: %s", e)
+        snapshot = None
+    if snapshot is not None:
+        return snapshot
     try:
-        packages_json = pip("list", "--format", "json")
+        packages_json = pip("list", "--format", "json", py_executable=py_executable)
         if not packages_json:
             return None
         decoder = json.JSONDecoder()
@@ -420,35 +505,22 @@ def _get_installed_packages_snapshot():
         logging.warning("Failed to read installed package snapshot: %s", e)
         return None
 
+    from packaging.utils import canonicalize_name
+
     snapshot = {}
     for package in parsed_results:
         name = package.get("name")
         version = package.get("version")
         if name is None or version is None:
             continue
-        snapshot[str(name)] = str(version)
+        snapshot[canonicalize_name(str(name))] = (str(version), None)
     return snapshot
 
 
 def _get_updated_packages(before_snapshot, after_snapshot):
     if before_snapshot is None or after_snapshot is None:
         return []
-
-    package_names = sorted(set(before_snapshot) | set(after_snapshot))
-    updated_packages = []
-    for package_name in package_names:
-        before_version = before_snapshot.get(package_name)
-        after_version = after_snapshot.get(package_name)
-        if before_version == after_version:
-            continue
-        updated_packages.append(
-            {
-                "package": package_name,
-                "from": before_version,
-                "to": after_version,
-            }
-        )
-    return updated_packages
+    return diff_snapshots(before_snapshot, after_snapshot)
 
 
 def attempt_upgrade(
@@ -458,6 +530,7 @@ def attempt_upgrade(
     slack_webhook_url=None,
     constraints_path=None,
     *args,
+    py_executable=None,
 ):
     """
     Attempt to upgrade a package with the given package_install_cmd.
@@ -471,8 +544,8 @@ def attempt_upgrade(
     args = tuple(arg for arg in pip_args)
 
     package_name, _ = split_package_name_and_extra(package_install_cmd)
-    before_snapshot = _get_installed_packages_snapshot()
-    before_version = is_package_already_installed(package_name)
+    before_snapshot = _get_installed_packages_snapshot(py_executable)
+    before_version = is_package_already_installed(package_name, py_executable)
 
     resp = install_wheel(
         package_install_cmd,
@@ -484,10 +557,11 @@ def attempt_upgrade(
         slack_webhook_url,
         constraints_path,
         *args,
+        py_executable=py_executable,
     )
 
-    after_snapshot = _get_installed_packages_snapshot()
-    after_version = is_package_already_installed(package_name)
+    after_snapshot = _get_installed_packages_snapshot(py_executable)
+    after_version = is_package_already_installed(package_name, py_executable)
 
     updated_packages = _get_updated_packages(before_snapshot, after_snapshot)
     was_upgraded = before_version != after_version
@@ -539,9 +613,11 @@ def run_initial_post_install(package_name, *args):
 
 
 def run_module_and_reload_uwsgi_app(module_name, *args):
-    run_python_module(module_name, *args)
+    with span("post_install"):
+        run_python_module(module_name, *args)
     package_name = module_name.replace("_", "-")
-    reload_uwsgi_app(package_name)
+    with span("uwsgi_reload"):
+        reload_uwsgi_app(package_name)
 
 
 def send_upgrade_notification(header, cloudsmith_url, slack_webhook_url):
@@ -721,75 +797,81 @@ def upgrade_python_package(
     except Exception:
         logging.debug("Unable to read current package version for %s", package_name)
 
-    try:
-        if cloudsmith_url:
-            is_cloudsmith_url_valid(cloudsmith_url)
-        wheels_path = wheels_path or "/vagrant/wheels"
-        slack_webhook_url = slack_webhook_url or os.environ.get("SLACK_WEBHOOK_URL")
-        if update_from_local_wheels:
-            operation_result, response_output = upgrade_from_local_wheel(
-                package,
-                skip_post_install,
-                wheels_path=wheels_path,
-                cloudsmith_url=cloudsmith_url,
-                update_all=update_all,
-                version=version,
-                constraints_path=constraints_path,
-                *vars,
-            )
-            success = operation_result == "upgraded"
-        elif should_run_initial_post_install:
-            run_initial_post_install(package, *vars)
-        else:
-            operation_result, response_output = upgrade_and_run(
-                package,
-                force,
-                skip_post_install,
-                version,
-                cloudsmith_url,
-                update_all,
-                slack_webhook_url,
-                constraints_path,
-                *vars,
-            )
-            success = operation_result == "upgraded"
-        run_succeeded = True
-    except Exception as e:
-        logging.exception("Upgrade run failed package=%s", package)
-        if not format_output:
-            raise
-        response_output += str(e)
-    finally:
+    with record_spans() as spans, record_commands("upgrade_python_package") as commands:
         try:
-            final_version = is_package_already_installed(package_name)
-        except Exception:
-            logging.debug("Unable to read final package version for %s", package_name)
-
-        if not run_succeeded:
-            result = "errored"
-        else:
-            result = operation_result
-
-        log_run_summary(
-            script="upgrade_python_package",
-            package=package_name,
-            current=current_version,
-            target=version,
-            final=final_version,
-            result=result,
-            duration_seconds=time.monotonic() - start_time,
-        )
+            if cloudsmith_url:
+                is_cloudsmith_url_valid(cloudsmith_url)
+            wheels_path = wheels_path or "/vagrant/wheels"
+            slack_webhook_url = slack_webhook_url or os.environ.get("SLACK_WEBHOOK_URL")
+            if update_from_local_wheels:
+                operation_result, response_output = upgrade_from_local_wheel(
+                    package,
+                    skip_post_install,
+                    wheels_path=wheels_path,
+                    cloudsmith_url=cloudsmith_url,
+                    update_all=update_all,
+                    version=version,
+                    constraints_path=constraints_path,
+                    *vars,
+                )
+                success = operation_result == "upgraded"
+            elif should_run_initial_post_install:
+                run_initial_post_install(package, *vars)
+            else:
+                operation_result, response_output = upgrade_and_run(
+                    package,
+                    force,
+                    skip_post_install,
+                    version,
+                    cloudsmith_url,
+                    update_all,
+                    slack_webhook_url,
+                    constraints_path,
+                    *vars,
+                )
+                success = operation_result == "upgraded"
+            run_succeeded = True
+        except Exception as e:
+            logging.exception("Upgrade run failed package=%s", package)
+            if not format_output:
+                raise
+            response_output += str(e)
+        finally:
+            try:
+                final_version = is_package_already_installed(package_name)
+            except Exception:
+                logging.debug("Unable to read final package version for %s", package_name)
 
-        if format_output:
-            response = json.dumps(
-                {"success": success, "responseOutput": response_output}
+            if not run_succeeded:
+                result = "errored"
+            else:
+                result = operation_result
+
+            log_run_summary(
+                script="upgrade_python_package",
+                package=package_name,
+                current=current_version,
+                target=version,
+                final=final_version,
+                result=result,
+                duration_seconds=time.monotonic() - start_time,
+                extra_fields=commands.summary_fields(),
+                phase_durations=spans.durations,
             )
-            logging.debug(response)
-            print(response)
+
+            if format_output:
+                response = json.dumps(
+                    {
+                        "success": success,
+                        "responseOutput": response_output,
+                        "phaseDurations": spans.to_dict(),
+                    }
+                )
+                logging.debug(response)
+                print(response)
 
 
-def main():
-    parsed_args = parser.parse_args()
+def run_parsed_args(parsed_args):
     test = parsed_args.test
     log_location = parsed_args.log_location
     wheels_path = parsed_args.wheels_path
@@ -823,5 +905,16 @@ def main():
     )
 
 
+def main():
+    if sys.argv[1:2] == ["agent"]:
+        agent_main(sys.argv[2:])
+        return
+    parsed_args = parser.parse_args()
+    exit_code = run_in_agent("upgrade", parsed_args)
+    if exit_code is not None:
+        sys.exit(exit_code)
+    run_parsed_args(parsed_args)
+
+
 if __name__ == "__main__":
     main()
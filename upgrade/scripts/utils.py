@@ -6,9 +6,22 @@ import shutil
 import stat
 import subprocess
 import sys
+import threading
+import time
 from pathlib import Path
 from sys import platform
+from typing import List
 
+from upgrade.scripts.command_ledger import (
+    TRACE_FILE_ENV,
+    CommandRecord,
+    describe_command,
+    get_command_ledger,
+)
+from upgrade.scripts.distributions import (
+    get_installed_distributions,
+    invalidate_installed_distributions,
+)
 from upgrade.scripts.exceptions import PipFormatDecodeFailed
 
 logger = logging.getLogger(__name__)
@@ -17,6 +30,8 @@ logger = logging.getLogger(__name__)
 development_url_re = re.compile(r"([^']+development[^']+)")
 development_index_re = re.compile(r"install.index-url='([^']+development[^']+)'")
 
+MUTATING_PIP_SUBCOMMANDS = ("install", "uninstall")
+
 
 def create_directory(path: Path) -> None:
     try:
@@ -33,6 +48,19 @@ def get_venv_executable(venv_path: str) -> str:
         return str(Path(venv_path, "bin", "python3").absolute())
 
 
+def list_managed_venvs(envs_home: str) -> List[Path]:
+    """Return the virtualenv directories directly under `envs_home`.
+
+    Temporary `_green`/`_temp` venvs created while upgrading are skipped.
+    """
+    return [
+        venv_path
+        for venv_path in sorted(Path(envs_home).iterdir())
+        if (venv_path / "pyvenv.cfg").is_file()
+        and not venv_path.name.endswith(("_green", "_temp"))
+    ]
+
+
 def is_windows() -> bool:
     return platform == "win32" or platform == "cygwin"
 
@@ -65,15 +93,46 @@ def on_rm_error(_func, path, _exc_info):
         pass
 
 
+def _invalidate_if_mutating(args, py_executable):
+    if args and str(args[0]) in MUTATING_PIP_SUBCOMMANDS:
+        invalidate_installed_distributions(py_executable)
+
+
 def pip(*args, **kwargs):
     """
     Run pip using the python executable used to run this function
     """
-    return run_python_module("pip", *args, **kwargs)
+    try:
+        return run_python_module("pip", *args, **kwargs)
+    finally:
+        _invalidate_if_mutating(args, kwargs.get("py_executable"))
+
+
+def _child_env(env, trace_file):
+    """Return the environment of a child command, pointing UPGRADE_TRACE_FILE at
+    its own trace file (see `command_ledger`), or None to inherit ours."""
+    if trace_file is None and TRACE_FILE_ENV not in (env or os.environ):
+        return env
+    env = dict(os.environ if env is None else env)
+    if trace_file is None:
+        env.pop(TRACE_FILE_ENV)
+    else:
+        env[TRACE_FILE_ENV] = trace_file
+    return env
+
+
+def _output_size(output) -> int:
+    if isinstance(output, str):
+        return len(output.encode("utf-8", errors="replace"))
+    return len(output or b"")
 
 
 def run(*command, **kwargs):
-    """Run a command and return its output"""
+    """Run a command and return its output.
+
+    Commands are recorded in the ledger of the current run, if any (see
+    `command_ledger`).
+    """
     if len(command) == 1 and isinstance(command[0], str):
         command = command[0].split()
     print(*command)
@@ -81,6 +140,12 @@ def run(*command, **kwargs):
     logging.debug(
         'Running command executable="%s" arg_count=%s', command[0], len(command) - 1
     )
+    ledger = get_command_ledger()
+    trace_file = ledger.child_trace_file() if ledger is not None else None
+    start = time.time()
+    start_time = time.monotonic()
+    exit_code = None
+    output = None
     try:
         options = dict(
             stdout=subprocess.PIPE,
@@ -89,8 +154,13 @@ def run(*command, **kwargs):
             universal_newlines=True,
         )
         options.update(kwargs)
+        options["env"] = _child_env(options.get("env"), trace_file)
         completed = subprocess.run(command, **options)
+        exit_code = completed.returncode
+        output = completed.stdout
     except subprocess.CalledProcessError as err:
+        exit_code = err.returncode
+        output = err.stdout
         logging.warning('Error occurred while running command "%s"', " ".join(command))
         if err.stdout:
             print(err.stdout)
@@ -109,12 +179,31 @@ def run(*command, **kwargs):
             err.returncode,
         )
         raise err
+    finally:
+        if ledger is not None:
+            ledger.merge_child_trace(trace_file)
+            ledger.add(
+                CommandRecord(
+                    executable=command[0],
+                    arg_count=len(command) - 1,
+                    name=describe_command(command),
+                    start=start,
+                    duration_seconds=time.monotonic() - start_time,
+                    exit_code=exit_code,
+                    output_bytes=_output_size(output),
+                    thread_id=threading.get_ident(),
+                )
+            )
     if completed.stdout:
         print(completed.stdout)
         logging.debug("Completed. Output: %s", completed.stdout)
     return completed.stdout.rstrip() if completed.returncode == 0 else None
 
 
+def is_uv_available() -> bool:
+    return shutil.which("uv") is not None
+
+
 def installer(*args, **kwargs):
     """Install/uninstall packages using uv when available.
 
@@ -123,14 +212,17 @@ def installer(*args, **kwargs):
     operations we prefer `uv pip` for speed and modern resolution.
     """
     py_executable = kwargs.pop("py_executable", None) or sys.executable
-    if shutil.which("uv") is not None:
+    if is_uv_available():
         if not args:
             raise ValueError("installer() requires a uv pip subcommand")
 
         subcommand = str(args[0])
         cmd = ["uv", "pip", subcommand, "-p", str(py_executable)]
         cmd.extend([str(arg) for arg in args[1:]])
-        return run(*cmd, **kwargs)
+        try:
+            return run(*cmd, **kwargs)
+        finally:
+            _invalidate_if_mutating(args, py_executable)
     return pip(*args, py_executable=py_executable, **kwargs)
 
 
@@ -143,7 +235,7 @@ def run_python_module(module_name, *args, **kwargs):
         var_name = f"UPDATE_{module_name.upper()}"
         args = tuple(os.environ.get(var_name, "").split())
     logging.debug("running %s python module", module_name)
-    py_executable = kwargs.pop("py_executable", sys.executable)
+    py_executable = kwargs.pop("py_executable", None) or sys.executable
     try:
         return run(*((py_executable, "-m", module_name) + args), **kwargs)
     except subprocess.CalledProcessError as e:
@@ -151,10 +243,7 @@ def run_python_module(module_name, *args, **kwargs):
         raise e
 
 
-def is_package_already_installed(package, py_executable=None):
-    if py_executable is None:
-        py_executable = sys.executable
-
+def _get_pip_list_version(package, py_executable):
     results = pip("list", "--format", "json", py_executable=py_executable)
     try:
         decoder = json.JSONDecoder()
@@ -163,7 +252,6 @@ def is_package_already_installed(package, py_executable=None):
         msg = "Error occurred while decoding pip list to json"
         logging.error(msg)
         raise PipFormatDecodeFailed(msg)
-    package = package.split("==")[0] if "==" in package else package
     found_package = [
         (element["name"], element["version"])
         for element in parsed_results
@@ -172,5 +260,25 @@ def is_package_already_installed(package, py_executable=None):
     if found_package:
         _, version = found_package.pop()
         return version
+    return None
+
+
+def is_package_already_installed(package, py_executable=None):
+    """Return the installed version of `package` or None if it is not installed.
+
+    Versions are read from the cached installed-distribution index and only fall
+    back to `pip list` if the environment's site-packages cannot be located.
+    """
+    if py_executable is None:
+        py_executable = sys.executable
+
+    package = package.split("==")[0] if "==" in package else package
+    installed_distributions = get_installed_distributions(py_executable)
+    if installed_distributions is not None:
+        version = installed_distributions.get_version(package)
+    else:
+        version = _get_pip_list_version(package, py_executable)
+    if version is not None:
+        return version
     logging.info(f"Package not found: ${package}")
     return None
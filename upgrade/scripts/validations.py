@@ -1,12 +1,15 @@
 import logging
 
+from upgrade.scripts.spans import span
+
 logger = logging.getLogger(__name__)
 
 
+@span("validate_url")
 def is_cloudsmith_url_valid(cloudsmith_url: str) -> None:
-    import requests
+    from upgrade.scripts.http_client import request
 
-    response = requests.head(cloudsmith_url)
+    response = request("HEAD", cloudsmith_url)
     if response.status_code != 200:
         raise Exception(
             f"Failed to reach package index url. Provided invalid URL: {cloudsmith_url}"
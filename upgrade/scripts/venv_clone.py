@@ -0,0 +1,151 @@
+"""Clone a virtualenv directory as cheaply as the filesystem allows.
+
+`temporary_upgrade_venv` needs a full copy of the venv to upgrade it in isolation.
+Strategies are tried in order:
+- reflink: copy-on-write clones of every file (Linux FICLONE, e.g. on btrfs/XFS)
+- hardlink: site-packages files are hard-linked, everything else is copied.
+  pip and uv replace files (unlink + create) instead of writing into them, so
+  upgrading the clone never modifies files of the original venv. Files that are
+  updated in place (`*.pth`, dist-info metadata, scripts) are always copied.
+- copy: regular `shutil.copytree`
+
+`UPGRADE_VENV_CLONE_STRATEGIES` (e.g. `hardlink,copy`) restricts or reorders them.
+"""
+
+import errno
+import logging
+import os
+import shutil
+import sys
+from enum import Enum
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+UNSUPPORTED_ERRNOS = (
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.EPERM,
+    errno.ENOSYS,
+)
+
+
+class CloneStrategy(Enum):
+    REFLINK = "reflink"
+    HARDLINK = "hardlink"
+    COPY = "copy"
+
+
+class _StrategyUnsupported(Exception):
+    pass
+
+
+def _reflink(src: str, dst: str) -> None:
+    import fcntl
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def _is_linkable(path: Path) -> bool:
+    """Only files inside site-packages that installers replace rather than modify."""
+    if "site-packages" not in path.parts or path.suffix == ".pth":
+        return False
+    return not path.parent.name.endswith((".dist-info", ".egg-info"))
+
+
+def _probe(strategy: CloneStrategy, src: Path, dst_parent: Path) -> None:
+    """Check that `strategy` works between `src` and `dst_parent` on a single file."""
+    if strategy == CloneStrategy.COPY:
+        return
+    if strategy == CloneStrategy.REFLINK and not sys.platform.startswith("linux"):
+        raise _StrategyUnsupported("reflink is only supported on Linux")
+    probe_src = src / "pyvenv.cfg"
+    probe_dst = dst_parent / f".clone-probe-{os.getpid()}"
+    try:
+        if strategy == CloneStrategy.REFLINK:
+            _reflink(str(probe_src), str(probe_dst))
+        else:
+            os.link(str(probe_src), str(probe_dst))
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            raise _StrategyUnsupported(str(e))
+        raise
+    finally:
+        try:
+            probe_dst.unlink()
+        except OSError:
+            pass
+
+
+def _copy_tree(src: Path, dst: Path, strategy: CloneStrategy) -> int:
+    bytes_copied = 0
+
+    def _copy_file(src_file, dst_file):
+        nonlocal bytes_copied
+        if strategy == CloneStrategy.REFLINK:
+            try:
+                _reflink(src_file, dst_file)
+                shutil.copystat(src_file, dst_file)
+                return dst_file
+            except OSError as e:
+                logger.debug("Reflink of %s failed, copying: %s", src_file, e)
+        elif strategy == CloneStrategy.HARDLINK and _is_linkable(
+            Path(src_file).relative_to(src)
+        ):
+            try:
+                os.link(src_file, dst_file)
+                return dst_file
+            except OSError as e:
+                logger.debug("Hardlink of %s failed, copying: %s", src_file, e)
+        shutil.copy2(src_file, dst_file)
+        bytes_copied += os.path.getsize(dst_file)
+        return dst_file
+
+    shutil.copytree(str(src), str(dst), symlinks=True, copy_function=_copy_file)
+    return bytes_copied
+
+
+def _get_strategies() -> List[CloneStrategy]:
+    configured = os.environ.get("UPGRADE_VENV_CLONE_STRATEGIES")
+    if not configured:
+        return list(CloneStrategy)
+    strategies = []
+    for name in configured.split(","):
+        try:
+            strategies.append(CloneStrategy(name.strip().lower()))
+        except ValueError:
+            logger.warning("Ignoring unknown venv clone strategy %s", name)
+    return strategies or [CloneStrategy.COPY]
+
+
+def clone_venv(
+    venv_path: str, clone_path: str, strategies: Optional[List[CloneStrategy]] = None
+) -> Tuple[CloneStrategy, int]:
+    """Clone `venv_path` to `clone_path` using the first strategy that works.
+
+    Returns the chosen strategy and the number of bytes actually copied.
+    """
+    src = Path(venv_path)
+    dst = Path(clone_path)
+    # the strategies are probed next to the clone, e.g. in a new envs home
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    for strategy in strategies or _get_strategies():
+        try:
+            _probe(strategy, src, dst.parent)
+        except _StrategyUnsupported as e:
+            logger.debug("Venv clone strategy %s is not supported: %s", strategy.value, e)
+            continue
+        bytes_copied = _copy_tree(src, dst, strategy)
+        logger.debug(
+            "Cloned venv %s strategy=%s bytes_copied=%s", src, strategy.value, bytes_copied
+        )
+        return strategy, bytes_copied
+
+    bytes_copied = _copy_tree(src, dst, CloneStrategy.COPY)
+    return CloneStrategy.COPY, bytes_copied
@@ -0,0 +1,239 @@
+"""Cache of prebuilt base venvs that `create_venv` clones instead of bootstrapping.
+
+Bootstrapping a venv (`venv --without-pip`, `ensurepip`, upgrading pip and
+setuptools and installing upgrade-python-package) takes tens of seconds. A base
+venv is built once per template key and new venvs are cloned from it with
+`clone_venv`, after which absolute paths of the template in `bin/` scripts and
+`pyvenv.cfg` are rewritten to the new venv path.
+
+The template key consists of the interpreter (path and version), the pip
+version bundled with its ensurepip and the upgrade-python-package version. When
+no version is requested, the key holds the version the package index currently
+offers (resolved with `pip install --dry-run`, without downloading it), so a new
+release selects a new template right away. A local installation path is keyed
+together with the modification times of its packaging files. A different key
+selects a different template. Since pip and setuptools are upgraded from the
+index while building, templates older than the maximum age are rebuilt, so new
+releases of them are picked up.
+The pip, setuptools and upgrade-python-package versions a template was built
+with are recorded in its metadata file.
+
+Defaults can be overridden with:
+- UPGRADE_VENV_TEMPLATE_DIR
+- UPGRADE_VENV_TEMPLATE_MAX_AGE (seconds)
+- UPGRADE_VENV_TEMPLATE_DISABLED
+"""
+
+import ensurepip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from upgrade.scripts.distributions import get_installed_distributions
+from upgrade.scripts.utils import get_venv_executable, is_windows, on_rm_error
+from upgrade.scripts.venv_clone import clone_venv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+TEMPLATE_METADATA_FILE = "upgrade-venv-template.json"
+RECORDED_PACKAGES = ("pip", "setuptools", "upgrade-python-package")
+
+
+def _default_templates_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "upgrade-python-package" / "venv-templates"
+
+
+def is_venv_template_enabled() -> bool:
+    return not os.environ.get("UPGRADE_VENV_TEMPLATE_DISABLED")
+
+
+def _get_max_age() -> float:
+    try:
+        return float(
+            os.environ.get("UPGRADE_VENV_TEMPLATE_MAX_AGE", DEFAULT_MAX_AGE_SECONDS)
+        )
+    except ValueError as e:
+        logger.warning("Invalid venv template max age, using default: %s", e)
+        return DEFAULT_MAX_AGE_SECONDS
+
+
+def _resolve_latest_version(package: str) -> Optional[str]:
+    """Return the version of `package` pip would install from its index, or None."""
+    from upgrade.scripts.utils import pip
+
+    report_dir = tempfile.mkdtemp(prefix="upgrade-venv-template-")
+    report_path = os.path.join(report_dir, "report.json")
+    try:
+        pip(
+            "install",
+            "--dry-run",
+            "--quiet",
+            "--ignore-installed",
+            "--no-deps",
+            "--report",
+            report_path,
+            package,
+        )
+        with open(report_path) as report_file:
+            return json.load(report_file)["install"][0]["metadata"]["version"]
+    except Exception as e:
+        logger.debug("Failed to resolve the latest version of %s: %s", package, e)
+        return None
+    finally:
+        shutil.rmtree(report_dir, ignore_errors=True)
+
+
+def _get_local_installation_fingerprint(local_installation_path: str) -> str:
+    """Modification times of the packaging files; the install is editable, so
+    only changes to its metadata need a new template."""
+    fingerprint = hashlib.sha256()
+    for name in ("pyproject.toml", "setup.py", "setup.cfg"):
+        try:
+            mtime_ns = os.stat(os.path.join(local_installation_path, name)).st_mtime_ns
+        except OSError:
+            continue
+        fingerprint.update(f"{name}:{mtime_ns};".encode("utf-8"))
+    return fingerprint.hexdigest()[:16]
+
+
+def get_template_key(
+    upgrade_python_package_version: Optional[str] = None,
+    local_installation_path: Optional[str] = None,
+) -> Dict[str, str]:
+    if local_installation_path:
+        path = os.path.abspath(local_installation_path)
+        upgrade_python_package = f"local:{path}:{_get_local_installation_fingerprint(path)}"
+    else:
+        upgrade_python_package = (
+            upgrade_python_package_version
+            or _resolve_latest_version("upgrade-python-package")
+            or "latest"
+        )
+    return {
+        "python": os.path.realpath(sys.executable),
+        "python_version": sys.version,
+        "bundled_pip": ensurepip.version(),
+        "upgrade_python_package": upgrade_python_package,
+    }
+
+
+def _read_metadata(template_path: Path) -> Optional[dict]:
+    try:
+        return json.loads((template_path / TEMPLATE_METADATA_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _remove_template(template_path: Path) -> None:
+    """Move the template aside first, so no venv is cloned from a half-removed one."""
+    stale_path = template_path.with_name(f".{template_path.name}.{os.getpid()}.stale")
+    try:
+        os.rename(str(template_path), str(stale_path))
+    except OSError:
+        return
+    shutil.rmtree(stale_path, onerror=on_rm_error)
+
+
+def _build_template(
+    template_path: Path, key: Dict[str, str], build_venv: Callable[[str], None]
+) -> None:
+    build_path = template_path.with_name(f".{template_path.name}.{os.getpid()}.build")
+    if build_path.exists():
+        shutil.rmtree(build_path, onerror=on_rm_error)
+    start_time = time.monotonic()
+    try:
+        build_venv(str(build_path))
+        installed = get_installed_distributions(get_venv_executable(str(build_path)))
+        metadata = {
+            "key": key,
+            "built_at": str(build_path),
+            "created": time.time(),
+            "versions": {
+                name: installed.get_version(name) if installed is not None else None
+                for name in RECORDED_PACKAGES
+            },
+        }
+        (build_path / TEMPLATE_METADATA_FILE).write_text(json.dumps(metadata))
+        try:
+            os.rename(str(build_path), str(template_path))
+        except OSError:
+            # another process built the same template concurrently
+            logger.debug("Venv template %s already exists", template_path)
+    finally:
+        if build_path.exists():
+            shutil.rmtree(build_path, onerror=on_rm_error)
+    logger.debug(
+        "Built venv template %s duration_s=%.2f", template_path, time.monotonic() - start_time
+    )
+
+
+def get_venv_template(
+    key: Dict[str, str],
+    build_venv: Callable[[str], None],
+    templates_dir: Optional[str] = None,
+) -> Path:
+    """Return the path of the template venv for `key`, building it if it does not
+    exist or is older than the maximum age. `build_venv(path)` bootstraps a venv."""
+    templates_dir = Path(
+        templates_dir or os.environ.get("UPGRADE_VENV_TEMPLATE_DIR") or _default_templates_dir()
+    )
+    templates_dir.mkdir(parents=True, exist_ok=True)
+    key_hash = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    template_path = templates_dir / key_hash[:16]
+
+    metadata = _read_metadata(template_path)
+    if metadata is not None and metadata.get("key") != key:
+        metadata = None
+    if metadata is not None and time.time() - metadata.get("created", 0) > _get_max_age():
+        logger.debug("Venv template %s expired", template_path)
+        metadata = None
+    if metadata is None:
+        if template_path.exists():
+            _remove_template(template_path)
+        _build_template(template_path, key, build_venv)
+    return template_path
+
+
+def _relocate(venv_path: Path, old_path: str) -> None:
+    """Rewrite absolute paths of the venv it was cloned from in scripts and `pyvenv.cfg`."""
+    old_prefix = os.fsencode(old_path)
+    new_prefix = os.fsencode(str(venv_path))
+    scripts_dir = venv_path / ("Scripts" if is_windows() else "bin")
+    candidates = [venv_path / "pyvenv.cfg"]
+    if scripts_dir.is_dir():
+        candidates.extend(scripts_dir.iterdir())
+    for path in candidates:
+        if path.is_symlink() or not path.is_file():
+            continue
+        content = path.read_bytes()
+        if old_prefix not in content:
+            continue
+        # scripts are copied, never hard-linked, so they can be rewritten in place
+        path.write_bytes(content.replace(old_prefix, new_prefix))
+
+
+def create_venv_from_template(venv_path: str, template_path: Path) -> str:
+    """Clone the template venv to `venv_path` and return its python executable."""
+    metadata = _read_metadata(template_path)
+    if metadata is None:
+        raise ValueError(f"Venv template {template_path} has no metadata")
+    strategy, bytes_copied = clone_venv(str(template_path), venv_path)
+    (Path(venv_path) / TEMPLATE_METADATA_FILE).unlink()
+    _relocate(Path(venv_path), metadata["built_at"])
+    logger.debug(
+        "Created venv %s from template %s strategy=%s bytes_copied=%s",
+        venv_path,
+        template_path,
+        strategy.value,
+        bytes_copied,
+    )
+    return get_venv_executable(venv_path)
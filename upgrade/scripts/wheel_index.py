@@ -0,0 +1,263 @@
+"""Persistent, version-sorted index of a local wheels directory.
+
+`--update-from-local-wheels` installs select wheels from a directory that can
+hold tens of thousands of files. Instead of globbing and parsing every filename
+on each lookup, parsed filenames are stored in a JSON index file together with
+the directory mtime. The directory is only listed again when its mtime changes,
+and then only new filenames are parsed.
+
+In memory, the index maps canonical name -> versions sorted as `Version` ->
+wheel paths compatible with the target interpreter, best platform/Python tag
+first. The tags of a venv are those of its Python version (from `pyvenv.cfg`) on
+this platform; one in-memory index is kept per wheels directory and version.
+
+The index files are stored in UPGRADE_WHEEL_INDEX_DIR
+(default `~/.cache/upgrade-python-package/wheel-index`).
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from packaging.specifiers import SpecifierSet
+from packaging.tags import Tag, compatible_tags, cpython_tags, parse_tag, sys_tags
+from packaging.utils import canonicalize_name, parse_wheel_filename
+from packaging.version import Version
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+_wheel_indexes = {}
+_tag_priorities = {}
+
+
+def _default_index_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "upgrade-python-package" / "wheel-index"
+
+
+def _get_tag_priorities(python_version: Optional[Tuple[int, int]] = None) -> Dict[Tag, int]:
+    """Rank the tags supported by a CPython of `python_version` on this platform,
+    best first. Defaults to the tags of the running interpreter."""
+    if python_version == sys.version_info[:2] or platform.python_implementation() != "CPython":
+        python_version = None
+    tag_priorities = _tag_priorities.get(python_version)
+    if tag_priorities is None:
+        tags = (
+            sys_tags()
+            if python_version is None
+            else chain(
+                cpython_tags(python_version),
+                compatible_tags(python_version, f"cp{python_version[0]}{python_version[1]}"),
+            )
+        )
+        tag_priorities = _tag_priorities[python_version] = {
+            tag: priority for priority, tag in enumerate(tags)
+        }
+    return tag_priorities
+
+
+def get_python_version(py_executable: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """Return the Python version of `py_executable`, or None if it is unknown."""
+    from upgrade.scripts.dependency_check import get_marker_environment
+
+    environment = get_marker_environment(py_executable)
+    if environment is None:
+        return None
+    major, minor = environment["python_version"].split(".")
+    return int(major), int(minor)
+
+
+def _parse_wheel(wheel_name: str) -> Optional[list]:
+    """Return `[canonical name, version, tags]` or None for invalid wheel filenames."""
+    try:
+        name, version, _, tags = parse_wheel_filename(wheel_name)
+    except ValueError:
+        return None
+    return [str(name), str(version), sorted(str(tag) for tag in tags)]
+
+
+class WheelIndex:
+    """Index of the wheels in `wheels_path` compatible with a CPython of
+    `python_version` (default: the running interpreter), persisted in `index_path`."""
+
+    def __init__(
+        self,
+        wheels_path: str,
+        index_path: Optional[str] = None,
+        python_version: Optional[Tuple[int, int]] = None,
+    ):
+        self.wheels_path = Path(wheels_path).absolute()
+        self.python_version = python_version
+        if index_path is None:
+            key = hashlib.sha256(str(self.wheels_path).encode("utf-8")).hexdigest()
+            index_dir = os.environ.get("UPGRADE_WHEEL_INDEX_DIR") or _default_index_dir()
+            index_path = Path(index_dir) / f"{key[:16]}.json"
+        self.index_path = Path(index_path)
+        self.mtime_ns = None
+        self._files = {}
+        self._packages = {}
+
+    def _load(self) -> None:
+        try:
+            stored = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            return
+        if stored.get("format") != INDEX_FORMAT_VERSION or stored.get(
+            "wheels_path"
+        ) != str(self.wheels_path):
+            return
+        self.mtime_ns = stored.get("mtime_ns")
+        self._files = stored.get("files", {})
+
+    def _save(self) -> None:
+        data = {
+            "format": INDEX_FORMAT_VERSION,
+            "wheels_path": str(self.wheels_path),
+            "mtime_ns": self.mtime_ns,
+            "files": self._files,
+        }
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=str(self.index_path.parent), prefix=f".{self.index_path.name}."
+            )
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump(data, tmp_file)
+            os.replace(tmp_path, str(self.index_path))
+        except OSError as e:
+            logger.debug("Failed to write wheel index %s: %s", self.index_path, e)
+
+    def _build_packages(self) -> None:
+        tag_priorities = _get_tag_priorities(self.python_version)
+        packages = {}
+        for wheel_name, (name, version, tags) in self._files.items():
+            priorities = [
+                tag_priorities[tag]
+                for tag_text in tags
+                for tag in parse_tag(tag_text)
+                if tag in tag_priorities
+            ]
+            if not priorities:
+                continue
+            packages.setdefault(name, {}).setdefault(Version(version), []).append(
+                (min(priorities), wheel_name)
+            )
+        # name -> (sorted versions, wheel names of each version, best tags first)
+        self._packages = {
+            name: (
+                sorted(versions),
+                [
+                    [wheel_name for _, wheel_name in sorted(versions[version])]
+                    for version in sorted(versions)
+                ],
+            )
+            for name, versions in packages.items()
+        }
+
+    def refresh(self) -> None:
+        """Re-read the wheels directory if its mtime changed since the last refresh."""
+        try:
+            mtime_ns = self.wheels_path.stat().st_mtime_ns
+        except OSError:
+            self._files, self._packages, self.mtime_ns = {}, {}, None
+            return
+        if self.mtime_ns is None:
+            self._load()
+            if self.mtime_ns == mtime_ns:
+                self._build_packages()
+                return
+        elif self.mtime_ns == mtime_ns:
+            return
+
+        with os.scandir(str(self.wheels_path)) as entries:
+            wheel_names = [entry.name for entry in entries if entry.name.endswith(".whl")]
+        files = {}
+        parsed_count = 0
+        for wheel_name in wheel_names:
+            parsed = self._files.get(wheel_name)
+            if parsed is None:
+                parsed = _parse_wheel(wheel_name)
+                parsed_count += 1
+                if parsed is None:
+                    continue
+            files[wheel_name] = parsed
+        self._files = files
+        self.mtime_ns = mtime_ns
+        self._build_packages()
+        self._save()
+        logger.debug(
+            "Refreshed wheel index %s wheels=%s parsed=%s",
+            self.wheels_path,
+            len(files),
+            parsed_count,
+        )
+
+    def get_versions(self, package_name: str) -> List[Version]:
+        """Return the versions of `package_name` with compatible wheels, sorted."""
+        self.refresh()
+        versions, _ = self._packages.get(canonicalize_name(package_name), ([], []))
+        return list(versions)
+
+    def find_wheel(
+        self,
+        package_name: str,
+        specifier: Optional[SpecifierSet] = None,
+        prereleases: Optional[bool] = None,
+    ) -> Optional[str]:
+        """Return the path of the best wheel of the highest version matching
+        `specifier`, or None.
+
+        Pre-releases follow `SpecifierSet.filter`: they are only selected if
+        allowed, or if no final release matches.
+        """
+        self.refresh()
+        versions, wheel_names = self._packages.get(
+            canonicalize_name(package_name), ([], [])
+        )
+        specifier = specifier or SpecifierSet()
+        pinned = [spec for spec in specifier if spec.operator == "=="]
+        if len(pinned) == 1 and not pinned[0].version.endswith("*"):
+            # exact pins are a binary search, other specifiers scan from the highest version
+            position = bisect.bisect_left(versions, Version(pinned[0].version))
+            candidates = range(position, min(position + 1, len(versions)))
+        else:
+            candidates = range(len(versions) - 1, -1, -1)
+
+        allow_prereleases = True if prereleases is None else prereleases
+        prerelease_match = None
+        for position in candidates:
+            version = versions[position]
+            if not specifier.contains(version, prereleases=allow_prereleases):
+                continue
+            if version.is_prerelease and prereleases is None and not specifier.prereleases:
+                if prerelease_match is None:
+                    prerelease_match = position
+                continue
+            return str(self.wheels_path / wheel_names[position][0])
+        if prerelease_match is not None:
+            return str(self.wheels_path / wheel_names[prerelease_match][0])
+        return None
+
+
+def get_wheel_index(wheels_path: str, py_executable: Optional[str] = None) -> WheelIndex:
+    """Return the process-wide index of the wheels in `wheels_path` that can be
+    installed with `py_executable` (default: the running interpreter)."""
+    path = os.path.abspath(str(wheels_path))
+    python_version = get_python_version(py_executable) if py_executable else None
+    if python_version == sys.version_info[:2]:
+        python_version = None
+    key = (path, python_version)
+    wheel_index = _wheel_indexes.get(key)
+    if wheel_index is None:
+        wheel_index = _wheel_indexes[key] = WheelIndex(path, python_version=python_version)
+    return wheel_index
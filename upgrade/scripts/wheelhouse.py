@@ -0,0 +1,206 @@
+"""Host-level wheelhouse shared by all managed venvs.
+
+Every venv (and every blue-green `_green` copy) used to download the same wheels
+from the package index. Installs from the index now pass the wheelhouse as a
+`--find-links` source, so wheels already on the host are used instead of being
+downloaded again. Only wheels that are already on disk are added to it: those
+prefetched for an install (see `prefetch`) are moved in once the install is
+done, so filling the wheelhouse never downloads anything.
+
+Each wheel is stored next to a `<wheel>.sha256` file with its content hash.
+Wheels are written to a temporary file and renamed into place, so concurrent
+runs never see partial wheels; a wheel whose content does not match its hash is
+removed. The wheelhouse is size-bounded and evicts least recently used wheels.
+
+Defaults can be overridden with:
+- UPGRADE_WHEELHOUSE_DIR
+- UPGRADE_WHEELHOUSE_MAX_BYTES
+- UPGRADE_WHEELHOUSE_DISABLED
+"""
+
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+HASH_SUFFIX = ".sha256"
+
+
+def _default_wheelhouse_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "upgrade-python-package" / "wheels"
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(str(path), "rb") as wheel_file:
+        for chunk in iter(lambda: wheel_file.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _atomic_write(path: Path, source) -> None:
+    """Write to a temporary file first so concurrent readers never see partial files."""
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            shutil.copyfileobj(source, tmp_file)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Wheelhouse:
+    """Directory of wheels with `<wheel>.sha256` content hashes."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path) if path else _default_wheelhouse_dir()
+        self.max_bytes = max_bytes
+
+    def _hash_path(self, wheel_path: Path) -> Path:
+        return wheel_path.with_name(wheel_path.name + HASH_SUFFIX)
+
+    def find_links_args(self) -> List[str]:
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.debug("Wheelhouse %s is not usable: %s", self.path, e)
+            return []
+        return ["--find-links", str(self.path)]
+
+    def verify(self, wheel_name: str) -> bool:
+        """Check a stored wheel against its hash, removing it if they do not match."""
+        wheel_path = self.path / wheel_name
+        try:
+            expected = self._hash_path(wheel_path).read_text().strip()
+            actual = file_sha256(wheel_path)
+        except OSError:
+            return False
+        if actual != expected:
+            logger.warning("Removing corrupt wheel %s from wheelhouse", wheel_name)
+            self._remove(wheel_path)
+            return False
+        return True
+
+    def add(self, wheel_path: str, sha256: Optional[str] = None) -> Optional[Path]:
+        """Copy a wheel into the wheelhouse and return its stored path.
+
+        If `sha256` is given, wheels with a different content hash are rejected.
+        """
+        from packaging.utils import parse_wheel_filename
+
+        wheel_path = Path(wheel_path)
+        try:
+            parse_wheel_filename(wheel_path.name)
+        except ValueError:
+            logger.debug("Not adding %s to wheelhouse: not a wheel", wheel_path)
+            return None
+        digest = file_sha256(wheel_path)
+        if sha256 is not None and digest != sha256:
+            logger.warning("Not adding %s to wheelhouse: hash mismatch", wheel_path.name)
+            return None
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        stored_path = self.path / wheel_path.name
+        try:
+            if self._hash_path(stored_path).read_text().strip() == digest:
+                self.touch([stored_path.name])
+                return stored_path
+        except OSError:
+            pass
+
+        with open(str(wheel_path), "rb") as wheel_file:
+            _atomic_write(stored_path, wheel_file)
+        _atomic_write(self._hash_path(stored_path), io.BytesIO(digest.encode("utf-8")))
+        logger.debug("Added %s to wheelhouse", wheel_path.name)
+        self.evict()
+        return stored_path
+
+    def touch(self, wheel_names: Iterable[str]) -> None:
+        """Mark wheels as recently used."""
+        for wheel_name in wheel_names:
+            try:
+                os.utime(str(self._hash_path(self.path / wheel_name)))
+            except OSError:
+                pass
+
+    def find(self, package_name: str, version: str) -> List[str]:
+        """Return the names of stored, intact wheels of `package_name` at `version`."""
+        from packaging.utils import canonicalize_name, parse_wheel_filename
+
+        canonical_name = canonicalize_name(package_name)
+        pattern = f"{canonical_name.replace('-', '_')}-*.whl"
+        found = []
+        for wheel_path in self.path.glob(pattern):
+            try:
+                name, wheel_version, _, _ = parse_wheel_filename(wheel_path.name)
+            except ValueError:
+                continue
+            if (
+                name == canonical_name
+                and str(wheel_version) == str(version)
+                and self.verify(wheel_path.name)
+            ):
+                found.append(wheel_path.name)
+        return found
+
+    def _remove(self, wheel_path: Path) -> None:
+        for path in (wheel_path, self._hash_path(wheel_path)):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def evict(self) -> None:
+        """Remove least recently used wheels until the wheelhouse fits in `max_bytes`."""
+        entries = []
+        try:
+            wheel_paths = list(self.path.glob("*.whl"))
+        except OSError:
+            return
+        for wheel_path in wheel_paths:
+            try:
+                size = wheel_path.stat().st_size
+                last_used = self._hash_path(wheel_path).stat().st_mtime
+            except OSError:
+                continue
+            entries.append((last_used, size, wheel_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, wheel_path in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= self.max_bytes:
+                break
+            self._remove(wheel_path)
+            total_size -= size
+            logger.debug("Evicted %s from wheelhouse", wheel_path.name)
+
+
+def get_wheelhouse() -> Optional[Wheelhouse]:
+    """Return the host wheelhouse or None if it is disabled."""
+    if os.environ.get("UPGRADE_WHEELHOUSE_DISABLED"):
+        return None
+    try:
+        max_bytes = int(os.environ.get("UPGRADE_WHEELHOUSE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    except ValueError as e:
+        logger.warning("Invalid wheelhouse size, using default: %s", e)
+        max_bytes = DEFAULT_MAX_BYTES
+    return Wheelhouse(os.environ.get("UPGRADE_WHEELHOUSE_DIR"), max_bytes=max_bytes)
+
+
+def get_find_links_args() -> List[str]:
+    """Return `--find-links <wheelhouse>` installer arguments, if enabled."""
+    wheelhouse = get_wheelhouse()
+    return wheelhouse.find_links_args() if wheelhouse is not None else []
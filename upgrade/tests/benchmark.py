@@ -0,0 +1,515 @@
+"""End-to-end upgrade benchmarks over a local wheel repository.
+
+Times `upgrade_python_package` (from local wheels and from a package index),
+`build_and_upgrade_venv` (new venv, existing venv and blue-green) and
+`find_compatible_versions`. The package index is a local stand-in: a PEP 503
+simple index served over HTTP from the wheels directory.
+
+Every scenario is set up and measured in separate, fresh worker processes, so
+that imports and peak RSS of one scenario do not leak into the next. Recorded
+per scenario (median of `--repeat` runs):
+- wall time of the measured call
+- number of subprocesses spawned by the worker (not their own children)
+- bytes copied while cloning venvs
+- peak RSS of the worker and of its largest child
+
+Results are compared against the baseline file passed with `--baseline`; the
+exit code is 1 if a scenario regressed by more than `--tolerance`. Baselines are
+machine-specific, so none is committed: record one with `--save-baseline` on the
+machine, before the change to measure. A scenario that fails reports its error
+and no metrics, and makes the exit code 1 without saving or comparing results.
+Wheels are taken from `repository` (see `generate.py`, or pass `--generate 2.0.0
+2.0.1` to build it first) or else from `data/wheels_dir`.
+
+    python -m upgrade.tests.benchmark --repeat 3 --baseline baseline.json --save-baseline
+    python -m upgrade.tests.benchmark --repeat 3 --baseline baseline.json
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from packaging.utils import canonicalize_name, parse_wheel_filename
+
+THIS_DIR = Path(__file__).absolute().parent
+REPOSITORY_PATH = THIS_DIR.parent.parent
+DEFAULT_TOLERANCE = 0.2
+REQUIREMENTS = "oll-test-top-level~=2.0.0"
+PACKAGE = "oll-test-top-level"
+INITIAL_VERSION = "2.0.0"
+METRICS = ("wall_time_s", "subprocesses", "bytes_copied", "peak_rss_bytes")
+
+
+class SimpleIndexHandler(BaseHTTPRequestHandler):
+    """PEP 503 simple index of the wheels in `wheels_path`, files under `/files/`."""
+
+    def __init__(self, *args, wheels_path: Path, **kwargs):
+        self.wheels_path = wheels_path
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _get_projects(self) -> Dict[str, List[Path]]:
+        projects = {}
+        for wheel_path in sorted(self.wheels_path.glob("*.whl")):
+            name = canonicalize_name(parse_wheel_filename(wheel_path.name)[0])
+            projects.setdefault(name, []).append(wheel_path)
+        return projects
+
+    def _get_body(self) -> Optional[bytes]:
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts == ["simple"]:
+            links = [f'<a href="/simple/{name}/">{name}</a>' for name in self._get_projects()]
+        elif len(parts) == 2 and parts[0] == "simple":
+            wheel_paths = self._get_projects().get(canonicalize_name(parts[1]))
+            if wheel_paths is None:
+                return None
+            links = [
+                f'<a href="/files/{path.name}#sha256='
+                f'{hashlib.sha256(path.read_bytes()).hexdigest()}">{path.name}</a>'
+                for path in wheel_paths
+            ]
+        elif len(parts) == 2 and parts[0] == "files":
+            wheel_path = self.wheels_path / parts[1]
+            return wheel_path.read_bytes() if wheel_path.is_file() else None
+        else:
+            return None
+        return f"<!DOCTYPE html><html><body>{'<br/>'.join(links)}</body></html>".encode()
+
+    def _respond(self, send_body: bool) -> None:
+        body = self._get_body()
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        is_page = self.path.startswith("/simple")
+        self.send_header("Content-Type", "text/html" if is_page else "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+
+@contextmanager
+def serve_simple_index(wheels_path: Path):
+    """Serve `wheels_path` as a simple index and yield its URL."""
+    handler = functools.partial(SimpleIndexHandler, wheels_path=Path(wheels_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/simple/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@dataclass
+class ScenarioContext:
+    workdir: Path
+    wheels_path: str
+    index_url: str
+
+    @property
+    def envs_home(self) -> str:
+        return str(self.workdir / "envs")
+
+    @property
+    def venv_path(self) -> str:
+        return str(Path(self.envs_home, REQUIREMENTS))
+
+
+def _create_initial_venv(context: ScenarioContext) -> None:
+    from upgrade.scripts.manage_venv import create_venv
+    from upgrade.scripts.utils import installer
+
+    Path(context.envs_home).mkdir(parents=True, exist_ok=True)
+    py_executable = create_venv(
+        context.envs_home, REQUIREMENTS, None, local_installation_path=str(REPOSITORY_PATH)
+    )
+    installer(
+        "install",
+        f"{PACKAGE}=={INITIAL_VERSION}",
+        "--no-index",
+        "--find-links",
+        context.wheels_path,
+        py_executable=py_executable,
+    )
+
+
+def _warm_venv_template(context: ScenarioContext) -> None:
+    from upgrade.scripts.manage_venv import create_venv
+
+    scratch_home = context.workdir / "scratch"
+    scratch_home.mkdir(parents=True, exist_ok=True)
+    create_venv(str(scratch_home), REQUIREMENTS, None, local_installation_path=str(REPOSITORY_PATH))
+    shutil.rmtree(scratch_home)
+
+
+def _upgrade_python_package(context: ScenarioContext, local: bool) -> None:
+    from upgrade.scripts.upgrade_python_package import upgrade_python_package
+    from upgrade.scripts.utils import get_venv_executable
+
+    # the upgrade targets the environment of sys.executable
+    sys.executable = get_venv_executable(context.venv_path)
+    upgrade_python_package(
+        PACKAGE,
+        wheels_path=context.wheels_path,
+        version="~=2.0.0",
+        cloudsmith_url=None if local else context.index_url,
+        test=True,
+        skip_post_install=True,
+        update_from_local_wheels=local,
+        format_output=True,
+        update_all=not local,
+    )
+
+
+def _build_and_upgrade_venv(context: ScenarioContext, blue_green: bool = False) -> None:
+    from upgrade.scripts.manage_venv import build_and_upgrade_venv
+
+    build_and_upgrade_venv(
+        REQUIREMENTS,
+        context.envs_home,
+        auto_upgrade=True,
+        wheels_path=context.wheels_path,
+        update_from_local_wheels=True,
+        blue_green_deployment=blue_green,
+        local_installation_path=str(REPOSITORY_PATH),
+    )
+
+
+def _find_compatible_versions(context: ScenarioContext) -> None:
+    from upgrade.scripts.find_compatible_versions import find_compatible_versions
+
+    find_compatible_versions(
+        context.venv_path, REQUIREMENTS, None, cloudsmith_url=context.index_url, test=True
+    )
+
+
+@dataclass
+class Scenario:
+    setup: Callable[[ScenarioContext], None]
+    run: Callable[[ScenarioContext], None]
+
+
+SCENARIOS = {
+    "upgrade_python_package_local_wheels": Scenario(
+        _create_initial_venv, functools.partial(_upgrade_python_package, local=True)
+    ),
+    "upgrade_python_package_index": Scenario(
+        _create_initial_venv, functools.partial(_upgrade_python_package, local=False)
+    ),
+    "build_and_upgrade_venv_new": Scenario(_warm_venv_template, _build_and_upgrade_venv),
+    "build_and_upgrade_venv_existing": Scenario(_create_initial_venv, _build_and_upgrade_venv),
+    "build_and_upgrade_venv_blue_green": Scenario(
+        _create_initial_venv, functools.partial(_build_and_upgrade_venv, blue_green=True)
+    ),
+    "find_compatible_versions": Scenario(_create_initial_venv, _find_compatible_versions),
+}
+
+
+def _get_peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return unit * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def _failed_run(error: str) -> dict:
+    return {**{metric: None for metric in METRICS}, "error": error}
+
+
+def measure_scenario(scenario: Scenario, context: ScenarioContext) -> dict:
+    """Run `scenario` in this process and return its metrics.
+
+    A scenario that raises reports only the error, as the metrics of a partial
+    run are not comparable to the baseline.
+    """
+    from mock import patch
+
+    from upgrade.scripts import manage_venv, venv_clone, venv_template
+
+    counters = {"subprocesses": 0, "bytes_copied": 0}
+    original_popen = subprocess.Popen
+
+    class CountingPopen(original_popen):
+        def __init__(self, *args, **kwargs):
+            counters["subprocesses"] += 1
+            super().__init__(*args, **kwargs)
+
+    def counting_clone_venv(*args, **kwargs):
+        strategy, bytes_copied = venv_clone.clone_venv(*args, **kwargs)
+        counters["bytes_copied"] += bytes_copied
+        return strategy, bytes_copied
+
+    with patch.object(subprocess, "Popen", CountingPopen), patch.object(
+        manage_venv, "clone_venv", counting_clone_venv
+    ), patch.object(venv_template, "clone_venv", counting_clone_venv):
+        start_time = time.perf_counter()
+        try:
+            scenario.run(context)
+        except Exception as e:
+            return _failed_run(str(e))
+        wall_time = time.perf_counter() - start_time
+    return {
+        "wall_time_s": round(wall_time, 3),
+        "subprocesses": counters["subprocesses"],
+        "bytes_copied": counters["bytes_copied"],
+        "peak_rss_bytes": _get_peak_rss_bytes(),
+        "error": None,
+    }
+
+
+def _scenario_env(workdir: Path, cache_dir: Path, index_url: Optional[str] = None) -> dict:
+    env = dict(os.environ)
+    env.update(
+        UPGRADE_VENV_TEMPLATE_DIR=str(cache_dir / "venv-templates"),
+        UPGRADE_WHEELHOUSE_DIR=str(workdir / "wheelhouse"),
+        UPGRADE_WHEEL_INDEX_DIR=str(workdir / "wheel-index"),
+        UPGRADE_INDEX_CACHE_DIR=str(workdir / "index-cache"),
+        UPGRADE_PREFETCH_DIR=str(workdir / "prefetch"),
+        PIP_DISABLE_PIP_VERSION_CHECK="1",
+    )
+    if index_url is not None:
+        # measured runs resolve everything from the local index stand-in
+        env["PIP_INDEX_URL"] = index_url
+        env.pop("PIP_EXTRA_INDEX_URL", None)
+    return env
+
+
+def _run_worker(name: str, phase: str, context: ScenarioContext, env: dict) -> Optional[dict]:
+    output_path = context.workdir / f"{phase}.json"
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "upgrade.tests.benchmark",
+            "--worker",
+            name,
+            "--phase",
+            phase,
+            "--workdir",
+            str(context.workdir),
+            "--wheels-path",
+            context.wheels_path,
+            "--index-url",
+            context.index_url,
+            "--output",
+            str(output_path),
+        ],
+        cwd=str(REPOSITORY_PATH),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return json.loads(output_path.read_text()) if output_path.is_file() else None
+
+
+def run_benchmarks(
+    names: List[str], wheels_path: str, repeat: int = 1, cache_dir: Optional[Path] = None
+) -> Dict[str, dict]:
+    """Set up and measure each scenario `repeat` times and return the median metrics."""
+    cache_dir = Path(cache_dir or tempfile.mkdtemp(prefix="upgrade-benchmark-cache-"))
+    results = {}
+    with serve_simple_index(Path(wheels_path)) as index_url:
+        for name in names:
+            runs = []
+            for _ in range(repeat):
+                workdir = Path(tempfile.mkdtemp(prefix=f"upgrade-benchmark-{name}-"))
+                context = ScenarioContext(workdir, str(wheels_path), index_url)
+                try:
+                    _run_worker(name, "setup", context, _scenario_env(workdir, cache_dir))
+                    run = _run_worker(
+                        name, "run", context, _scenario_env(workdir, cache_dir, index_url)
+                    )
+                    runs.append(run or _failed_run("worker wrote no results"))
+                except subprocess.CalledProcessError as e:
+                    phase = e.cmd[e.cmd.index("--phase") + 1]
+                    runs.append(_failed_run(f"{phase} worker exited with code {e.returncode}"))
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            results[name] = {
+                metric: statistics.median(run[metric] for run in runs)
+                if all(run[metric] is not None for run in runs)
+                else None
+                for metric in METRICS
+            }
+            results[name]["errors"] = [run["error"] for run in runs if run["error"]]
+    return results
+
+
+def compare_to_baseline(
+    results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """Return a description of every metric that regressed against the baseline.
+
+    Subprocess counts regress on any increase, other metrics when they grow by
+    more than `tolerance` (a fraction of the baseline value).
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric in METRICS:
+            current = metrics.get(metric)
+            previous = baseline.get(name, {}).get(metric)
+            if current is None or previous is None:
+                continue
+            allowed = previous if metric == "subprocesses" else previous * (1 + tolerance)
+            if current > allowed:
+                regressions.append(f"{name} {metric}: {previous} -> {current}")
+    return regressions
+
+
+def _print_results(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    print(f"{'scenario':<36}" + "".join(f"{metric:>18}" for metric in METRICS))
+    for name, metrics in results.items():
+        row = f"{name:<36}"
+        for metric in METRICS:
+            value = metrics.get(metric)
+            previous = baseline.get(name, {}).get(metric)
+            text = "-" if value is None else str(value)
+            if value is not None and previous:
+                text += f" ({(value - previous) / previous:+.0%})"
+            row += f"{text:>18}"
+        print(row)
+        for error in metrics.get("errors", []):
+            print(f"  error: {error}")
+
+
+def _worker_main(parsed_args) -> None:
+    context = ScenarioContext(
+        Path(parsed_args.workdir), parsed_args.wheels_path, parsed_args.index_url
+    )
+    scenario = SCENARIOS[parsed_args.worker]
+    if parsed_args.phase == "setup":
+        scenario.setup(context)
+        return
+    metrics = measure_scenario(scenario, context)
+    Path(parsed_args.output).write_text(json.dumps(metrics))
+
+
+def _get_default_wheels_path() -> Path:
+    repository = THIS_DIR / "repository"
+    if any(repository.glob("*.whl")):
+        return repository
+    return THIS_DIR / "data" / "wheels_dir"
+
+
+def _generate_wheels(versions: List[str]) -> Path:
+    from upgrade.tests.generate import generate_wheels
+
+    version_paths = list((THIS_DIR / "data").glob("*/VERSION"))
+    original_versions = {path: path.read_text() for path in version_paths}
+    try:
+        for version in versions:
+            wheels_path = generate_wheels(version)
+    finally:
+        for path, version in original_versions.items():
+            path.write_text(version)
+    return wheels_path
+
+
+parser = argparse.ArgumentParser(description="Benchmark upgrades over local wheels")
+parser.add_argument(
+    "--scenario",
+    action="append",
+    choices=sorted(SCENARIOS),
+    help="Scenario to run, may be repeated. All scenarios are run by default.",
+)
+parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario")
+parser.add_argument("--wheels-path", help="Directory of the wheels to upgrade from")
+parser.add_argument(
+    "--generate",
+    nargs="+",
+    metavar="VERSION",
+    help="Build wheels of the test projects at these versions into `repository` first",
+)
+parser.add_argument(
+    "--baseline",
+    help="Baseline file to compare to; required unless running a worker",
+)
+parser.add_argument(
+    "--save-baseline", action="store_true", help="Store the results in the baseline file"
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=DEFAULT_TOLERANCE,
+    help="Allowed relative growth of wall time, bytes copied and peak RSS",
+)
+parser.add_argument("--output", help="Also write the results to this JSON file")
+parser.add_argument("--worker", help=argparse.SUPPRESS)
+parser.add_argument("--phase", choices=["setup", "run"], help=argparse.SUPPRESS)
+parser.add_argument("--workdir", help=argparse.SUPPRESS)
+parser.add_argument("--index-url", help=argparse.SUPPRESS)
+
+
+def main() -> int:
+    parsed_args = parser.parse_args()
+    if parsed_args.worker:
+        _worker_main(parsed_args)
+        return 0
+    if not parsed_args.baseline:
+        parser.error("--baseline is required; record one with --baseline <file> --save-baseline")
+
+    if parsed_args.generate:
+        wheels_path = _generate_wheels(parsed_args.generate)
+    else:
+        wheels_path = Path(parsed_args.wheels_path or _get_default_wheels_path())
+    results = run_benchmarks(
+        parsed_args.scenario or list(SCENARIOS), str(wheels_path), max(1, parsed_args.repeat)
+    )
+    if parsed_args.output:
+        Path(parsed_args.output).write_text(json.dumps(results, indent=2))
+
+    baseline_path = Path(parsed_args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.is_file() else {}
+    _print_results(results, baseline)
+    failed = [name for name, metrics in results.items() if metrics["errors"]]
+    if failed:
+        # a baseline or comparison without these scenarios would hide the failure
+        print(f"FAILED {', '.join(failed)}")
+        return 1
+    if parsed_args.save_baseline:
+        baseline_path.write_text(json.dumps({**baseline, **results}, indent=2) + "\n")
+        print(f"Saved baseline to {baseline_path}")
+        return 0
+    if not baseline:
+        print(f"No baseline at {baseline_path}; run with --save-baseline to record one.")
+        return 0
+    regressions = compare_to_baseline(results, baseline, parsed_args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
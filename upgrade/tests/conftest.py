@@ -5,6 +5,7 @@ from pathlib import Path
 
 import pytest
 
+from upgrade.scripts import wheel_index
 from upgrade.scripts.upgrade_python_package import run
 from upgrade.scripts.utils import is_windows
 
@@ -29,6 +30,30 @@ def pytest_configure(config):
     sys.modules["oll"] = None
 
 
+@pytest.fixture(autouse=True)
+def wheelhouse_dir(tmp_path, monkeypatch):
+    path = tmp_path / "wheelhouse"
+    monkeypatch.setenv("UPGRADE_WHEELHOUSE_DIR", str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def wheel_index_dir(tmp_path, monkeypatch):
+    path = tmp_path / "wheel-index"
+    monkeypatch.setenv("UPGRADE_WHEEL_INDEX_DIR", str(path))
+    monkeypatch.setattr(wheel_index, "_wheel_indexes", {})
+    return path
+
+
+@pytest.fixture(autouse=True)
+def prefetch_dir(tmp_path, monkeypatch):
+    path = tmp_path / "prefetch"
+    monkeypatch.setenv("UPGRADE_PREFETCH_DIR", str(path))
+    # installs of the tests must not reach out to the package index
+    monkeypatch.setenv("UPGRADE_PREFETCH_DISABLED", "1")
+    return path
+
+
 @pytest.fixture(scope="session", autouse=True)
 def setup_venv():
     if VENV_PATH.exists():
@@ -50,17 +50,17 @@ def run(*command, **kwargs):
     return completed.stdout if raw else completed.stdout.rstrip()
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--version", help="Version of test projects")
-if __name__ == "__main__":
-    parsed_args = parser.parse_args()
-    version = parsed_args.version
+def generate_wheels(version=None, wheels_path=None):
+    """Build wheels of the test projects in `data` into `wheels_path`
+    (`repository` by default), optionally setting their version first.
+    Return the path of the wheels directory."""
     this_dir = Path(__file__).absolute().parent
     projects_dir = this_dir / "data"
-    wheels_path = this_dir / "repository"
+    wheels_path = Path(wheels_path or this_dir / "repository")
     wheels_path.mkdir(parents=True, exist_ok=True)
     for path in projects_dir.iterdir():
-        if path == projects_dir:
+        # `data` also holds prebuilt wheel directories
+        if not (path / "setup.py").is_file():
             continue
         if version:
             version_path = path / "VERSION"
@@ -76,3 +76,11 @@ if __name__ == "__main__":
                 "--outdir",
                 str(wheels_path),
             )
+    return wheels_path
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--version", help="Version of test projects")
+if __name__ == "__main__":
+    parsed_args = parser.parse_args()
+    generate_wheels(parsed_args.version)
@@ -1,3 +1,4 @@
+import json
 from functools import wraps
 from pathlib import Path
 
@@ -5,6 +6,7 @@ import pytest
 from mock import patch
 
 from upgrade.tests.utils import remove_directory
+from upgrade.scripts.index_cache import IndexPage
 from upgrade.scripts.upgrade_python_package import run
 
 from upgrade.scripts.utils import get_venv_executable, is_windows
@@ -67,6 +69,13 @@ def envs_home(request, path=""):
     yield path
 
 
+@pytest.fixture(autouse=True)
+def venv_templates_dir(tmp_path, monkeypatch):
+    templates_dir = tmp_path / "venv-templates"
+    monkeypatch.setenv("UPGRADE_VENV_TEMPLATE_DIR", str(templates_dir))
+    return templates_dir
+
+
 @pytest.fixture()
 def mock_cloudsmith_url_valid():
     with patch("upgrade.scripts.validations.is_cloudsmith_url_valid", lambda *_,: True):
@@ -118,8 +127,29 @@ def mock_package_index_html():
     </html>
     """
     with patch(
-        "upgrade.scripts.find_compatible_versions._get_package_index_html",
-        lambda *_,: index_html_page,
+        "upgrade.scripts.find_compatible_versions._get_package_index_page",
+        lambda *_,: IndexPage([index_html_page.encode()], "text/html"),
+    ):
+        yield
+
+
+@pytest.fixture()
+def mock_package_index_json():
+    index_json_page = json.dumps(
+        {
+            "meta": {"api-version": "1.0"},
+            "name": "oll-test-top-level",
+            "files": [
+                {"filename": f"oll_test_top_level-{version}-py3-none-any.whl"}
+                for version in ["1.0.0", "2.0.0", "2.0.1", "2.1.0"]
+            ],
+        }
+    )
+    with patch(
+        "upgrade.scripts.find_compatible_versions._get_package_index_page",
+        lambda *_,: IndexPage(
+            [index_json_page.encode()], "application/vnd.pypi.simple.v1+json"
+        ),
     ):
         yield
 
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import pytest
+from mock import patch
+
+from upgrade.scripts.manage_venv import _bootstrap_venv
+
+
+@pytest.fixture
+def recorded_commands():
+    commands = []
+
+    def run(*command, **kwargs):
+        commands.append([str(word) for word in command])
+        return ""
+
+    with patch("upgrade.scripts.manage_venv.run", run), patch(
+        "upgrade.scripts.utils.run", run
+    ), patch("upgrade.scripts.utils.is_uv_available", return_value=True), patch(
+        "upgrade.scripts.manage_venv.is_uv_available", return_value=True
+    ):
+        yield commands
+
+
+def test_bootstrap_venv_where_uv_is_available_expect_uv_venv_and_no_ensurepip(
+    recorded_commands, tmp_path
+):
+    env_path = tmp_path / "oll-test-top-level==2.0.0"
+
+    cut = _bootstrap_venv
+    cut(env_path, "1.0.0")
+
+    expected = ["uv", "venv", "--python", sys.executable, str(env_path)]
+    actual = recorded_commands[0]
+
+    assert actual == expected
+    assert not any("ensurepip" in command for command in recorded_commands)
+    assert all(command[:2] == ["uv", "pip"] for command in recorded_commands[1:])
+    assert ["pip", "setuptools"] == recorded_commands[1][-2:]
+
+
+def test_bootstrap_venv_where_stdlib_bootstrap_is_forced_expect_venv_and_ensurepip(
+    recorded_commands, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("UPGRADE_VENV_BOOTSTRAP", "stdlib")
+    env_path = tmp_path / "oll-test-top-level==2.0.0"
+
+    cut = _bootstrap_venv
+    cut(env_path, "1.0.0")
+
+    expected = [sys.executable, "-m", "venv", "--without-pip", str(env_path)]
+    actual = recorded_commands[0]
+
+    assert actual == expected
+    assert recorded_commands[1][1:] == ["-m", "ensurepip"]
+    assert Path(recorded_commands[1][0]).parent.parent == env_path
@@ -1,5 +1,9 @@
 from pathlib import Path
 
+import pytest
+from mock import patch
+
+from upgrade.scripts.exceptions import UpgradeError
 from upgrade.scripts.manage_venv import (
     build_and_upgrade_venv,
 )
@@ -76,3 +80,49 @@ def test_build_and_upgrade_venv_where_v2_0_1_venv_exists_and_auto_upgrade_is_ena
     pip("check", py_executable=venv_executable)
 
     assert_dependencies_installed_in_venv(venv_executable, expected_installed_version)
+
+
+def test_build_and_upgrade_venv_where_v2_0_1_venv_is_at_latest_version_expect_venv_not_cloned(
+    initial_v2_0_1_venv, envs_home, wheels_dir, mock_cloudsmith_url_valid, capfd
+):
+    dependency_to_install = "oll-test-top-level~=2.0.1"
+
+    cut = build_and_upgrade_venv
+    with patch(
+        "upgrade.scripts.manage_venv.temporary_upgrade_venv",
+        side_effect=AssertionError("venv should not be cloned"),
+    ):
+        cut(
+            dependency_to_install,
+            envs_home,
+            auto_upgrade=True,
+            wheels_path=str(wheels_dir),
+            update_from_local_wheels=True,
+            additional_dependencies=["oll-dependency1"],
+            log_location=Path(envs_home, "manage_venv.log"),
+        )
+    out, _ = capfd.readouterr()
+
+    expected = "No compatible upgrades available. Venv unchanged."
+    actual = out
+
+    assert expected in actual
+
+
+def test_build_and_upgrade_venv_where_v2_0_1_venv_at_latest_version_is_broken_expect_error(
+    initial_v2_0_1_venv, envs_home, wheels_dir, mock_cloudsmith_url_valid
+):
+    dependency_to_install = "oll-test-top-level~=2.0.1"
+    venv_executable = get_venv_executable(Path(envs_home, dependency_to_install))
+    pip("uninstall", "-y", "oll-dependency2", py_executable=venv_executable)
+
+    cut = build_and_upgrade_venv
+    with pytest.raises(UpgradeError):
+        cut(
+            dependency_to_install,
+            envs_home,
+            auto_upgrade=True,
+            wheels_path=str(wheels_dir),
+            update_from_local_wheels=True,
+            log_location=Path(envs_home, "manage_venv.log"),
+        )
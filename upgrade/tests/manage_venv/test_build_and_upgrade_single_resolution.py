@@ -0,0 +1,70 @@
+from pathlib import Path
+
+from mock import patch
+
+from upgrade.scripts.manage_venv import (
+    build_and_upgrade_venv,
+    installer,
+    upgrade_venv_single_resolution,
+)
+from upgrade.scripts.requirements import to_requirements_obj
+from upgrade.scripts.upgrade_python_package import pip
+from upgrade.scripts.utils import get_venv_executable
+from upgrade.tests.manage_venv.test_utils import assert_dependencies_installed_in_venv
+
+
+def test_upgrade_venv_single_resolution_where_v2_0_0_venv_exists_expect_one_install_and_versions(
+    initial_v2_0_0_venv, envs_home, wheels_dir
+):
+    venv_executable = get_venv_executable(Path(envs_home, "oll-test-top-level~=2.0.0"))
+    requirements_obj = to_requirements_obj("oll-test-top-level~=2.0.0")
+
+    cut = upgrade_venv_single_resolution
+    with patch(
+        "upgrade.scripts.manage_venv.installer", wraps=installer
+    ) as installer_mock:
+        response = cut(
+            venv_executable,
+            requirements_obj,
+            None,
+            str(wheels_dir),
+            True,
+            ["oll-dependency1"],
+        )
+
+    expected = [
+        {"package": "oll-test-top-level", "from": "2.0.0", "to": "2.0.1"},
+        {"package": "oll-dependency1", "from": "2.0.0", "to": "2.0.1"},
+    ]
+    actual = response.packages
+
+    assert installer_mock.call_count == 1
+    assert actual == expected
+    assert response.success
+    assert "oll-dependency2" in {
+        package["package"] for package in response.updated_packages
+    }
+
+
+def test_build_and_upgrade_venv_where_single_resolution_and_v2_0_1_venv_expect_venv_consistent(
+    initial_v2_0_1_venv, envs_home, wheels_dir, mock_cloudsmith_url_valid
+):
+    dependency_to_install = "oll-test-top-level~=2.0.1"
+    expected_installed_version = "2.0.1"
+
+    cut = build_and_upgrade_venv
+    cut(
+        dependency_to_install,
+        envs_home,
+        auto_upgrade=True,
+        wheels_path=str(wheels_dir),
+        update_from_local_wheels=True,
+        log_location=Path(envs_home, "manage_venv.log"),
+        single_resolution=True,
+    )
+
+    venv_executable = get_venv_executable(Path(envs_home, dependency_to_install))
+
+    pip("check", py_executable=venv_executable)
+
+    assert_dependencies_installed_in_venv(venv_executable, expected_installed_version)
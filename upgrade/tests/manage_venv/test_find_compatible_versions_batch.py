@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from upgrade.scripts.find_compatible_versions import (
+    discover_venvs,
+    find_compatible_versions_batch,
+)
+
+
+def test_find_compatible_versions_batch_where_envs_home_has_v2_0_0_venv_expect_ndjson_line_per_venv(
+    initial_v2_0_0_venv, envs_home, mock_package_index_html, capfd
+):
+    batch_entries = discover_venvs(envs_home) + [
+        {
+            "venv_path": str(Path(envs_home, "missing")),
+            "requirements": "oll-test-top-level~=2.0.0",
+        },
+        {"venv_path": str(Path(envs_home, "invalid")), "requirements": "~~invalid"},
+    ]
+
+    cut = find_compatible_versions_batch
+    actual = cut(batch_entries, test=True)
+
+    expected_venv_path = str(Path(envs_home, "oll-test-top-level~=2.0.0"))
+    assert actual[0] == {
+        "venvPath": expected_venv_path,
+        "package": "oll-test-top-level",
+        "currentVersion": "2.0.0",
+        "responseStatus": "AVAILABLE",
+        "compatibleVersion": "2.0.1",
+    }
+    assert [response["responseStatus"] for response in actual[1:]] == ["ERROR", "ERROR"]
+
+    out, _ = capfd.readouterr()
+    printed = [json.loads(line) for line in out.splitlines() if line.startswith("{")]
+    assert printed == actual
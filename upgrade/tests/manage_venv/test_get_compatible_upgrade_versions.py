@@ -1,6 +1,14 @@
+import json
 from pathlib import Path
 
-from upgrade.scripts.find_compatible_versions import get_compatible_version
+from upgrade.scripts.find_compatible_versions import (
+    _iter_html_index_versions,
+    _parse_json_index_versions,
+    filter_compatible_versions,
+    find_upgrade_version,
+    get_compatible_upgrade_versions,
+    get_compatible_version,
+)
 from upgrade.scripts.requirements import to_requirements_obj
 
 
@@ -59,3 +67,92 @@ def test_get_compatible_version_where_current_is_2_0_0_and_venv_without_specifie
     expected = "2.1.0"
 
     assert actual == expected
+
+
+def test_get_compatible_upgrade_versions_where_index_returns_json_expect_compatible_versions(
+    mock_package_index_json,
+):
+    cut = get_compatible_upgrade_versions
+
+    actual = cut(to_requirements_obj("oll-test-top-level~=2.0.0"), "https://index/simple/")
+    expected = ["2.0.1", "2.0.0"]
+
+    assert actual == expected
+
+
+def test_filter_compatible_versions_where_duplicate_and_incompatible_versions_expect_sorted_compatible():
+    from packaging.version import Version
+
+    cut = filter_compatible_versions
+
+    versions = [Version(v) for v in ["2.0.0", "2.0.1", "2.1.0", "2.0.1", "2.0.2rc1"]]
+
+    actual = cut(to_requirements_obj("oll-test-top-level~=2.0.0").specifier, versions)
+    expected = ["2.0.1", "2.0.0"]
+
+    assert actual == expected
+
+
+def test_find_upgrade_version_where_newer_compatible_version_expect_newest_returned():
+    cut = find_upgrade_version
+
+    actual = cut(["2.0.2", "2.0.1", "2.0.0"], "2.0.1")
+    expected = "2.0.2"
+
+    assert actual == expected
+
+
+def test_parse_json_index_versions_where_pep_700_versions_present_expect_versions_from_wheel_files():
+    cut = _parse_json_index_versions
+
+    package_index_json = json.dumps(
+        {
+            "meta": {"api-version": "1.1"},
+            "versions": ["2.0.0", "2.0.1", "2.1.0"],
+            "files": [{"filename": "oll_test_top_level-2.0.0-py3-none-any.whl"}],
+        }
+    )
+
+    actual = [str(version) for version in cut(package_index_json)]
+    expected = ["2.0.0"]
+
+    assert actual == expected
+
+
+def test_parse_json_index_versions_where_yanked_sdist_and_unparsable_files_expect_skipped():
+    cut = _parse_json_index_versions
+
+    package_index_json = json.dumps(
+        {
+            "meta": {"api-version": "1.0"},
+            "files": [
+                {"filename": "oll_test_top_level-2.0.0-py3-none-any.whl", "yanked": False},
+                {"filename": "oll_test_top_level-2.0.1-py3-none-any.whl", "yanked": "broken"},
+                {"filename": "oll_test_top_level-2.1.0.tar.gz"},
+                {"filename": "oll_test_top_level-2.1.0.zip"},
+                {"filename": "oll_test_top_level-not.a.version-py3-none-any.whl"},
+                {"filename": "oll_test_top_level-2.1.1-py3-none-any.whl"},
+            ],
+        }
+    )
+
+    actual = [str(version) for version in cut(package_index_json)]
+    expected = ["2.0.0", "2.1.1"]
+
+    assert actual == expected
+
+
+def test_iter_html_index_versions_where_page_streamed_in_small_chunks_expect_all_versions():
+    page = "<html><body>" + "".join(
+        f"<a>oll_test_top_level-2.0.{patch}-py3-none-any.whl</a><br />"
+        for patch in range(1000)
+    )
+    page += "</body></html>"
+    chunks = [page[i:i + 7].encode() for i in range(0, len(page), 7)]
+
+    cut = _iter_html_index_versions
+
+    actual = [str(version) for version in cut(chunks)]
+    expected = [f"2.0.{patch}" for patch in range(1000)]
+
+    assert actual == expected
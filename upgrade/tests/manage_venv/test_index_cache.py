@@ -0,0 +1,135 @@
+import os
+
+from mock import Mock, patch
+
+from upgrade.scripts.index_cache import IndexCache
+
+INDEX_URL = "https://dl.cloudsmith.io/token/org/repo/python/simple/oll-test-top-level/"
+
+
+def _response(status_code, text="", headers=None):
+    response = Mock(status_code=status_code, headers=headers or {})
+    response.iter_content.return_value = [text.encode()]
+    return response
+
+
+def test_index_cache_fetch_where_entry_is_fresh_expect_no_request(tmp_path):
+    cut = IndexCache(str(tmp_path), ttl=60)
+    with patch(
+        "upgrade.scripts.index_cache.request",
+        return_value=_response(200, "<html>v1</html>", {"ETag": '"v1"'}),
+    ) as request:
+        cut.fetch(INDEX_URL).text
+        actual = cut.fetch(INDEX_URL).text
+
+    expected = "<html>v1</html>"
+    assert actual == expected
+    assert request.call_count == 1
+    assert (cut.hits, cut.misses) == (1, 1)
+
+
+def test_index_cache_fetch_where_entry_is_stale_and_not_modified_expect_conditional_request(
+    tmp_path,
+):
+    cut = IndexCache(str(tmp_path), ttl=0)
+    with patch(
+        "upgrade.scripts.index_cache.request",
+        return_value=_response(
+            200,
+            "<html>v1</html>",
+            {"ETag": '"v1"', "Last-Modified": "Mon, 05 Oct 2026 10:00:00 GMT"},
+        ),
+    ):
+        cut.fetch(INDEX_URL).text
+    with patch(
+        "upgrade.scripts.index_cache.request", return_value=_response(304)
+    ) as request:
+        actual = cut.fetch(INDEX_URL).text
+
+    expected = "<html>v1</html>"
+    assert actual == expected
+    request.assert_called_once_with(
+        "GET",
+        INDEX_URL,
+        headers={
+            "If-None-Match": '"v1"',
+            "If-Modified-Since": "Mon, 05 Oct 2026 10:00:00 GMT",
+        },
+        stream=True,
+    )
+    assert (cut.hits, cut.misses) == (1, 1)
+
+
+def test_index_cache_fetch_where_page_changed_expect_new_page_cached(tmp_path):
+    cut = IndexCache(str(tmp_path), ttl=0)
+    with patch(
+        "upgrade.scripts.index_cache.request",
+        side_effect=[
+            _response(200, "<html>v1</html>", {"ETag": '"v1"'}),
+            _response(200, "<html>v2</html>", {"ETag": '"v2"'}),
+        ],
+    ):
+        cut.fetch(INDEX_URL).text
+        actual = cut.fetch(INDEX_URL).text
+
+    expected = "<html>v2</html>"
+    assert actual == expected
+    assert (cut.hits, cut.misses) == (0, 2)
+
+
+def test_index_cache_evict_where_cache_exceeds_max_bytes_expect_least_recently_used_removed(
+    tmp_path,
+):
+    cut = IndexCache(str(tmp_path), ttl=60, max_bytes=10**6)
+    with patch(
+        "upgrade.scripts.index_cache.request",
+        side_effect=[_response(200, "a" * 400), _response(200, "b" * 400)],
+    ):
+        cut.fetch(INDEX_URL + "a/").text
+        cut.fetch(INDEX_URL + "b/").text
+
+    meta_path, _ = cut._paths(INDEX_URL + "a/")
+    stat_result = meta_path.stat()
+    os.utime(str(meta_path), (stat_result.st_atime - 100, stat_result.st_mtime - 100))
+    cut.max_bytes = 600
+    cut.evict()
+
+    assert not cut._paths(INDEX_URL + "a/")[1].exists()
+    assert cut._paths(INDEX_URL + "b/")[1].exists()
+    assert "token" not in "".join(path.name for path in tmp_path.iterdir())
+
+
+def test_index_cache_fetch_where_accept_differs_expect_separate_entries_with_content_type(
+    tmp_path,
+):
+    cut = IndexCache(str(tmp_path), ttl=60)
+    json_content_type = "application/vnd.pypi.simple.v1+json"
+    with patch(
+        "upgrade.scripts.index_cache.request",
+        side_effect=[
+            _response(200, "<html></html>", {"Content-Type": "text/html"}),
+            _response(200, "{}", {"Content-Type": json_content_type}),
+        ],
+    ) as request:
+        cut.fetch(INDEX_URL).text
+        cut.fetch(INDEX_URL, accept=json_content_type).text
+        page = cut.fetch(INDEX_URL, accept=json_content_type)
+
+    actual = (page.text, page.content_type)
+    expected = ("{}", json_content_type)
+    assert actual == expected
+    assert request.call_args_list[1][1]["headers"] == {"Accept": json_content_type}
+
+
+def test_index_cache_fetch_where_page_not_fully_read_expect_page_not_cached(tmp_path):
+    cut = IndexCache(str(tmp_path), ttl=60)
+    response = _response(200)
+    response.iter_content.return_value = [b"<html>", b"</html>"]
+    with patch("upgrade.scripts.index_cache.request", return_value=response):
+        chunks = cut.fetch(INDEX_URL).chunks
+        next(chunks)
+        chunks.close()
+
+    actual = list(tmp_path.iterdir())
+    expected = []
+    assert actual == expected
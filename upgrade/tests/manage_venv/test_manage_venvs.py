@@ -0,0 +1,33 @@
+import json
+
+from upgrade.scripts.manage_venv import manage_venvs
+
+
+def test_manage_venvs_where_one_venv_exists_and_one_requirement_is_invalid_expect_failure_isolated(
+    initial_v2_0_0_venv, envs_home, wheels_dir, capfd
+):
+    requirements_list = ["oll-test-top-level~=2.0.0", "~~invalid", "oll-test-top-level~=2.0.0"]
+
+    cut = manage_venvs
+    actual = cut(
+        envs_home,
+        requirements_list,
+        max_workers=2,
+        auto_upgrade=False,
+        wheels_path=str(wheels_dir),
+        update_from_local_wheels=True,
+        test=True,
+    )
+
+    expected_venvs = [
+        {"requirements": "oll-test-top-level~=2.0.0", "responseStatus": "UPGRADED"},
+        {"requirements": "~~invalid", "responseStatus": "ERROR"},
+    ]
+    assert actual["responseStatus"] == "ERROR"
+    assert [
+        {key: venv[key] for key in ("requirements", "responseStatus")}
+        for venv in actual["venvs"]
+    ] == expected_venvs
+
+    out, _ = capfd.readouterr()
+    assert json.loads(out.splitlines()[-1]) == actual
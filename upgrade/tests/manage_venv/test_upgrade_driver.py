@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from upgrade.scripts.upgrade_driver import upgrade_package
+from upgrade.scripts.upgrade_python_package import pip
+from upgrade.scripts.utils import get_venv_executable
+from upgrade.tests.manage_venv.test_utils import assert_dependencies_installed_in_venv
+
+
+def test_upgrade_package_where_v2_0_0_venv_exists_expect_venv_upgraded_and_structured_result(
+    initial_v2_0_0_venv, envs_home, wheels_dir
+):
+    venv_executable = get_venv_executable(Path(envs_home, "oll-test-top-level~=2.0.0"))
+
+    cut = upgrade_package
+    actual = cut(
+        venv_executable,
+        "oll-test-top-level",
+        version="~=2.0.0",
+        wheels_path=str(wheels_dir),
+        update_from_local_wheels=True,
+        update_all=True,
+    )
+
+    expected = [{"package": "oll-test-top-level", "from": "2.0.0", "to": "2.0.1"}]
+
+    assert actual.result == "upgraded"
+    assert actual.success
+    assert actual.packages == expected
+    assert actual.to_response()["success"] is True
+    pip("check", py_executable=venv_executable)
+    assert_dependencies_installed_in_venv(venv_executable, "2.0.1")
+
+
+def test_upgrade_package_where_wheel_does_not_exist_expect_failed_result_instead_of_exception(
+    initial_v2_0_0_venv, envs_home, wheels_dir
+):
+    venv_executable = get_venv_executable(Path(envs_home, "oll-test-top-level~=2.0.0"))
+
+    cut = upgrade_package
+    actual = cut(
+        venv_executable,
+        "oll-missing-package",
+        wheels_path=str(wheels_dir),
+        update_from_local_wheels=True,
+    )
+
+    expected = "upgrade_failed"
+
+    assert actual.result == expected
+    assert not actual.success
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from upgrade.scripts.venv_clone import CloneStrategy, clone_venv
+
+
+@pytest.fixture
+def fake_venv(tmp_path):
+    venv_path = tmp_path / "venv"
+    site_packages = venv_path / "lib" / "python3.11" / "site-packages"
+    (site_packages / "pkg").mkdir(parents=True)
+    (site_packages / "pkg-1.0.dist-info").mkdir()
+    (venv_path / "bin").mkdir()
+    (venv_path / "pyvenv.cfg").write_text("home = /usr/bin\n")
+    (venv_path / "bin" / "pkg").write_text("#!/usr/bin/python\n")
+    (site_packages / "pkg" / "__init__.py").write_text("x = 1\n" * 100)
+    (site_packages / "pkg-1.0.dist-info" / "RECORD").write_text("pkg/__init__.py,,\n")
+    (site_packages / "easy-install.pth").write_text("/src\n")
+    return venv_path
+
+
+def _files(path):
+    return {
+        str(os.path.relpath(os.path.join(root, name), path))
+        for root, _, names in os.walk(path)
+        for name in names
+    }
+
+
+def test_clone_venv_where_hardlink_strategy_expect_only_site_packages_modules_linked(
+    fake_venv, tmp_path
+):
+    clone_path = tmp_path / "venv_green"
+
+    cut = clone_venv
+    strategy, bytes_copied = cut(str(fake_venv), str(clone_path), [CloneStrategy.HARDLINK])
+
+    site_packages = os.path.join("lib", "python3.11", "site-packages")
+    linked = {
+        path
+        for path in _files(clone_path)
+        if os.stat(clone_path / path).st_ino == os.stat(fake_venv / path).st_ino
+    }
+    assert strategy == CloneStrategy.HARDLINK
+    assert _files(clone_path) == _files(fake_venv)
+    assert linked == {os.path.join(site_packages, "pkg", "__init__.py")}
+    assert bytes_copied == sum(
+        os.path.getsize(fake_venv / path) for path in _files(fake_venv) - linked
+    )
+
+
+def test_clone_venv_where_copy_strategy_expect_all_bytes_copied(fake_venv, tmp_path):
+    clone_path = tmp_path / "venv_green"
+
+    cut = clone_venv
+    strategy, bytes_copied = cut(str(fake_venv), str(clone_path), [CloneStrategy.COPY])
+
+    assert strategy == CloneStrategy.COPY
+    assert _files(clone_path) == _files(fake_venv)
+    assert bytes_copied == sum(
+        os.path.getsize(fake_venv / path) for path in _files(fake_venv)
+    )
+
+
+def test_clone_venv_where_reflink_is_tried_first_expect_complete_clone(fake_venv, tmp_path):
+    clone_path = tmp_path / "venv_green"
+
+    cut = clone_venv
+    strategy, _ = cut(
+        str(fake_venv), str(clone_path), [CloneStrategy.REFLINK, CloneStrategy.COPY]
+    )
+
+    assert strategy in (CloneStrategy.REFLINK, CloneStrategy.COPY)
+    assert _files(clone_path) == _files(fake_venv)
+    assert (clone_path / "bin" / "pkg").read_text() == "#!/usr/bin/python\n"
+
+
+def test_clone_venv_where_clone_parent_does_not_exist_expect_parent_created(
+    fake_venv, tmp_path
+):
+    clone_path = tmp_path / "envs" / "venv"
+
+    cut = clone_venv
+    cut(str(fake_venv), str(clone_path), [CloneStrategy.HARDLINK])
+
+    expected = _files(fake_venv)
+    actual = _files(clone_path)
+
+    assert actual == expected
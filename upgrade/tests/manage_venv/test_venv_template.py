@@ -0,0 +1,137 @@
+import json
+import os
+
+import pytest
+from mock import patch
+
+from upgrade.scripts.manage_venv import create_venv
+from upgrade.scripts.utils import get_venv_executable, run
+from upgrade.scripts.venv_template import (
+    TEMPLATE_METADATA_FILE,
+    create_venv_from_template,
+    get_template_key,
+    get_venv_template,
+)
+
+
+@pytest.fixture
+def fake_build_venv():
+    built_paths = []
+
+    def build_venv(path):
+        built_paths.append(path)
+        site_packages = os.path.join(path, "lib", "python3.11", "site-packages")
+        os.makedirs(site_packages)
+        os.makedirs(os.path.join(path, "bin"))
+        with open(os.path.join(path, "pyvenv.cfg"), "w") as pyvenv_cfg:
+            pyvenv_cfg.write(f"home = /usr/bin\ncommand = /usr/bin/python -m venv {path}\n")
+        with open(os.path.join(path, "bin", "pip"), "w") as script:
+            script.write(f"#!{path}/bin/python\n")
+
+    build_venv.built_paths = built_paths
+    return build_venv
+
+
+def test_get_venv_template_where_template_exists_expect_built_once(
+    fake_build_venv, venv_templates_dir
+):
+    key = {"python": "3.11", "upgrade_python_package": "latest"}
+
+    cut = get_venv_template
+    first = cut(key, fake_build_venv)
+    second = cut(key, fake_build_venv)
+
+    assert first == second
+    assert len(fake_build_venv.built_paths) == 1
+    assert json.loads((first / TEMPLATE_METADATA_FILE).read_text())["key"] == key
+
+
+def test_get_venv_template_where_key_changes_expect_new_template_built(
+    fake_build_venv, venv_templates_dir
+):
+    cut = get_venv_template
+    first = cut({"upgrade_python_package": "1.0.0"}, fake_build_venv)
+    second = cut({"upgrade_python_package": "2.0.0"}, fake_build_venv)
+
+    assert first != second
+    assert len(fake_build_venv.built_paths) == 2
+
+
+def test_get_venv_template_where_template_expired_expect_rebuilt(
+    fake_build_venv, venv_templates_dir, monkeypatch
+):
+    key = {"upgrade_python_package": "latest"}
+    monkeypatch.setenv("UPGRADE_VENV_TEMPLATE_MAX_AGE", "-1")
+
+    cut = get_venv_template
+    cut(key, fake_build_venv)
+    template_path = cut(key, fake_build_venv)
+
+    assert len(fake_build_venv.built_paths) == 2
+    assert template_path.is_dir()
+    assert sorted(os.listdir(venv_templates_dir)) == [template_path.name]
+
+
+def test_get_template_key_where_no_version_requested_expect_latest_version_from_index():
+    def pip(*args, **kwargs):
+        report_path = args[args.index("--report") + 1]
+        with open(report_path, "w") as report_file:
+            json.dump({"install": [{"metadata": {"version": "1.2.3"}}]}, report_file)
+        return ""
+
+    cut = get_template_key
+    with patch("upgrade.scripts.utils.pip", side_effect=pip):
+        actual = cut()
+
+    assert actual["upgrade_python_package"] == "1.2.3"
+
+
+def test_get_template_key_where_local_installation_changed_expect_new_key(tmp_path):
+    (tmp_path / "pyproject.toml").write_text("[project]\nversion = '1.0.0'\n")
+    first = get_template_key(local_installation_path=str(tmp_path))
+    (tmp_path / "pyproject.toml").write_text("[project]\nversion = '1.0.1'\n")
+    os.utime(str(tmp_path / "pyproject.toml"), ns=(0, 0))
+
+    cut = get_template_key
+    actual = cut(local_installation_path=str(tmp_path))
+
+    assert actual != first
+    assert actual["upgrade_python_package"].startswith(f"local:{tmp_path}:")
+
+
+def test_create_venv_from_template_expect_template_paths_rewritten(
+    fake_build_venv, venv_templates_dir, tmp_path
+):
+    template_path = get_venv_template({"python": "3.11"}, fake_build_venv)
+    venv_path = tmp_path / "envs" / "oll-test-top-level==2.0.0"
+    venv_path.parent.mkdir()
+
+    cut = create_venv_from_template
+    cut(str(venv_path), template_path)
+
+    expected = f"#!{venv_path}/bin/python\n"
+    actual = (venv_path / "bin" / "pip").read_text()
+
+    assert actual == expected
+    assert str(venv_path) in (venv_path / "pyvenv.cfg").read_text()
+    assert not (venv_path / TEMPLATE_METADATA_FILE).exists()
+
+
+def test_create_venv_where_template_exists_expect_new_venv_cloned_from_template(
+    envs_home, venv_templates_dir, mock_install_upgrade_python_package
+):
+    cut = create_venv
+    cut(envs_home, "oll-test-top-level==2.0.0", None)
+    with patch("upgrade.scripts.manage_venv._bootstrap_venv") as bootstrap_venv:
+        py_executable = cut(envs_home, "oll-test-top-level==2.0.1", None)
+
+    expected = get_venv_executable(os.path.join(envs_home, "oll-test-top-level==2.0.1"))
+    actual = py_executable
+
+    assert actual == expected
+    assert not bootstrap_venv.called
+    assert len(os.listdir(venv_templates_dir)) == 1
+    run(py_executable, "-m", "pip", "check")
+    pip_script = os.path.join(os.path.dirname(py_executable), "pip")
+    with open(pip_script) as script:
+        assert script.readline() == f"#!{py_executable}\n"
@@ -0,0 +1,128 @@
+"""Startup-time budget of the CLI entry points.
+
+Each entry point module is imported in a fresh interpreter with
+`python -X importtime`. Recorded per entry point:
+- cumulative import time of the module (median of `--repeat` runs)
+- modules of `DEFERRED_MODULES` imported at startup
+
+`requests`, `lxml`, `packaging` and `multiprocessing` are only imported by the
+code paths that use them, so a thin client delegating to the upgrade agent, or
+a run that does nothing, does not pay for them. The exit code is 1 if an entry
+point imports any of them at startup or exceeds its budget in
+`STARTUP_BUDGETS_MS`. Budgets are multiplied by `--budget-scale` (default
+UPGRADE_STARTUP_BUDGET_SCALE or 1) on slow machines.
+
+    python -m upgrade.tests.startup --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+REPOSITORY_PATH = Path(__file__).absolute().parent.parent.parent
+ENTRY_POINTS = {
+    "upgrade": "upgrade.scripts.upgrade_python_package",
+    "managevenv": "upgrade.scripts.manage_venv",
+    "find-compatible-version": "upgrade.scripts.find_compatible_versions",
+}
+# about twice the median import time; eager imports of DEFERRED_MODULES are
+# caught by their own check even if they fit in the budget
+STARTUP_BUDGETS_MS = {
+    "upgrade": 160,
+    "managevenv": 200,
+    "find-compatible-version": 120,
+}
+DEFERRED_MODULES = ("requests", "urllib3", "lxml", "packaging", "multiprocessing")
+
+
+def parse_importtime(output: str) -> Dict[str, int]:
+    """Return the cumulative import time in microseconds of every module in the
+    `-X importtime` output."""
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            import_times[module.strip()] = int(cumulative)
+    return import_times
+
+
+def _get_deferred_module(module: str) -> Optional[str]:
+    for deferred in DEFERRED_MODULES:
+        if module == deferred or module.startswith(f"{deferred}."):
+            return deferred
+    return None
+
+
+def measure_startup(module: str, repeat: int = 1) -> dict:
+    """Import `module` in `repeat` fresh interpreters and return its median
+    import time and the deferred modules it imported."""
+    import_times_ms = []
+    deferred_imports = set()
+    env = {**os.environ, "PYTHONPATH": str(REPOSITORY_PATH)}
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+        import_times = parse_importtime(result.stderr)
+        import_times_ms.append(import_times[module] / 1000)
+        deferred_imports.update(filter(None, map(_get_deferred_module, import_times)))
+    return {
+        "import_time_ms": round(statistics.median(import_times_ms), 1),
+        "deferred_imports": sorted(deferred_imports),
+    }
+
+
+def check_startup(results: Dict[str, dict], budget_scale: float = 1.0) -> List[str]:
+    """Return a description of every budget exceeded and deferred module imported."""
+    failures = []
+    for name, result in results.items():
+        budget_ms = STARTUP_BUDGETS_MS[name] * budget_scale
+        if result["import_time_ms"] > budget_ms:
+            failures.append(f"{name} import time: {result['import_time_ms']} ms > {budget_ms} ms")
+        if result["deferred_imports"]:
+            failures.append(f"{name} imports {', '.join(result['deferred_imports'])}")
+    return failures
+
+
+parser = argparse.ArgumentParser(prog="python -m upgrade.tests.startup")
+parser.add_argument(
+    "--entry-point", action="append", choices=sorted(ENTRY_POINTS), help="Entry points to run"
+)
+parser.add_argument("--repeat", type=int, default=3, help="Runs per entry point")
+parser.add_argument(
+    "--budget-scale",
+    type=float,
+    default=float(os.environ.get("UPGRADE_STARTUP_BUDGET_SCALE") or 1),
+    help="Multiplier of the budgets, for slow machines",
+)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parsed_args = parser.parse_args(argv)
+    results = {
+        name: measure_startup(ENTRY_POINTS[name], parsed_args.repeat)
+        for name in parsed_args.entry_point or ENTRY_POINTS
+    }
+    for name, result in results.items():
+        print(
+            f"{name:<24} {result['import_time_ms']:>8} ms "
+            f"(budget {STARTUP_BUDGETS_MS[name] * parsed_args.budget_scale} ms)"
+        )
+    failures = check_startup(results, parsed_args.budget_scale)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import logging
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from mock import patch
+
+from upgrade.scripts import agent
+from upgrade.scripts.agent import VenvLocks, create_agent_server, run_in_agent
+from upgrade.scripts.find_compatible_versions import parser as find_compatible_parser
+from upgrade.scripts.logging_config import (
+    bind_job_logging,
+    configure_script_logging,
+    install_job_log_router,
+    job_logging,
+)
+
+
+# Unix socket paths are limited to about 104 bytes on macOS, too short for tmp_path
+requires_unix_sockets = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Unix sockets are not available"
+)
+
+
+@pytest.fixture
+def agent_server(monkeypatch):
+    socket_dir = tempfile.mkdtemp(prefix="upgrade-agent-", dir="/tmp")
+    socket_path = agent.Path(socket_dir) / "agent.sock"
+    monkeypatch.setenv("UPGRADE_AGENT_SOCKET", str(socket_path))
+    monkeypatch.delenv("UPGRADE_AGENT_DISABLED", raising=False)
+    monkeypatch.setattr(sys, "stdout", agent._JobOutput(sys.stdout, "stdout"))
+    monkeypatch.setattr(sys, "stderr", agent._JobOutput(sys.stderr, "stderr"))
+    root = logging.getLogger()
+    root_handlers = list(root.handlers)
+    install_job_log_router()
+    server = create_agent_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    root.handlers[:] = root_handlers
+    shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+def _check_args(*args):
+    return find_compatible_parser.parse_args(["--requirements", "oll-test-top-level", *args])
+
+
+def test_venv_locks_where_envs_home_and_its_venv_expect_conflict_and_other_venv_not():
+    cut = VenvLocks()
+    with cut.hold(["/envs/a"]):
+        actual_other_venv = cut._conflicts((agent.Path("/envs/b"),))
+        actual_envs_home = cut._conflicts((agent.Path("/envs"),))
+        actual_same_venv = cut._conflicts((agent.Path("/envs/a"),))
+    actual_released = cut._conflicts((agent.Path("/envs/a"),))
+
+    assert not actual_other_venv
+    assert actual_envs_home
+    assert actual_same_venv
+    assert not actual_released
+
+
+@requires_unix_sockets
+def test_run_in_agent_where_agent_running_expect_job_output_and_exit_code(
+    agent_server, tmp_path, capsys, caplog
+):
+    def run_parsed_args(parsed_args):
+        configure_script_logging(
+            log_location=str(tmp_path / "job.log"), default_log_location="", test=False
+        )
+        logging.info("checking %s", parsed_args.venv_path)
+        print('{"responseStatus": "AT_LATEST_VERSION"}')
+        sys.exit(3)
+
+    with patch(
+        "upgrade.scripts.find_compatible_versions.run_parsed_args",
+        side_effect=run_parsed_args,
+    ), caplog.at_level(logging.INFO):
+        cut = run_in_agent
+        actual = cut("check", _check_args("--venv-path", "venvs/a"))
+
+    out, _ = capsys.readouterr()
+
+    assert actual == 3
+    assert out == '{"responseStatus": "AT_LATEST_VERSION"}\n'
+    assert "checking /" in (tmp_path / "job.log").read_text()
+    assert not (tmp_path / "job.log").with_name("job.error.log").read_text()
+
+
+@requires_unix_sockets
+def test_agent_server_where_upgrade_from_other_python_expect_rejected(agent_server):
+    cut = agent_server.handle_request
+    actual = cut({"job": "upgrade", "args": {}, "executable": "/envs/other/bin/python"})
+
+    assert actual["status"] == "rejected"
+
+
+@requires_unix_sockets
+def test_agent_server_where_client_environment_differs_expect_rejected(agent_server):
+    environment = {**agent.get_job_environment(), "UPGRADE_METRICS_DIR": "/var/lib/metrics"}
+
+    cut = agent_server.handle_request
+    actual = cut(
+        {
+            "job": "check",
+            "args": vars(_check_args("--venv-path", "/envs/a")),
+            "executable": sys.executable,
+            "environment": environment,
+        }
+    )
+
+    assert actual["status"] == "rejected"
+    assert actual["reason"].endswith(": UPGRADE_METRICS_DIR")
+
+
+@requires_unix_sockets
+def test_run_in_agent_where_only_client_sets_slack_webhook_url_expect_run_locally(
+    agent_server,
+):
+    # the agent runs in this process, so only the client's environment is replaced
+    client_environment = {"SLACK_WEBHOOK_URL": "https://hooks.example.com/services/x"}
+
+    cut = run_in_agent
+    with patch(
+        "upgrade.scripts.agent.get_job_environment",
+        side_effect=[client_environment, {}],
+    ), patch("upgrade.scripts.find_compatible_versions.run_parsed_args") as run_mock:
+        actual = cut("check", _check_args("--venv-path", "venvs/a"))
+
+    assert actual is None
+    run_mock.assert_not_called()
+
+
+def test_run_in_agent_where_socket_is_stale_expect_run_locally(tmp_path, monkeypatch):
+    socket_path = tmp_path / "agent.sock"
+    socket_path.write_text("")
+    monkeypatch.setenv("UPGRADE_AGENT_SOCKET", str(socket_path))
+
+    cut = run_in_agent
+    actual = cut("check", _check_args("--venv-path", "venvs/a"))
+
+    assert actual is None
+
+
+def test_bind_job_logging_where_logged_from_thread_pool_expect_record_in_job_log(tmp_path):
+    root = logging.getLogger()
+    root_handlers = list(root.handlers)
+    install_job_log_router()
+    try:
+        with job_logging():
+            configure_script_logging(
+                log_location=str(tmp_path / "job.log"), default_log_location="", test=False
+            )
+            cut = bind_job_logging
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(cut(logging.warning), "logged from a pool thread").result()
+    finally:
+        root.handlers[:] = root_handlers
+
+    assert "logged from a pool thread" in (tmp_path / "job.log").read_text()
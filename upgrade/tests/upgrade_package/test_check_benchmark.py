@@ -0,0 +1,142 @@
+import hashlib
+import subprocess
+import urllib.request
+
+from mock import patch
+
+from upgrade.tests.benchmark import (
+    Scenario,
+    ScenarioContext,
+    compare_to_baseline,
+    main,
+    measure_scenario,
+    run_benchmarks,
+    serve_simple_index,
+)
+
+BASELINE = {
+    "find_compatible_versions": {
+        "wall_time_s": 1.0,
+        "subprocesses": 2,
+        "bytes_copied": 0,
+        "peak_rss_bytes": 1000,
+    }
+}
+
+
+def test_compare_to_baseline_where_within_tolerance_expect_no_regressions():
+    results = {
+        "find_compatible_versions": {
+            "wall_time_s": 1.15,
+            "subprocesses": 2,
+            "bytes_copied": 0,
+            "peak_rss_bytes": None,
+        },
+        "build_and_upgrade_venv_new": {"wall_time_s": 10.0},
+    }
+
+    cut = compare_to_baseline
+    expected = []
+    actual = cut(results, BASELINE, tolerance=0.2)
+
+    assert actual == expected
+
+
+def test_compare_to_baseline_where_slower_and_more_subprocesses_expect_regressions():
+    results = {
+        "find_compatible_versions": {
+            "wall_time_s": 1.5,
+            "subprocesses": 3,
+            "bytes_copied": 0,
+            "peak_rss_bytes": 1100,
+        }
+    }
+
+    cut = compare_to_baseline
+    expected = [
+        "find_compatible_versions wall_time_s: 1.0 -> 1.5",
+        "find_compatible_versions subprocesses: 2 -> 3",
+    ]
+    actual = cut(results, BASELINE, tolerance=0.2)
+
+    assert actual == expected
+
+
+def test_serve_simple_index_where_wheels_dir_expect_project_page_with_hashes(wheels_dir):
+    wheel_name = "oll_test_top_level-2.0.0-py2.py3-none-any.whl"
+    sha256 = hashlib.sha256((wheels_dir / wheel_name).read_bytes()).hexdigest()
+
+    cut = serve_simple_index
+    with cut(wheels_dir) as index_url:
+        with urllib.request.urlopen(f"{index_url}oll-test-top-level/") as response:
+            actual = response.read().decode()
+        wheel_url = f"{index_url.replace('/simple/', '/files/')}{wheel_name}"
+        with urllib.request.urlopen(wheel_url) as response:
+            wheel = response.read()
+
+    assert f'href="/files/{wheel_name}#sha256={sha256}"' in actual
+    assert hashlib.sha256(wheel).hexdigest() == sha256
+
+
+def test_run_benchmarks_where_workers_fail_or_write_no_results_expect_errors_and_no_metrics(
+    wheels_dir, tmp_path
+):
+    def run_worker(name, phase, context, env):
+        if phase == "setup" and context.workdir.name.endswith("first"):
+            raise subprocess.CalledProcessError(1, ["python", "--phase", phase])
+        return None
+
+    cut = run_benchmarks
+    with patch("upgrade.tests.benchmark._run_worker", side_effect=run_worker), patch(
+        "upgrade.tests.benchmark.tempfile.mkdtemp",
+        side_effect=[str(tmp_path / "cache"), str(tmp_path / "first"), str(tmp_path / "second")],
+    ):
+        actual = cut(["find_compatible_versions"], str(wheels_dir), repeat=2)
+
+    expected = {
+        "wall_time_s": None,
+        "subprocesses": None,
+        "bytes_copied": None,
+        "peak_rss_bytes": None,
+        "errors": ["setup worker exited with code 1", "worker wrote no results"],
+    }
+
+    assert actual == {"find_compatible_versions": expected}
+
+
+def test_measure_scenario_where_run_raises_expect_error_and_no_metrics(tmp_path):
+    def run(context):
+        raise RuntimeError("index unreachable")
+
+    cut = measure_scenario
+
+    actual = cut(Scenario(lambda context: None, run), ScenarioContext(tmp_path, "", ""))
+    expected = {
+        "wall_time_s": None,
+        "subprocesses": None,
+        "bytes_copied": None,
+        "peak_rss_bytes": None,
+        "error": "index unreachable",
+    }
+
+    assert actual == expected
+
+
+def test_main_where_scenario_failed_expect_exit_code_1_and_baseline_not_saved(tmp_path):
+    baseline_path = tmp_path / "baseline.json"
+    results = {
+        "find_compatible_versions": {
+            **{metric: None for metric in BASELINE["find_compatible_versions"]},
+            "errors": ["run worker exited with code 1"],
+        }
+    }
+
+    cut = main
+    with patch("upgrade.tests.benchmark.run_benchmarks", return_value=results), patch(
+        "sys.argv",
+        ["benchmark", "--baseline", str(baseline_path), "--save-baseline"],
+    ):
+        actual = cut()
+
+    assert actual == 1
+    assert not baseline_path.exists()
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from upgrade.scripts.command_ledger import describe_command, record_commands
+from upgrade.scripts.utils import run
+from upgrade.tests.conftest import original_executable
+
+REPOSITORY_PATH = str(Path(__file__).parents[3])
+
+CHILD_RUN = (
+    "from upgrade.scripts.command_ledger import record_commands\n"
+    "from upgrade.scripts.utils import run\n"
+    "with record_commands('upgrade_python_package'):\n"
+    "    run('echo', 'child')\n"
+)
+
+
+def test_run_where_commands_succeed_and_fail_expect_both_recorded():
+    with record_commands("upgrade_python_package") as commands:
+        run("echo", "hello")
+        with pytest.raises(subprocess.CalledProcessError):
+            run(original_executable, "-c", "import sys; sys.exit(3)")
+
+    actual = [
+        (record.name, record.arg_count, record.exit_code, record.output_bytes)
+        for record in commands.commands
+    ]
+    expected = [
+        ("echo hello", 1, 0, len("hello\n")),
+        (os.path.basename(original_executable), 2, 3, 0),
+    ]
+
+    assert actual == expected
+    assert commands.summary_fields()["subprocesses"] == 2
+
+
+def test_describe_command_where_option_values_given_expect_only_module_and_subcommand():
+    cut = describe_command
+    expected = "python3 -m pip install"
+    actual = cut(
+        ["/envs/venv/bin/python3", "-m", "pip", "install", "--index-url", "https://u:t@host/"]
+    )
+
+    assert actual == expected
+
+
+def test_record_commands_where_traced_expect_nested_child_run_merged(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.json"
+    monkeypatch.setenv("UPGRADE_TRACE_FILE", str(trace_file))
+    env = {**os.environ, "PYTHONPATH": REPOSITORY_PATH}
+
+    cut = record_commands
+    with cut("manage_venv"):
+        run(original_executable, "-c", CHILD_RUN, env=env)
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    runs = {event["pid"]: event["name"] for event in events if event.get("cat") == "run"}
+    child_pid = next(pid for pid, name in runs.items() if name == "upgrade_python_package")
+    parent_command, child_command = (
+        next(
+            event
+            for event in events
+            if event.get("cat") == "subprocess" and event["pid"] == pid
+        )
+        for pid in (os.getpid(), child_pid)
+    )
+
+    assert runs[os.getpid()] == "manage_venv"
+    assert child_command["name"] == "echo child"
+    assert parent_command["ts"] <= child_command["ts"]
+    assert (
+        child_command["ts"] + child_command["dur"]
+        <= parent_command["ts"] + parent_command["dur"]
+    )
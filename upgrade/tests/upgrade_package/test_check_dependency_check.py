@@ -0,0 +1,75 @@
+import subprocess
+import sys
+
+import pytest
+from mock import patch
+
+from upgrade.scripts.dependency_check import (
+    NO_BROKEN_REQUIREMENTS,
+    check_dependencies,
+    get_marker_environment,
+)
+from upgrade.scripts.exceptions import BrokenRequirementsFound
+from upgrade.tests.upgrade_package.conftest import install_local_package
+
+
+def _pip_check_output():
+    return subprocess.run(
+        [sys.executable, "-m", "pip", "check"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    ).stdout.strip()
+
+
+def test_check_dependencies_where_dependencies_missing_and_conflicting_expect_pip_check_report():
+    install_local_package("oll_test_top_level-2.0.1-py2.py3-none-any.whl", no_deps=True)
+    install_local_package("oll_dependency1-2.0.0-py2.py3-none-any.whl", no_deps=True)
+
+    cut = check_dependencies
+    with pytest.raises(BrokenRequirementsFound) as e:
+        cut(sys.executable)
+
+    expected = sorted(_pip_check_output().splitlines())
+    actual = sorted(str(e.value).splitlines())
+
+    assert actual == expected
+    assert [conflict.dependency for conflict in e.value.conflicts] == [
+        "oll-dependency1",
+        "oll-dependency2",
+    ]
+
+
+def test_check_dependencies_where_all_dependencies_installed_expect_no_broken_requirements():
+    install_local_package("oll_test_top_level-2.0.1-py2.py3-none-any.whl")
+
+    cut = check_dependencies
+    actual = cut(sys.executable)
+
+    assert actual == NO_BROKEN_REQUIREMENTS
+    assert _pip_check_output() == NO_BROKEN_REQUIREMENTS
+
+
+def test_check_dependencies_where_pip_check_enabled_expect_pip_check_run(monkeypatch):
+    monkeypatch.setenv("UPGRADE_USE_PIP_CHECK", "1")
+
+    cut = check_dependencies
+    with patch(
+        "upgrade.scripts.dependency_check.pip", return_value=NO_BROKEN_REQUIREMENTS
+    ) as pip_mock:
+        actual = cut(sys.executable)
+
+    assert actual == NO_BROKEN_REQUIREMENTS
+    pip_mock.assert_called_once_with("check", py_executable=sys.executable)
+
+
+def test_get_marker_environment_where_venv_of_other_python_version_expect_its_version(tmp_path):
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "python").touch()
+    (tmp_path / "pyvenv.cfg").write_text("home = /usr/bin\nversion_info = 3.13.0.candidate.1\n")
+
+    cut = get_marker_environment
+    actual = cut(str(tmp_path / "bin" / "python"))
+
+    assert actual["python_version"] == "3.13"
+    assert actual["python_full_version"] == "3.13.0rc1"
@@ -0,0 +1,51 @@
+import pytest
+from mock import patch
+
+from upgrade.scripts import http_client
+
+
+@pytest.fixture(autouse=True)
+def reset_http_client():
+    http_client.configure_http_client()
+    yield
+    http_client.configure_http_client()
+
+
+def test_get_session_where_called_twice_expect_same_pooled_session():
+    cut = http_client.get_session
+
+    expected = cut()
+    actual = cut()
+
+    assert actual is expected
+
+
+def test_configure_http_client_where_timeouts_set_expect_new_session_and_timeouts():
+    session = http_client.get_session()
+
+    cut = http_client.configure_http_client
+    cut(connect_timeout=1, read_timeout=2, retries=5)
+
+    assert http_client.get_session() is not session
+    assert http_client.get_timeout() == (1, 2)
+    adapter = http_client.get_session().get_adapter("https://example.com")
+    assert adapter.max_retries.total == 5
+
+
+@pytest.mark.parametrize(
+    "method, expected_allow_redirects",
+    [("HEAD", False), ("GET", True), ("POST", True)],
+)
+def test_request_where_no_timeout_passed_expect_default_timeout(
+    method, expected_allow_redirects
+):
+    cut = http_client.request
+    with patch("requests.Session.request") as session_request:
+        cut(method, "https://example.com")
+
+    session_request.assert_called_once_with(
+        method,
+        "https://example.com",
+        timeout=http_client.get_timeout(),
+        allow_redirects=expected_allow_redirects,
+    )
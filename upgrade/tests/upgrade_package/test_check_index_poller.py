@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+from mock import patch
+from packaging.version import Version
+
+from upgrade.scripts.index_poller import PollRequest, RateLimiter, poll_packages
+from upgrade.tests.benchmark import serve_simple_index
+
+
+def test_poll_packages_where_local_index_expect_compatible_versions_per_request(
+    wheels_dir, monkeypatch
+):
+    monkeypatch.setenv("UPGRADE_INDEX_CACHE_DISABLED", "1")
+    poll_requests = [
+        PollRequest("oll-test-top-level~=2.0.0", current_version="2.0.0"),
+        PollRequest("oll-test-top-level~=2.0.0", current_version="2.0.1"),
+        "oll-dependency1",
+        "oll-missing-package",
+        "not a requirement!",
+    ]
+
+    cut = poll_packages
+    with serve_simple_index(wheels_dir) as index_url:
+        results = asyncio.run(cut(poll_requests, [index_url]))
+
+    actual = [result.to_response() for result in results]
+
+    assert actual[0]["responseStatus"] == "AVAILABLE"
+    assert actual[0]["compatibleVersion"] == "2.0.1"
+    assert actual[1]["responseStatus"] == "AT_LATEST_VERSION"
+    assert actual[1]["latestVersion"] == "2.1.0"
+    assert actual[2]["compatibleVersion"] == "2.0.1"
+    assert actual[3]["responseStatus"] == "ERROR"
+    assert actual[4]["responseStatus"] == "ERROR"
+    assert actual[4]["package"] is None
+
+
+def test_poll_packages_where_many_packages_expect_host_concurrency_limited():
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def get_available_versions(package_name, index_url):
+        with lock:
+            running.append(package_name)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(package_name)
+        return [Version("1.0.0")]
+
+    cut = poll_packages
+    with patch(
+        "upgrade.scripts.index_poller.get_available_versions",
+        side_effect=get_available_versions,
+    ) as get_versions_mock:
+        results = asyncio.run(
+            cut(
+                [f"package{index}" for index in range(8)] + ["package0>=1"],
+                ["https://index.example/simple/"],
+                host_concurrency=3,
+                rate_limit=0,
+            )
+        )
+
+    assert get_versions_mock.call_count == 8
+    assert max(max_running) == 3
+    assert all(result.latest_version == "1.0.0" for result in results)
+
+
+def test_rate_limiter_where_rate_is_set_expect_acquisitions_spaced_out():
+    async def acquire_all(rate_limiter, count):
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        await asyncio.gather(*(rate_limiter.acquire() for _ in range(count)))
+        return loop.time() - start_time
+
+    cut = RateLimiter
+    actual = asyncio.run(acquire_all(cut(50), 5))
+
+    assert actual >= 4 / 50
@@ -0,0 +1,55 @@
+import sys
+
+from upgrade.scripts.distributions import (
+    get_installed_distributions,
+    get_site_packages_dirs,
+)
+from upgrade.scripts.upgrade_python_package import pip
+from upgrade.tests.upgrade_package.conftest import install_local_package
+from ..conftest import VENV_PATH
+
+
+def test_get_site_packages_dirs_where_executable_is_venv_expect_venv_site_packages():
+    cut = get_site_packages_dirs
+
+    actual = [path.name for path in cut(sys.executable)]
+    expected = ["site-packages"]
+
+    assert actual == expected
+    assert all(VENV_PATH in path.parents for path in cut(sys.executable))
+
+
+def test_get_installed_distributions_where_package_installed_expect_same_versions_as_pip_list():
+    install_local_package("oll_test_top_level-2.0.1-py2.py3-none-any.whl")
+
+    cut = get_installed_distributions
+    actual = cut(sys.executable).get_version("oll_test_top_level")
+    expected = "2.0.1"
+    assert actual == expected
+
+    pip_list = pip("list", "--format=freeze", "--exclude-editable").splitlines()
+    installed = cut(sys.executable).as_dict()
+    assert {
+        f"{name}=={version}" for name, version in installed.items()
+    }.issuperset(pip_list)
+
+
+def test_get_installed_distributions_where_environment_unchanged_expect_cached_index():
+    cut = get_installed_distributions
+
+    expected = cut(sys.executable)
+    actual = cut(sys.executable)
+
+    assert actual is expected
+
+
+def test_get_installed_distributions_where_pip_uninstalls_package_expect_index_refreshed():
+    install_local_package("oll_dependency1-2.0.1-py2.py3-none-any.whl", no_deps=True)
+    cut = get_installed_distributions
+    assert cut(sys.executable).get_version("oll-dependency1") == "2.0.1"
+
+    pip("uninstall", "-y", "oll-dependency1")
+
+    actual = cut(sys.executable).get_version("oll-dependency1")
+    expected = None
+    assert actual == expected
@@ -0,0 +1,106 @@
+import re
+
+from upgrade.scripts.logging_config import log_run_summary
+from upgrade.scripts.metrics import format_run_metrics, write_run_metrics
+
+SUMMARY = dict(
+    script="upgrade_python_package",
+    package="oll-test-top-level",
+    current="2.0.0",
+    target="~=2.0.0",
+    final="2.0.1",
+    result="upgraded",
+    duration_seconds=3.5,
+)
+
+
+def _label_names(content):
+    return {
+        line.split("{")[0]: re.findall(r'(\w+)="', line)
+        for line in content.splitlines()
+        if not line.startswith("#")
+    }
+
+
+def test_format_run_metrics_where_run_upgraded_expect_duration_result_phases_and_versions():
+    cut = format_run_metrics
+    actual = cut(
+        **SUMMARY,
+        extra_fields={"index_cache_hits": 3, "index_cache_misses": 1},
+        phase_durations={"install": 2.25},
+        timestamp=1700000000,
+    )
+
+    labels = 'script="upgrade_python_package",package="oll-test-top-level",venv=""'
+    expected_lines = [
+        f"upgrade_python_package_last_run_timestamp_seconds{{{labels}}} 1700000000.000",
+        f"upgrade_python_package_last_run_duration_seconds{{{labels}}} 3.500",
+        f"upgrade_python_package_last_run_success{{{labels}}} 1",
+        f'upgrade_python_package_last_run_result{{{labels},result="upgraded"}} 1',
+        f'upgrade_python_package_last_run_phase_duration_seconds{{{labels},phase="install"}} 2.250',
+        f"upgrade_python_package_last_run_index_cache_hits{{{labels}}} 3",
+        f"upgrade_python_package_index_cache_hit_ratio{{{labels}}} 0.750",
+        f"upgrade_python_package_version_info{{{labels},"
+        f'current="2.0.0",target="~=2.0.0",final="2.0.1"}} 1',
+    ]
+
+    for line in expected_lines:
+        assert line in actual.splitlines()
+
+
+def test_format_run_metrics_where_run_of_one_venv_failed_expect_same_labels_and_escaped_values():
+    cut = format_run_metrics
+    actual = cut(
+        **{**SUMMARY, "result": "errored"},
+        extra_fields={"requirements": 'oll-test-top-level~=2.0.0 ; extra == "a"'},
+    )
+    single_run = cut(**SUMMARY)
+
+    assert (
+        'upgrade_python_package_last_run_success{script="upgrade_python_package",'
+        'package="oll-test-top-level",venv="oll-test-top-level~=2.0.0 ; extra == \\"a\\""} 0'
+    ) in actual.splitlines()
+    assert _label_names(actual) == _label_names(single_run)
+
+
+def test_log_run_summary_where_metrics_dir_is_set_expect_prom_file_replaced_atomically(
+    tmp_path, monkeypatch
+):
+    metrics_dir = tmp_path / "textfile"
+    monkeypatch.setenv("UPGRADE_METRICS_DIR", str(metrics_dir))
+
+    cut = log_run_summary
+    cut(**SUMMARY)
+    cut(**{**SUMMARY, "result": "errored"})
+    cut(**SUMMARY, extra_fields={"requirements": "oll-test-top-level~=2.0.0"})
+
+    actual = sorted(path.name for path in metrics_dir.iterdir())
+
+    assert len(actual) == 2
+    assert "upgrade_python_package_oll_test_top_level.prom" in actual
+    assert all(name.endswith(".prom") for name in actual)
+    assert (
+        'result="errored"'
+        in (metrics_dir / "upgrade_python_package_oll_test_top_level.prom").read_text()
+    )
+
+
+def test_write_run_metrics_where_metrics_dir_is_not_writable_expect_no_error(
+    tmp_path, monkeypatch
+):
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    monkeypatch.setenv("UPGRADE_METRICS_DIR", str(not_a_dir))
+
+    cut = write_run_metrics
+    actual = cut(**SUMMARY)
+
+    assert actual is None
+
+
+def test_write_run_metrics_where_metrics_dir_is_not_set_expect_nothing_written(
+    monkeypatch,
+):
+    monkeypatch.delenv("UPGRADE_METRICS_DIR", raising=False)
+
+    assert write_run_metrics(**SUMMARY) is None
@@ -0,0 +1,250 @@
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from mock import MagicMock, patch
+
+from upgrade.scripts.prefetch import (
+    StagedWheels,
+    WheelDownload,
+    _with_index_credentials,
+    download_wheels,
+    prefetch_wheels,
+)
+from upgrade.scripts.upgrade_python_package import install_wheel
+from upgrade.tests.upgrade_package.conftest import install_local_package
+from upgrade.scripts.wheelhouse import file_sha256
+
+WHEEL_NAME = "oll_test_top_level-2.0.1-py2.py3-none-any.whl"
+
+
+@pytest.fixture(autouse=True)
+def prefetch_enabled(monkeypatch):
+    monkeypatch.delenv("UPGRADE_PREFETCH_DISABLED")
+
+
+@pytest.fixture
+def wheels_url(wheels_dir):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(wheels_dir))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def _fake_response(status_code, content):
+    response = MagicMock()
+    response.status_code = status_code
+    response.iter_content.return_value = [content]
+    response.__enter__.return_value = response
+    return response
+
+
+def test_prefetch_wheels_where_wheels_are_served_expect_all_wheels_staged_and_verified(
+    wheels_dir, wheels_url, prefetch_dir
+):
+    cut = prefetch_wheels
+    actual = cut(
+        [
+            "install",
+            "oll-test-top-level==2.0.1",
+            "--ignore-installed",
+            "--no-index",
+            "--find-links",
+            wheels_url,
+        ]
+    )
+
+    expected = {
+        "oll_test_top_level-2.0.1-py2.py3-none-any.whl",
+        "oll_dependency1-2.0.1-py2.py3-none-any.whl",
+        "oll_dependency2-2.0.1-py2.py3-none-any.whl",
+    }
+
+    assert {wheel.filename for wheel in actual.wheels} == expected
+    assert actual.path.parent.parent == prefetch_dir
+    assert {path.name for path in actual.path.iterdir()} == expected
+    for wheel in actual.wheels:
+        assert file_sha256(actual.path / wheel.filename) == wheel.sha256
+        assert wheel.sha256 == file_sha256(wheels_dir / wheel.filename)
+
+
+def test_prefetch_wheels_where_resolution_fails_expect_none(wheels_url):
+    cut = prefetch_wheels
+    actual = cut(
+        [
+            "install",
+            "oll-test-top-level==9.9.9",
+            "--no-index",
+            "--find-links",
+            wheels_url,
+        ]
+    )
+
+    assert actual is None
+
+
+def test_download_wheels_where_partial_download_exists_expect_download_resumed(
+    wheels_dir, tmp_path
+):
+    content = (wheels_dir / WHEEL_NAME).read_bytes()
+    staging_dir = tmp_path / "staging"
+    staging_dir.mkdir()
+    (staging_dir / f"{WHEEL_NAME}.part").write_bytes(content[:100])
+    wheel = WheelDownload(
+        "oll-test-top-level",
+        "2.0.1",
+        f"https://example.com/{WHEEL_NAME}",
+        file_sha256(wheels_dir / WHEEL_NAME),
+    )
+
+    cut = download_wheels
+    with patch(
+        "upgrade.scripts.prefetch.http_client.request",
+        return_value=_fake_response(206, content[100:]),
+    ) as request_mock:
+        actual = cut([wheel], staging_dir)
+
+    expected = len(content) - 100
+
+    assert actual == expected
+    assert request_mock.call_args[1]["headers"] == {"Range": "bytes=100-"}
+    assert (staging_dir / WHEEL_NAME).read_bytes() == content
+    assert not (staging_dir / f"{WHEEL_NAME}.part").exists()
+
+
+def test_download_wheels_where_hash_does_not_match_expect_error_and_wheel_not_staged(
+    tmp_path,
+):
+    staging_dir = tmp_path / "staging"
+    wheel = WheelDownload(
+        "oll-test-top-level", "2.0.1", f"https://example.com/{WHEEL_NAME}", "0" * 64
+    )
+
+    cut = download_wheels
+    with patch(
+        "upgrade.scripts.prefetch.http_client.request",
+        return_value=_fake_response(200, b"not a wheel"),
+    ):
+        with pytest.raises(ValueError):
+            cut([wheel], staging_dir)
+
+    assert list(staging_dir.iterdir()) == []
+
+
+def test_with_index_credentials_where_wheel_is_on_index_host_expect_credentials_added():
+    cut = _with_index_credentials
+
+    assert (
+        cut(
+            "https://dl.cloudsmith.io/basic/org/repo/python/pkg.whl",
+            "https://token:x@dl.cloudsmith.io/basic/org/repo/python/simple/",
+        )
+        == "https://token:x@dl.cloudsmith.io/basic/org/repo/python/pkg.whl"
+    )
+    assert (
+        cut(
+            "https://files.pythonhosted.org/pkg.whl",
+            "https://token:x@dl.cloudsmith.io/basic/org/repo/python/simple/",
+        )
+        == "https://files.pythonhosted.org/pkg.whl"
+    )
+
+
+def test_install_wheel_where_wheels_are_prefetched_expect_offline_install_from_staging_dir(
+    tmp_path,
+):
+    staged_wheels = StagedWheels(
+        tmp_path / "staging",
+        [WheelDownload("oll-test-top-level", "2.0.1", f"https://example.com/{WHEEL_NAME}")],
+    )
+
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.prefetch_wheels",
+        return_value=staged_wheels,
+    ), patch(
+        "upgrade.scripts.upgrade_python_package.installer", return_value=""
+    ) as installer_mock, patch(
+        "upgrade.scripts.upgrade_python_package.pip", return_value=""
+    ):
+        cut("oll-test-top-level", "https://example.com/simple/")
+
+    install_args = installer_mock.call_args[0]
+
+    assert "--no-index" in install_args
+    assert "--index-url" not in install_args
+    assert install_args[install_args.index("--find-links") + 1] == str(
+        staged_wheels.path
+    )
+
+
+def test_prefetch_wheels_where_runs_overlap_expect_separate_staging_dirs(wheels_url, prefetch_dir):
+    install_args = [
+        "install",
+        "oll-test-top-level==2.0.1",
+        "--ignore-installed",
+        "--no-index",
+        "--find-links",
+        wheels_url,
+    ]
+
+    cut = prefetch_wheels
+    first = cut(install_args)
+    second = cut(install_args)
+
+    assert first.path != second.path
+    assert {path.name for path in first.path.iterdir()} == {
+        wheel.filename for wheel in first.wheels
+    }
+
+
+def test_install_wheel_where_report_lists_nothing_to_install_expect_installer_not_run():
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.prefetch_wheels",
+        return_value=StagedWheels(),
+    ), patch("upgrade.scripts.upgrade_python_package.installer") as installer_mock:
+        cut("oll-test-top-level", "https://example.com/simple/")
+
+    installer_mock.assert_not_called()
+
+
+def test_install_wheel_where_requested_version_installed_expect_no_prefetch():
+    install_local_package(WHEEL_NAME)
+
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.prefetch_wheels"
+    ) as prefetch_mock, patch(
+        "upgrade.scripts.upgrade_python_package.installer", return_value=""
+    ) as installer_mock:
+        cut("oll-test-top-level", "https://example.com/simple/", version_cmd="==2.0.1")
+
+    prefetch_mock.assert_not_called()
+    installer_mock.assert_called_once()
+
+
+def test_install_wheel_where_install_and_constraints_fallback_fail_expect_staged_wheels_released(
+    tmp_path,
+):
+    staged_wheels = MagicMock(wheels=[MagicMock()])
+    staged_wheels.find_links_args.return_value = ["--no-index", "--find-links", str(tmp_path)]
+
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.prefetch_wheels",
+        return_value=staged_wheels,
+    ), patch(
+        "upgrade.scripts.upgrade_python_package.installer", side_effect=RuntimeError
+    ), patch(
+        "upgrade.scripts.upgrade_python_package.install_with_constraints",
+        side_effect=RuntimeError,
+    ):
+        with pytest.raises(RuntimeError):
+            cut("oll-test-top-level", "https://example.com/simple/")
+
+    staged_wheels.release.assert_called_once()
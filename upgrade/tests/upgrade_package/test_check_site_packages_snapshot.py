@@ -0,0 +1,77 @@
+import sys
+
+import pytest
+
+from upgrade.scripts.distributions import diff_snapshots, snapshot_site_packages
+from upgrade.scripts.upgrade_python_package import pip
+from upgrade.tests.upgrade_package.conftest import install_local_package
+from ..conftest import WHEELS_DIR
+
+
+@pytest.mark.parametrize(
+    "before_snapshot, after_snapshot, expected",
+    [
+        ({"a": ("1.0", (1, 1, 1))}, {"a": ("1.0", (1, 1, 1))}, []),
+        (
+            {},
+            {"a": ("1.0", (1, 1, 1))},
+            [{"package": "a", "from": None, "to": "1.0", "change": "added"}],
+        ),
+        (
+            {"a": ("1.0", (1, 1, 1))},
+            {},
+            [{"package": "a", "from": "1.0", "to": None, "change": "removed"}],
+        ),
+        (
+            {"a": ("1.0", (1, 1, 1))},
+            {"a": ("1.1", (2, 2, 2))},
+            [{"package": "a", "from": "1.0", "to": "1.1", "change": "changed"}],
+        ),
+        (
+            {"a": ("1.0", (1, 1, 1))},
+            {"a": ("1.0", (2, 2, 2))},
+            [{"package": "a", "from": "1.0", "to": "1.0", "change": "changed"}],
+        ),
+        ({"a": ("1.0", None)}, {"a": ("1.0", None)}, []),
+    ],
+)
+def test_diff_snapshots_with_different_changes(before_snapshot, after_snapshot, expected):
+    cut = diff_snapshots
+
+    actual = cut(before_snapshot, after_snapshot)
+
+    assert actual == expected
+
+
+def test_snapshot_site_packages_where_packages_installed_and_reinstalled_expect_changes_reported():
+    cut = snapshot_site_packages
+
+    before_snapshot = cut(sys.executable)
+    install_local_package("oll_test_top_level-2.0.0-py2.py3-none-any.whl")
+    installed_snapshot = cut(sys.executable)
+
+    actual = {
+        entry["package"]: (entry["to"], entry["change"])
+        for entry in diff_snapshots(before_snapshot, installed_snapshot)
+    }
+    expected = {
+        "oll-test-top-level": ("2.0.0", "added"),
+        "oll-dependency1": ("2.0.0", "added"),
+        "oll-dependency2": ("2.0.0", "added"),
+    }
+    assert actual == expected
+
+    pip(
+        "install",
+        "--force-reinstall",
+        "--no-deps",
+        str(WHEELS_DIR / "oll_dependency1-2.0.0-py2.py3-none-any.whl"),
+    )
+    pip("uninstall", "-y", "oll-dependency2")
+
+    actual = diff_snapshots(installed_snapshot, cut(sys.executable))
+    expected = [
+        {"package": "oll-dependency1", "from": "2.0.0", "to": "2.0.0", "change": "changed"},
+        {"package": "oll-dependency2", "from": "2.0.0", "to": None, "change": "removed"},
+    ]
+    assert actual == expected
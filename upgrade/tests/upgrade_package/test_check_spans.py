@@ -0,0 +1,93 @@
+import json
+import logging
+
+from mock import patch
+
+from upgrade.scripts.logging_config import log_run_summary
+from upgrade.scripts.spans import record_spans, span
+from upgrade.scripts.upgrade_python_package import upgrade_python_package
+
+
+def test_span_where_phases_repeat_expect_durations_summed_in_order_of_first_use():
+    cut = span
+    with patch("upgrade.scripts.spans.time.monotonic", side_effect=[0, 1, 1, 3, 3, 7]):
+        with record_spans() as spans:
+            with cut("install"):
+                pass
+            with cut("pip_check"):
+                pass
+            with cut("install"):
+                pass
+
+    expected = {"install": 5.0, "pip_check": 2.0}
+    actual = spans.durations
+
+    assert actual == expected
+    assert list(actual) == ["install", "pip_check"]
+
+
+def test_span_where_used_as_decorator_outside_of_recorder_expect_nothing_recorded():
+    @span("validate_url")
+    def validate_url():
+        return "valid"
+
+    assert validate_url() == "valid"
+    with record_spans() as spans:
+        validate_url()
+    with record_spans() as other_spans:
+        pass
+
+    assert list(spans.durations) == ["validate_url"]
+    assert other_spans.durations == {}
+
+
+def test_log_run_summary_where_phase_durations_given_expect_phase_fields(caplog):
+    cut = log_run_summary
+    with caplog.at_level(logging.INFO):
+        cut(
+            script="upgrade_python_package",
+            package="oll-test-top-level",
+            current="2.0.0",
+            target=None,
+            final="2.0.1",
+            result="upgraded",
+            duration_seconds=3.5,
+            phase_durations={"install": 2.25, "pip_check": 1.0},
+        )
+
+    expected = "duration_s=3.50 install_s=2.25 pip_check_s=1.00"
+    actual = caplog.records[-1].getMessage()
+
+    assert actual.endswith(expected)
+
+
+def test_upgrade_python_package_where_format_output_expect_phase_durations_in_json(
+    capsys, caplog
+):
+    def upgrade_from_local_wheel(*args, **kwargs):
+        with span("install"):
+            return "upgraded", ""
+
+    cut = upgrade_python_package
+    with patch(
+        "upgrade.scripts.upgrade_python_package.upgrade_from_local_wheel",
+        side_effect=upgrade_from_local_wheel,
+    ), caplog.at_level(logging.INFO):
+        cut(
+            "oll-test-top-level",
+            update_from_local_wheels=True,
+            format_output=True,
+            test=True,
+        )
+
+    out, _ = capsys.readouterr()
+    response = json.loads(out.splitlines()[-1])
+    summary = [
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith("summary ")
+    ][-1]
+
+    assert response["success"]
+    assert list(response["phaseDurations"]) == ["install"]
+    assert " install_s=" in summary
@@ -0,0 +1,47 @@
+from upgrade.tests.startup import (
+    ENTRY_POINTS,
+    STARTUP_BUDGETS_MS,
+    check_startup,
+    measure_startup,
+    parse_importtime,
+)
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     urllib3.util
+import time:       850 |        970 |   requests
+import time:      1500 |       2470 | upgrade.scripts.http_client
+"""
+
+
+def test_parse_importtime_where_nested_imports_expect_cumulative_time_per_module():
+    cut = parse_importtime
+    expected = {"urllib3.util": 120, "requests": 970, "upgrade.scripts.http_client": 2470}
+    actual = cut(IMPORTTIME_OUTPUT)
+
+    assert actual == expected
+
+
+def test_check_startup_where_over_budget_and_deferred_import_expect_both_reported():
+    budget_ms = STARTUP_BUDGETS_MS["upgrade"]
+    results = {
+        "upgrade": {"import_time_ms": budget_ms + 1, "deferred_imports": ["requests"]},
+        "managevenv": {"import_time_ms": budget_ms + 1, "deferred_imports": []},
+    }
+
+    cut = check_startup
+    expected = [
+        f"upgrade import time: {budget_ms + 1} ms > {float(budget_ms)} ms",
+        "upgrade imports requests",
+    ]
+    actual = cut(results)
+
+    assert actual == expected
+
+
+def test_measure_startup_where_entry_points_imported_expect_no_deferred_imports():
+    # import time budgets depend on the machine and are checked by `python -m upgrade.tests.startup`
+    cut = measure_startup
+    expected = {name: [] for name in ENTRY_POINTS}
+    actual = {name: cut(module)["deferred_imports"] for name, module in ENTRY_POINTS.items()}
+
+    assert actual == expected
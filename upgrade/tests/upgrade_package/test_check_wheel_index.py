@@ -0,0 +1,199 @@
+import os
+
+from mock import patch
+from packaging.specifiers import SpecifierSet
+from packaging.version import Version
+
+from upgrade.scripts import wheel_index
+from upgrade.scripts.upgrade_python_package import install_wheel
+from upgrade.scripts.wheel_index import WheelIndex, get_wheel_index
+
+
+def _create_wheels(path, *wheel_names):
+    path.mkdir(parents=True, exist_ok=True)
+    for wheel_name in wheel_names:
+        (path / wheel_name).touch()
+    # bump the directory mtime explicitly, file systems with coarse timestamps may not
+    mtime_ns = path.stat().st_mtime_ns + 1_000_000_000
+    os.utime(str(path), ns=(mtime_ns, mtime_ns))
+
+
+def test_get_versions_where_versions_sort_differently_as_strings_expect_version_order(
+    tmp_path,
+):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.10.0-py3-none-any.whl",
+        "oll_pkg-1.9.0-py3-none-any.whl",
+        "oll_pkg-1.2.0-py3-none-any.whl",
+        "oll_other-3.0.0-py3-none-any.whl",
+    )
+
+    cut = WheelIndex(str(wheels_path)).get_versions
+    actual = cut("oll-pkg")
+
+    expected = [Version("1.2.0"), Version("1.9.0"), Version("1.10.0")]
+
+    assert actual == expected
+
+
+def test_find_wheel_where_no_specifier_expect_highest_version(tmp_path):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.10.0-py3-none-any.whl",
+        "oll_pkg-1.9.0-py3-none-any.whl",
+    )
+
+    cut = WheelIndex(str(wheels_path)).find_wheel
+    actual = cut("oll-pkg")
+
+    expected = str(wheels_path / "oll_pkg-1.10.0-py3-none-any.whl")
+
+    assert actual == expected
+
+
+def test_find_wheel_where_exact_pin_expect_pinned_version(tmp_path):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.10.0-py3-none-any.whl",
+        "oll_pkg-1.9.0-py3-none-any.whl",
+        "oll_pkg-1.2.0-py3-none-any.whl",
+    )
+    wheels = WheelIndex(str(wheels_path))
+
+    cut = wheels.find_wheel
+
+    assert cut("oll-pkg", SpecifierSet("==1.9")) == str(
+        wheels_path / "oll_pkg-1.9.0-py3-none-any.whl"
+    )
+    assert cut("oll-pkg", SpecifierSet("==1.3.0")) is None
+    assert cut("oll-pkg", SpecifierSet("==2.0.0")) is None
+
+
+def test_find_wheel_where_prerelease_is_highest_expect_prerelease_only_if_allowed(
+    tmp_path,
+):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.0.0-py3-none-any.whl",
+        "oll_pkg-1.1.0rc1-py3-none-any.whl",
+        "oll_pkg-2.0.0a1-py3-none-any.whl",
+    )
+    wheels = WheelIndex(str(wheels_path))
+
+    cut = wheels.find_wheel
+
+    assert cut("oll-pkg", SpecifierSet(">=1.0")) == str(
+        wheels_path / "oll_pkg-1.0.0-py3-none-any.whl"
+    )
+    assert cut("oll-pkg", SpecifierSet(">=1.0"), prereleases=True) == str(
+        wheels_path / "oll_pkg-2.0.0a1-py3-none-any.whl"
+    )
+    assert cut("oll-pkg", SpecifierSet(">=1.1.0")) == str(
+        wheels_path / "oll_pkg-2.0.0a1-py3-none-any.whl"
+    )
+    assert cut("oll-pkg", SpecifierSet(">=1.1.0"), prereleases=False) is None
+
+
+def test_find_wheel_where_wheel_tags_are_incompatible_expect_compatible_wheel(
+    tmp_path,
+):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.0.0-py3-none-any.whl",
+        "oll_pkg-2.0.0-cp27-cp27mu-manylinux1_x86_64.whl",
+    )
+    wheels = WheelIndex(str(wheels_path))
+
+    assert wheels.find_wheel("oll-pkg") == str(
+        wheels_path / "oll_pkg-1.0.0-py3-none-any.whl"
+    )
+    assert wheels.get_versions("oll-pkg") == [Version("1.0.0")]
+
+
+def test_find_wheel_where_target_is_other_python_version_expect_its_compatible_wheel(
+    tmp_path,
+):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.0.0-cp313-none-any.whl",
+        "oll_pkg-2.0.0-cp27-none-any.whl",
+    )
+    wheels = WheelIndex(str(wheels_path), python_version=(3, 13))
+
+    assert wheels.find_wheel("oll-pkg") == str(
+        wheels_path / "oll_pkg-1.0.0-cp313-none-any.whl"
+    )
+    assert wheels.get_versions("oll-pkg") == [Version("1.0.0")]
+
+
+def test_get_wheel_index_where_venv_of_other_python_version_expect_index_of_its_version(
+    tmp_path,
+):
+    venv_path = tmp_path / "venv"
+    (venv_path / "bin").mkdir(parents=True)
+    (venv_path / "bin" / "python").touch()
+    (venv_path / "pyvenv.cfg").write_text("home = /usr/bin\nversion_info = 3.13.1.final.0\n")
+
+    cut = get_wheel_index
+    actual = cut(str(tmp_path / "wheels"), str(venv_path / "bin" / "python"))
+
+    assert actual.python_version == (3, 13)
+    assert actual is not get_wheel_index(str(tmp_path / "wheels"))
+
+
+def test_refresh_where_index_is_persisted_expect_only_new_wheels_parsed(
+    tmp_path, wheel_index_dir
+):
+    wheels_path = tmp_path / "wheels"
+    _create_wheels(
+        wheels_path,
+        "oll_pkg-1.0.0-py3-none-any.whl",
+        "oll_pkg-1.1.0-py3-none-any.whl",
+    )
+    WheelIndex(str(wheels_path)).refresh()
+
+    assert len(list(wheel_index_dir.glob("*.json"))) == 1
+
+    with patch(
+        "upgrade.scripts.wheel_index._parse_wheel", wraps=wheel_index._parse_wheel
+    ) as parse_mock:
+        wheels = WheelIndex(str(wheels_path))
+        assert wheels.get_versions("oll-pkg") == [Version("1.0.0"), Version("1.1.0")]
+        assert parse_mock.call_count == 0
+
+        _create_wheels(wheels_path, "oll_pkg-1.2.0-py3-none-any.whl")
+        assert wheels.get_versions("oll-pkg") == [
+            Version("1.0.0"),
+            Version("1.1.0"),
+            Version("1.2.0"),
+        ]
+        parse_mock.assert_called_once_with("oll_pkg-1.2.0-py3-none-any.whl")
+
+
+def test_install_wheel_where_local_expect_wheel_selected_from_index(wheels_dir):
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.installer", return_value=""
+    ) as installer_mock, patch(
+        "upgrade.scripts.upgrade_python_package.pip", return_value=""
+    ):
+        cut(
+            "oll-test-top-level",
+            local=True,
+            wheels_path=str(wheels_dir),
+            version_cmd="~=2.0.0",
+        )
+
+    installed_wheel = installer_mock.call_args[0][1]
+
+    expected = str(wheels_dir.absolute() / "oll_test_top_level-2.0.1-py2.py3-none-any.whl")
+
+    assert installed_wheel == expected
+    assert get_wheel_index(str(wheels_dir)).find_wheel("oll-test-top-level") is not None
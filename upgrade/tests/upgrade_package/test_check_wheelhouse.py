@@ -0,0 +1,127 @@
+import os
+import shutil
+
+from mock import patch
+
+from upgrade.scripts.prefetch import StagedWheels, WheelDownload
+from upgrade.scripts.upgrade_python_package import install_wheel
+from upgrade.scripts.wheelhouse import Wheelhouse, file_sha256
+
+WHEEL_NAME = "oll_test_top_level-2.0.0-py2.py3-none-any.whl"
+
+
+def test_wheelhouse_add_where_wheel_is_valid_expect_wheel_and_hash_stored(
+    wheels_dir, wheelhouse_dir
+):
+    cut = Wheelhouse(str(wheelhouse_dir)).add
+    actual = cut(str(wheels_dir / WHEEL_NAME))
+
+    expected = wheelhouse_dir / WHEEL_NAME
+
+    assert actual == expected
+    assert (wheelhouse_dir / f"{WHEEL_NAME}.sha256").read_text() == file_sha256(
+        wheels_dir / WHEEL_NAME
+    )
+
+
+def test_wheelhouse_add_where_hash_does_not_match_expect_wheel_rejected(
+    wheels_dir, wheelhouse_dir
+):
+    cut = Wheelhouse(str(wheelhouse_dir)).add
+    actual = cut(str(wheels_dir / WHEEL_NAME), sha256="0" * 64)
+
+    assert actual is None
+    assert not (wheelhouse_dir / WHEEL_NAME).exists()
+
+
+def test_wheelhouse_find_where_wheel_is_corrupt_expect_wheel_removed(
+    wheels_dir, wheelhouse_dir
+):
+    wheelhouse = Wheelhouse(str(wheelhouse_dir))
+    wheelhouse.add(str(wheels_dir / WHEEL_NAME))
+    (wheelhouse_dir / WHEEL_NAME).write_bytes(b"corrupt")
+
+    cut = wheelhouse.find
+    actual = cut("oll-test-top-level", "2.0.0")
+
+    assert actual == []
+    assert not (wheelhouse_dir / WHEEL_NAME).exists()
+
+
+def test_wheelhouse_evict_where_budget_exceeded_expect_least_recently_used_removed(
+    wheels_dir, wheelhouse_dir
+):
+    wheel_names = [
+        "oll_dependency1-2.0.0-py2.py3-none-any.whl",
+        "oll_dependency1-2.0.1-py2.py3-none-any.whl",
+        "oll_dependency2-2.0.0-py2.py3-none-any.whl",
+    ]
+    wheelhouse = Wheelhouse(str(wheelhouse_dir))
+    for last_used, wheel_name in enumerate(wheel_names):
+        wheelhouse.add(str(wheels_dir / wheel_name))
+        os.utime(str(wheelhouse_dir / f"{wheel_name}.sha256"), (last_used, last_used))
+    wheelhouse.touch([wheel_names[0]])
+    wheelhouse.max_bytes = sum(
+        (wheelhouse_dir / wheel_name).stat().st_size
+        for wheel_name in (wheel_names[0], wheel_names[2])
+    )
+
+    cut = wheelhouse.evict
+    cut()
+
+    expected = {wheel_names[0], wheel_names[2]}
+    actual = {path.name for path in wheelhouse_dir.glob("*.whl")}
+
+    assert actual == expected
+
+
+def test_staged_wheels_release_where_wheels_prefetched_expect_added_to_wheelhouse(
+    wheels_dir, wheelhouse_dir, tmp_path
+):
+    staging_dir = tmp_path / "staging"
+    staging_dir.mkdir()
+    shutil.copy(str(wheels_dir / WHEEL_NAME), str(staging_dir))
+    wheel = WheelDownload(
+        "oll-test-top-level",
+        "2.0.0",
+        f"https://example.com/{WHEEL_NAME}",
+        file_sha256(wheels_dir / WHEEL_NAME),
+    )
+
+    cut = StagedWheels(staging_dir, [wheel]).release
+    cut()
+
+    assert (wheelhouse_dir / WHEEL_NAME).exists()
+    assert not staging_dir.exists()
+
+
+def test_install_wheel_where_installing_from_index_expect_wheelhouse_used_as_find_links(
+    wheelhouse_dir,
+):
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.installer", return_value=""
+    ) as installer_mock, patch(
+        "upgrade.scripts.upgrade_python_package.pip", return_value=""
+    ):
+        cut("oll-test-top-level", "https://example.com/simple/")
+
+    install_args = installer_mock.call_args[0]
+
+    assert "--find-links" in install_args
+    assert install_args[install_args.index("--find-links") + 1] == str(wheelhouse_dir)
+
+
+def test_install_wheel_where_wheels_not_prefetched_expect_no_download_for_wheelhouse(
+    wheelhouse_dir,
+):
+    cut = install_wheel
+    with patch(
+        "upgrade.scripts.upgrade_python_package.prefetch_wheels", return_value=None
+    ), patch("upgrade.scripts.upgrade_python_package.installer", return_value=""), patch(
+        "upgrade.scripts.utils.pip", return_value=""
+    ) as pip_mock:
+        cut("oll-test-top-level", "https://example.com/simple/")
+
+    assert not [call for call in pip_mock.call_args_list if "download" in call[0]]
+    assert list(wheelhouse_dir.glob("*.whl")) == []